@@ -0,0 +1,41 @@
+#! /usr/bin/env python3
+"""
+Compare a fresh connection per request (module-level requests.get, as used
+before ApiClient had a session) against ApiClient's pooled keep-alive session.
+"""
+import argparse
+
+import harness  # noqa: F401  # sets up sys.path
+
+import requests  # noqa: E402
+
+from apiclient import ApiClient, PIJU_SERVER_TIMEOUT  # noqa: E402
+from fakepiju import FakePijuServer  # noqa: E402
+
+
+def parse_args():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--iterations', type=int, default=500)
+    parser.add_argument('--output', help="Write JSON results to OUTPUT")
+    return parser.parse_args()
+
+
+def main():
+    args = parse_args()
+    server = FakePijuServer().start()
+    uri = server.base_uri + '/'
+    apiclient = ApiClient(server.base_uri)
+    try:
+        results = {
+            'unpooled get': harness.time_calls(lambda: requests.get(uri, timeout=PIJU_SERVER_TIMEOUT).json(),
+                                               args.iterations),
+            'pooled get_current_state': harness.time_calls(apiclient.get_current_state, args.iterations),
+        }
+    finally:
+        apiclient.close()
+        server.stop()
+    harness.report('apiclient', results, args.output)
+
+
+if __name__ == '__main__':
+    main()
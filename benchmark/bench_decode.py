@@ -0,0 +1,102 @@
+#! /usr/bin/env python3
+"""
+Compare decoding artwork in full and then scaling it (as MainWindow used to)
+with decoding it straight to the display size, over a corpus of large covers.
+Each method runs in its own process, so that peak RSS can be compared.
+
+Requires PyGObject with GdkPixbuf (and Rsvg, for SVGs in the corpus).
+"""
+import argparse
+import glob
+import json
+import os.path
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+
+import harness
+
+MAX_IMAGE_SIZE = 300
+METHODS = ('full-then-scale', 'at-size')
+
+
+def parse_args():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--corpus', help="Directory of images to decode (default: generate a corpus)")
+    parser.add_argument('--generate', type=int, default=10,
+                        help="Number of covers to generate, if no corpus is given (default %(default)s)")
+    parser.add_argument('--generate-size', type=int, default=3000,
+                        help="Width and height of generated covers (default %(default)s)")
+    parser.add_argument('--repeat', type=int, default=3, help="Decode the corpus this many times")
+    parser.add_argument('--method', choices=METHODS, help=argparse.SUPPRESS)  # used by the child processes
+    parser.add_argument('--output', help="Write JSON results to OUTPUT")
+    return parser.parse_args()
+
+
+def generate_corpus(directory, count, size):
+    import gi  # pylint: disable=import-outside-toplevel
+    gi.require_version('GdkPixbuf', '2.0')
+    from gi.repository import GdkPixbuf, GLib  # pylint: disable=import-outside-toplevel
+    for index in range(count):
+        # a gradient with some per-image noise, so that it doesn't compress to nothing
+        row = bytes((x * 255 // size + index * 17 + (x * 7919 % 13)) % 256 for x in range(size * 3))
+        data = row * size
+        pixbuf = GdkPixbuf.Pixbuf.new_from_bytes(GLib.Bytes.new(data), GdkPixbuf.Colorspace.RGB, False, 8,
+                                                 size, size, size * 3)
+        pixbuf.savev(os.path.join(directory, f'cover{index}.jpg'), 'jpeg', ['quality'], ['90'])
+        pixbuf.savev(os.path.join(directory, f'cover{index}.png'), 'png', [], [])
+
+
+def run_method(corpus, method, repeat):
+    import artworkdecoder  # pylint: disable=import-outside-toplevel
+    files = sorted(glob.glob(os.path.join(corpus, '*')))
+    images = []
+    for path in files:
+        with open(path, 'rb') as handle:
+            images.append((path, handle.read()))
+    samples = []
+    for _ in range(repeat):
+        for path, image in images:
+            t0 = time.perf_counter()
+            if method == 'at-size':
+                if artworkdecoder.is_svg(path, image):
+                    pixbuf = artworkdecoder.pixbuf_from_svg_bytes(image, MAX_IMAGE_SIZE)
+                else:
+                    pixbuf = artworkdecoder.pixbuf_from_image_bytes(image, MAX_IMAGE_SIZE)
+            else:
+                pixbuf = artworkdecoder.pixbuf_from_image_bytes(image)
+            pixbuf = artworkdecoder.scale_to_fit(pixbuf, MAX_IMAGE_SIZE)
+            samples.append((time.perf_counter() - t0) * 1000)
+    maxrss_kb = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss  # kilobytes, on Linux
+    return {
+        'images': len(samples),
+        'mean_ms': sum(samples) / len(samples),
+        'p95_ms': harness.percentile(samples, 95),
+        'peak_rss_mb': maxrss_kb / 1024,
+    }
+
+
+def main():
+    args = parse_args()
+    if args.method:
+        print(json.dumps(run_method(args.corpus, args.method, args.repeat)))
+        return
+
+    with tempfile.TemporaryDirectory() as tmpdir:
+        corpus = args.corpus
+        if not corpus:
+            corpus = tmpdir
+            generate_corpus(corpus, args.generate, args.generate_size)
+        results = {}
+        for method in METHODS:
+            child = subprocess.run([sys.executable, __file__, '--corpus', corpus, '--method', method,
+                                    '--repeat', str(args.repeat)],
+                                   check=True, capture_output=True, text=True)
+            results[method] = json.loads(child.stdout)
+    harness.report('artwork decode', results, args.output)
+
+
+if __name__ == '__main__':
+    main()
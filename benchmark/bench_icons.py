@@ -0,0 +1,68 @@
+#! /usr/bin/env python3
+"""
+Time taken to get the icons the main window shows when it is realized:
+
+* decoding each from its own file, every time (as load_local_image used to)
+* from an IconRegistry, the first time, decoding each file
+* from an IconRegistry, the first time, decoding the atlas
+* from an IconRegistry, once the icons have been decoded (eg when realized again)
+
+Requires PyGObject with GdkPixbuf and GTK 4.
+"""
+import argparse
+import glob
+import os.path
+import shutil
+import tempfile
+
+import harness
+
+ICON_SIZE = 100
+DARK_MODE = True
+
+
+def parse_args():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--iterations', type=int, default=50)
+    parser.add_argument('--output', help="Write JSON results to OUTPUT")
+    return parser.parse_args()
+
+
+def main():
+    args = parse_args()
+    # pylint: disable=import-outside-toplevel
+    from gi.repository import Gdk
+    import mk_icon_atlas
+    from iconatlas import ICON_DIR, icon_leafname
+    from iconregistry import IconRegistry
+    # pylint: enable=import-outside-toplevel
+
+    # as MainWindow: the buttons at one size, plus the scanning indicator and the close button
+    variants = [(icon_name, DARK_MODE, ICON_SIZE) for icon_name in ('pause', 'play', 'backward', 'forward')]
+    variants += [('circle', None, 16), ('window-close', None, 0)]
+    with tempfile.TemporaryDirectory() as files_dir, tempfile.TemporaryDirectory() as atlas_dir:
+        for path in glob.glob(os.path.join(ICON_DIR, '*.png')):
+            if os.path.basename(path) != 'atlas.png':
+                shutil.copy(path, files_dir)
+                shutil.copy(path, atlas_dir)
+        mk_icon_atlas.make_atlas(atlas_dir)
+
+        def decode_files():
+            for variant in variants:
+                Gdk.Texture.new_from_filename(os.path.join(files_dir, icon_leafname(*variant)))
+
+        cached = IconRegistry(files_dir)
+        cached.preload(variants)
+        results = {
+            'files, every time': harness.time_calls(decode_files, args.iterations),
+            'registry, files': harness.time_calls(lambda: IconRegistry(files_dir).preload(variants),
+                                                  args.iterations),
+            'registry, atlas': harness.time_calls(lambda: IconRegistry(atlas_dir).preload(variants),
+                                                  args.iterations),
+            'registry, cached': harness.time_calls(lambda: cached.preload(variants), args.iterations),
+        }
+    harness.report('icons for one realize', results, args.output)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,73 @@
+#! /usr/bin/env python3
+"""
+Measure time-to-artwork after skipping to the next track: the time from the
+status poll that reports the new track until its artwork is available, with
+and without prefetching of the neighbouring tracks' artwork.
+"""
+import argparse
+import threading
+import time
+
+import harness  # noqa: F401  # sets up sys.path
+
+from apiclient import ApiClient  # noqa: E402
+from artworkcache import ArtworkCache  # noqa: E402
+from fakepiju import FakePijuServer, FakePijuState  # noqa: E402
+from prefetcher import ArtworkPrefetcher  # noqa: E402
+
+
+def parse_args():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--tracks', type=int, default=30)
+    parser.add_argument('--artwork-size', type=int, default=200_000)
+    parser.add_argument('--artwork-delay', type=float, default=0.05,
+                        help="Simulated server time to produce artwork, in seconds")
+    parser.add_argument('--output', help="Write JSON results to OUTPUT")
+    return parser.parse_args()
+
+
+def skip_through_album(args, prefetch: bool):
+    state = FakePijuState(artwork_size=args.artwork_size, artwork_delay=args.artwork_delay)
+    state.maximum_track_index = args.tracks
+    server = FakePijuServer(state=state).start()
+    apiclient = ApiClient(server.base_uri)
+    artwork_cache = ArtworkCache(max_bytes=args.artwork_size * (args.tracks + 1))
+    prefetcher = ArtworkPrefetcher(apiclient, artwork_cache) if prefetch else None
+    prefetched = threading.Event()
+    if prefetcher:
+        prefetcher._on_done = lambda job, count: prefetched.set()  # pylint: disable=protected-access
+    samples = []
+    try:
+        for _ in range(args.tracks - 1):
+            apiclient.next()
+            status = apiclient.get_current_state()
+            t0 = time.perf_counter()
+            artwork_cache.update(apiclient, status.current_artwork)
+            samples.append((time.perf_counter() - t0) * 1000)
+            if prefetcher:
+                prefetched.clear()
+                prefetcher.on_status(status)
+                # wait for the prefetch to finish, standing in for the user listening to the track
+                prefetched.wait(5)
+    finally:
+        apiclient.close()
+        server.stop()
+    return {
+        'skips': len(samples),
+        'mean_ms': sum(samples) / len(samples),
+        'p95_ms': harness.percentile(samples, 95),
+        'max_ms': max(samples),
+    }
+
+
+def main():
+    args = parse_args()
+    results = {
+        'no prefetch': skip_through_album(args, prefetch=False),
+        'prefetch': skip_through_album(args, prefetch=True),
+    }
+    harness.report('time to artwork after skip', results, args.output)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,80 @@
+#! /usr/bin/env python3
+"""
+CPU used by the 'onoff' screen blank profile, per hour of playback, with each
+screen saver backend. While playing, that profile disables and resets the
+screen saver every 5 seconds; with the xset backend, that is two processes,
+or one when ScreenBlankMgr's executor coalesces them.
+
+Requires an X display (and xset, for the xset backend).
+"""
+import argparse
+import os
+import time
+
+import harness
+from screenblankbackend import X11Backend, XsetBackend, coalesce
+from screenblankmgr import ScreenBlankProfileOnWhenPlaying
+
+TICK_INTERVAL = 5  # seconds of playback between calls to on_playing_tick
+TICKS_PER_HOUR = 3600 // TICK_INTERVAL
+
+
+def parse_args():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--ticks', type=int, default=200, help="Number of ticks to time (default %(default)s)")
+    parser.add_argument('--output', help="Write JSON results to OUTPUT")
+    return parser.parse_args()
+
+
+def cpu_seconds():
+    # including the xset processes, once they have been waited for
+    times = os.times()
+    return times.user + times.system + times.children_user + times.children_system
+
+
+class Recorder:
+    """
+    Collects the actions asked for by a profile, as ScreenBlankExecutor does
+    """
+    def __init__(self):
+        self.actions = []
+
+    def __getattr__(self, name):
+        return lambda *args: self.actions.append((name, args))
+
+
+def run_backend(backend, ticks, coalesced=False):
+    profile = ScreenBlankProfileOnWhenPlaying()
+    profile.backend = Recorder() if coalesced else backend
+    cpu_start = cpu_seconds()
+    wall_start = time.perf_counter()
+    for _ in range(ticks):
+        profile.on_playing_tick()
+        if coalesced:
+            backend.perform(coalesce(profile.backend.actions))
+            profile.backend.actions = []
+    cpu = cpu_seconds() - cpu_start
+    wall = time.perf_counter() - wall_start
+    return {
+        'ticks': ticks,
+        'cpu_ms_per_tick': cpu / ticks * 1000,
+        'wall_ms_per_tick': wall / ticks * 1000,
+        'cpu_s_per_hour': cpu / ticks * TICKS_PER_HOUR,
+    }
+
+
+def main():
+    args = parse_args()
+    results = {}
+    if x11_backend := X11Backend.open():
+        results['x11'] = run_backend(x11_backend, args.ticks)
+        x11_backend.close()
+    else:
+        print("X11 backend not available: is DISPLAY set?")
+    results['xset'] = run_backend(XsetBackend(), args.ticks)
+    results['xset (coalesced)'] = run_backend(XsetBackend(), args.ticks, coalesced=True)
+    harness.report('screen blank CPU per hour of playback', results, args.output)
+
+
+if __name__ == '__main__':
+    main()
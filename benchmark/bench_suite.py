@@ -0,0 +1,196 @@
+#! /usr/bin/env python3
+"""
+Measure the cost of each stage of getting the server's state onto the
+screen, against a local stand-in server with configurable latency, status
+payload size and artwork size:
+
+* poll round trip (ApiClient.get_current_state)
+* JSON decode of the status
+* artwork fetch
+* artwork decode (requires PyGObject)
+* state update: ServerStateFollower handling a polled status, as the
+  application does (requires PyGObject)
+* MainWindow.show_now_playing, including the main loop work it causes
+  (requires PyGObject and a display)
+
+Results are saved as JSON with --output, along with the commit measured, so
+that runs can be compared with --compare.
+"""
+import argparse
+import json
+import sys
+
+import harness  # noqa: F401  # sets up sys.path
+
+import requests  # noqa: E402
+
+from apiclient import ApiClient, PIJU_SERVER_TIMEOUT  # noqa: E402
+from fakepiju import FakePijuServer, FakePijuState  # noqa: E402
+from nowplaying import NowPlaying  # noqa: E402
+
+DISPLAY_SIZE = 300
+
+
+def parse_args():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--iterations', type=int, default=200)
+    parser.add_argument('--latency', type=float, default=0, metavar='MS',
+                        help="Latency added to every response by the server (default %(default)s)")
+    parser.add_argument('--payload-size', type=int, default=0, metavar='BYTES',
+                        help="Padding added to the track in each status (default %(default)s)")
+    parser.add_argument('--artwork-size', type=int, default=100_000, metavar='BYTES',
+                        help="Size of the artwork served (default %(default)s)")
+    parser.add_argument('--artwork-dimensions', type=int, default=1000, metavar='PIXELS',
+                        help="Width and height of the artwork to decode (default %(default)s)")
+    parser.add_argument('--output', help="Write JSON results to OUTPUT")
+    parser.add_argument('--compare', metavar='BASELINE',
+                        help="Compare with the JSON results in BASELINE, exiting with status 1 on a regression")
+    parser.add_argument('--threshold', type=float, default=10, metavar='PERCENT',
+                        help="Slow-down in the mean to count as a regression (default %(default)s)")
+    return parser.parse_args()
+
+
+def skipped(reason):
+    return {'skipped': reason}
+
+
+def import_gtk():
+    """
+    Returns the gi.repository module, or raises ImportError
+    """
+    try:
+        import gi  # pylint: disable=import-outside-toplevel
+        gi.require_version('Gtk', '4.0')
+        gi.require_version('GdkPixbuf', '2.0')
+    except ValueError as exc:
+        raise ImportError(str(exc)) from exc
+    from gi import repository  # pylint: disable=import-outside-toplevel
+    return repository
+
+
+def mk_jpeg(repository, size):
+    GdkPixbuf, GLib = repository.GdkPixbuf, repository.GLib  # pylint: disable=invalid-name
+    row = bytes((x * 255 // size + (x * 7919 % 13)) % 256 for x in range(size * 3))
+    pixbuf = GdkPixbuf.Pixbuf.new_from_bytes(GLib.Bytes.new(row * size), GdkPixbuf.Colorspace.RGB, False, 8,
+                                             size, size, size * 3)
+    _, data = pixbuf.save_to_bufferv('jpeg', ['quality'], ['90'])
+    return bytes(data)
+
+
+def measure_artwork_decode(args):
+    try:
+        repository = import_gtk()
+        import artworkdecoder  # pylint: disable=import-outside-toplevel
+    except ImportError as exc:
+        return skipped(f"PyGObject not available: {exc}")
+    image = mk_jpeg(repository, args.artwork_dimensions)
+    return harness.time_calls(lambda: artworkdecoder.pixbuf_from_image_bytes(image, DISPLAY_SIZE),
+                              max(1, args.iterations // 10))
+
+
+def measure_state_update(args, apiclient):
+    """
+    A poll, as ServerStateFollower.poll does it: get_state_async, then
+    handle_status, which makes the now_playing snapshot and fetches any new
+    artwork. Nothing is shown: the window updates are left on the main loop.
+    """
+    try:
+        import_gtk()
+        import application  # pylint: disable=import-outside-toplevel
+        import screenblankmgr  # pylint: disable=import-outside-toplevel
+        from engine import Engine  # pylint: disable=import-outside-toplevel
+        from pollscheduler import PollScheduler  # pylint: disable=import-outside-toplevel
+        from prefetcher import ArtworkPrefetcher  # pylint: disable=import-outside-toplevel
+        from serverstate import get_state_async  # pylint: disable=import-outside-toplevel
+        from updatefilter import UpdateFilter  # pylint: disable=import-outside-toplevel
+    except ImportError as exc:
+        return skipped(f"PyGObject not available: {exc}")
+    engine = Engine()
+    engine.start()
+    prefetcher = ArtworkPrefetcher(ApiClient(apiclient.base_uri, apiclient.session), application.artwork_cache)
+    screenmgr = screenblankmgr.ScreenBlankMgr(screenblankmgr.profiles['none'])
+    follower = application.ServerStateFollower(engine, apiclient, None, PollScheduler(), UpdateFilter(), prefetcher,
+                                               screenmgr, push_updates=False)
+
+    async def update():
+        status, connection_error = await get_state_async(apiclient)
+        follower.handle_status(status, connection_error)
+        if follower.artwork_task:
+            await follower.artwork_task
+
+    result = harness.time_calls(lambda: engine.run(update()).result(), args.iterations)
+    engine.stop()
+    return result
+
+
+def measure_show_now_playing(args, apiclient):
+    try:
+        repository = import_gtk()
+        from artworkcache import ArtworkCache  # pylint: disable=import-outside-toplevel
+        from commandqueue import CommandDispatcher  # pylint: disable=import-outside-toplevel
+        from engine import Engine  # pylint: disable=import-outside-toplevel
+        from mainwindow import MainWindow  # pylint: disable=import-outside-toplevel
+    except ImportError as exc:
+        return skipped(f"PyGObject not available: {exc}")
+    if not repository.Gtk.init_check():
+        return skipped("no display")
+    engine = Engine()
+    engine.start()
+    window = MainWindow(None, apiclient, CommandDispatcher(engine), ArtworkCache(), dark_mode=False,
+                        full_screen=False, fixed_layout=True, show_close_button=False, hide_mouse_pointer=False)
+    window.present()
+    context = repository.GLib.MainContext.default()
+
+    def run_main_loop():
+        while context.pending():
+            context.iteration(False)
+
+    run_main_loop()
+    snapshots = []
+    for index in (1, 2):
+        snapshots.append(NowPlaying(is_track=True, artist_name='Fake Artist', track_name=f'Track {index}',
+                                    track_number=index, album_tracks=10, current_state='playing'))
+    iteration = [0]
+
+    def update():
+        iteration[0] += 1
+        window.show_now_playing(False, snapshots[iteration[0] % 2])
+        run_main_loop()
+
+    result = harness.time_calls(update, args.iterations)
+    window.destroy()
+    engine.stop()
+    return result
+
+
+def main():
+    args = parse_args()
+    state = FakePijuState(artwork_size=args.artwork_size, latency=args.latency / 1000,
+                          payload_size=args.payload_size)
+    server = FakePijuServer(state=state).start()
+    apiclient = ApiClient(server.base_uri)
+    try:
+        response = requests.get(server.base_uri + '/', timeout=PIJU_SERVER_TIMEOUT)
+        body = response.content
+        results = {
+            'poll round trip': harness.time_calls(apiclient.get_current_state, args.iterations),
+            'json decode': harness.time_calls(
+                lambda: apiclient._parse_current_state(json.loads(body), body),  # pylint: disable=protected-access
+                args.iterations),
+            'artwork fetch': harness.time_calls(lambda: apiclient.get_artwork('/artwork/1'), args.iterations),
+            'artwork decode': measure_artwork_decode(args),
+            'state update': measure_state_update(args, apiclient),
+            'show_now_playing': measure_show_now_playing(args, apiclient),
+        }
+    finally:
+        apiclient.close()
+        server.stop()
+    parameters = {key: value for key, value in vars(args).items() if key not in ('output', 'compare')}
+    results['json decode']['status_bytes'] = len(body)
+    harness.report('suite', results, args.output, parameters)
+    if args.compare and harness.compare(results, args.compare, threshold=args.threshold / 100):
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,97 @@
+"""
+Shared helpers for the benchmark scripts in this directory.
+
+Importing this module makes src/ and tools/ importable, in the same way that
+pytest.ini does for the unit tests.
+"""
+import json
+import os.path
+import platform
+import statistics
+import subprocess
+import sys
+import time
+
+ROOT_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), os.path.pardir)
+for subdir in ('src', 'tools'):
+    sys.path.insert(0, os.path.join(ROOT_DIR, subdir))
+
+
+def percentile(samples, pct):
+    ordered = sorted(samples)
+    index = min(len(ordered) - 1, max(0, round(pct / 100 * len(ordered)) - 1))
+    return ordered[index]
+
+
+def time_calls(fn, iterations):
+    """
+    Call fn() iterations times, returning a summary dict of the latencies (in ms)
+    and the overall throughput
+    """
+    samples = []
+    start = time.perf_counter()
+    for _ in range(iterations):
+        t0 = time.perf_counter()
+        fn()
+        samples.append((time.perf_counter() - t0) * 1000)
+    elapsed = time.perf_counter() - start
+    return {
+        'iterations': iterations,
+        'per_second': iterations / elapsed,
+        'mean_ms': statistics.mean(samples),
+        'p50_ms': percentile(samples, 50),
+        'p95_ms': percentile(samples, 95),
+    }
+
+
+def environment():
+    """
+    Returns a dict describing what was measured, to be saved with the results
+    """
+    try:
+        commit = subprocess.run(['git', 'rev-parse', 'HEAD'], cwd=ROOT_DIR, capture_output=True, text=True,
+                                check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        commit = None
+    return {
+        'commit': commit,
+        'python': platform.python_version(),
+        'machine': platform.machine(),
+        'time': time.strftime('%Y-%m-%dT%H:%M:%S%z'),
+    }
+
+
+def report(name, results, output=None, parameters=None):
+    """
+    Print a human-readable summary, and optionally write the results as JSON
+    """
+    print(name)
+    for label, result in results.items():
+        values = ', '.join(f"{key}={value:.3f}" if isinstance(value, float) else f"{key}={value}"
+                           for key, value in result.items())
+        print(f"  {label:24} {values}")
+    if output:
+        with open(output, 'w', encoding='utf-8') as handle:
+            json.dump({'benchmark': name, 'environment': environment(), 'parameters': parameters or {},
+                       'results': results}, handle, indent=2)
+
+
+def compare(results, baseline_path, key='mean_ms', threshold=0.1):
+    """
+    Print how results compare with those saved in baseline_path, returning
+    the labels of those that are more than threshold (a fraction) worse
+    """
+    with open(baseline_path, encoding='utf-8') as handle:
+        baseline = json.load(handle)['results']
+    regressions = []
+    print(f"Compared with {baseline_path}:")
+    for label, result in results.items():
+        if key not in result or key not in baseline.get(label, {}):
+            continue
+        before, after = baseline[label][key], result[key]
+        change = (after - before) / before if before else 0
+        regressed = change > threshold
+        if regressed:
+            regressions.append(label)
+        print(f"  {label:24} {key} {before:.3f} -> {after:.3f} ({change:+.1%}){' REGRESSION' if regressed else ''}")
+    return regressions
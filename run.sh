@@ -7,4 +7,6 @@ if [ "$host" ]; then
 fi
 
 amixer sset Headphone 100%
+# Pack the icons into a single image, if that hasn't been done since they last changed
+python3 $(dirname $0)/tools/mk_icon_atlas.py --if-needed || echo "Unable to make the icon atlas: icons will be loaded individually"
 python3 $(dirname $0)/src/main.py --logfile=/var/log/piju-touchscreen/piju-touchscreen.log --hide-mouse-pointer --no-close-button --screenblanker-profile=onoff --dark-mode $host
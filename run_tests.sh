@@ -2,5 +2,20 @@
 
 pytest --cov=apiclient \
        --cov=artworkcache \
+       --cov=backgroundworker \
+       --cov=commandqueue \
+       --cov=diskcache \
+       --cov=engine \
+       --cov=iconatlas \
+       --cov=loopwatchdog \
+       --cov=metrics \
+       --cov=metricsserver \
+       --cov=nowplaying \
+       --cov=pollscheduler \
+       --cov=prefetcher \
+       --cov=screenblankbackend \
        --cov=screenblankmgr \
+       --cov=serverstate \
+       --cov=startupprofile \
+       --cov=updatefilter --cov=updatemailbox \
        --cov-report=xml
@@ -1,15 +1,24 @@
 from collections import namedtuple
+import json
 import logging
+import time
 
 import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+from metrics import metrics
 
 CurrentStatus = namedtuple('CurrentStatus', 'status, current_track, current_stream, current_artwork, '
                                             'volume, scanning, '
-                                            'current_track_index, maximum_track_index')
+                                            'current_track_index, maximum_track_index, '
+                                            'current_tracklist',
+                           defaults=(None,))
 # status: str, one of "stopped", "playing", "paused", or None for error
 # current_track: dict  (never None)
 # volume: int  (or None if status is error)
 # scanning: bool (or None if status is error)
+# current_tracklist: str, the uri of the album or playlist being played (or None if not known)
 
 ArtworkInfo = namedtuple('ArtworkInfo', 'width height imageuri')
 # width: int (or None if there's no artwork)
@@ -22,20 +31,59 @@ CURRENT_STATUS_ERROR = CurrentStatus(status=None, current_track={}, current_stre
 
 PIJU_SERVER_TIMEOUT = 1
 
+# Artwork bigger than this is not downloaded (or, if the server doesn't say how big it is, abandoned)
+MAX_ARTWORK_BYTES = 10 * 1024 * 1024
+# Artwork is read in pieces of this size
+ARTWORK_CHUNK_SIZE = 64 * 1024
+
+# Server-Sent Events endpoint that pushes the same body as GET / whenever it changes
+STATE_STREAM_PATH = '/events'
+# The server is expected to send a keep-alive comment more often than this
+STATE_STREAM_READ_TIMEOUT = 30
+# Responses to the state stream request that mean the server will never support it. Anything else
+# that isn't a stream (eg a 503 while the server restarts) is treated as a failure to connect.
+STATE_STREAM_UNSUPPORTED_STATUSES = (404, 405, 415)
+
+# The state stream (or status poll), artwork fetches, commands and prefetching
+# share one pool, and can all be in progress at once
+CONNECTION_POOL_SIZE = 6
+
+
+def make_session(pool_size: int = CONNECTION_POOL_SIZE) -> requests.Session:
+    """
+    Create a keep-alive session with a bounded, thread-safe connection pool.
+    urllib3 checks whether a pooled connection has been dropped by the server
+    before reusing it; failures to (re)connect are retried once. Requests that
+    reached the server are never retried, so a button press cannot be sent twice.
+    """
+    retries = Retry(total=1, connect=1, read=0, status=0, redirect=0)
+    adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_size, pool_block=True, max_retries=retries)
+    session = requests.Session()
+    session.mount('http://', adapter)
+    session.mount('https://', adapter)
+    return session
+
 
 class ApiClient:
-    def __init__(self, base_uri):
+    def __init__(self, base_uri, session: requests.Session = None, max_artwork_bytes: int = MAX_ARTWORK_BYTES):
         if base_uri.endswith('/'):
             base_uri = base_uri[:-1]
         self.base_uri = base_uri
         self.connection_error = False
+        self.session = session if session else make_session()
+        self.max_artwork_bytes = max_artwork_bytes
+
+    def close(self):
+        self.session.close()
 
     def get_current_state(self) -> CurrentStatus:
         try:
-            response = requests.get(self.base_uri + '/', timeout=PIJU_SERVER_TIMEOUT)
+            with metrics.time('status request'):
+                response = self.session.get(self.base_uri + '/', timeout=PIJU_SERVER_TIMEOUT)
         except requests.exceptions.RequestException:
             logging.error(f"Unable to connect to {self.base_uri}")
             self.connection_error = True
+            metrics.increment('connection error')
             return CURRENT_STATUS_ERROR
 
         self.connection_error = False
@@ -45,14 +93,21 @@ class ApiClient:
                           response.text)
             return CURRENT_STATUS_ERROR
 
-        response_body = response.json()
+        with metrics.time('status decode'):
+            try:
+                response_body = response.json()
+            except ValueError:
+                response_body = None
+            return self._parse_current_state(response_body, response.text)
+
+    def _parse_current_state(self, response_body, response_text) -> CurrentStatus:
         if not response_body:
-            logging.error("Unable to decode json response body: %s", response.text)
+            logging.error("Unable to decode json response body: %s", response_text)
             return CURRENT_STATUS_ERROR
 
         status = response_body.get('PlayerStatus')
         if not status:
-            logging.error("Response did not include status: %s", response.text)
+            logging.error("Response did not include status: %s", response_text)
             return CURRENT_STATUS_ERROR
 
         # TODO: Error handling if status is not a string
@@ -72,9 +127,79 @@ class ApiClient:
         current_track_index = response_body.get('CurrentTrackIndex', None)
         maximum_track_index = response_body.get('MaximumTrackIndex', None)
 
+        # not all servers report the tracklist: fall back to the album
+        current_tracklist = response_body.get('CurrentTracklistUri', current_track.get('album'))
+
         return CurrentStatus(status, current_track, current_stream, current_artwork,
                              current_volume, scanning,
-                             current_track_index, maximum_track_index)
+                             current_track_index, maximum_track_index,
+                             current_tracklist)
+
+    def open_state_stream(self):
+        """
+        Subscribe to state changes pushed by the server.
+        Returns None if the server does not support streaming; otherwise, returns an
+        iterator of CurrentStatus, which finishes when the connection is lost.
+        A failure to connect, or any other response that isn't a stream, results
+        in a single CURRENT_STATUS_ERROR.
+        """
+        try:
+            response = self.session.get(self.base_uri + STATE_STREAM_PATH,
+                                        headers={'Accept': 'text/event-stream'},
+                                        stream=True,
+                                        timeout=(PIJU_SERVER_TIMEOUT, STATE_STREAM_READ_TIMEOUT))
+        except requests.exceptions.RequestException:
+            logging.error(f"Unable to connect to {self.base_uri}")
+            self.connection_error = True
+            metrics.increment('connection error')
+            return iter([CURRENT_STATUS_ERROR])
+
+        content_type = response.headers.get('Content-Type', '')
+        if response.status_code in STATE_STREAM_UNSUPPORTED_STATUSES:
+            logging.debug("Server does not support state streaming: status=%u", response.status_code)
+            response.close()
+            self.connection_error = False
+            return None
+        if not response.ok or not content_type.startswith('text/event-stream'):
+            logging.error("Unable to open state stream: status=%u, content type=%s",
+                          response.status_code, content_type)
+            response.close()
+            self.connection_error = True
+            metrics.increment('connection error')
+            return iter([CURRENT_STATUS_ERROR])
+
+        self.connection_error = False
+
+        return self._iter_state_stream(response)
+
+    def _iter_state_stream(self, response):
+        data_lines = []
+        try:
+            # chunk_size=1: events must be delivered as soon as they arrive, not when a buffer fills
+            for line in response.iter_lines(chunk_size=1, decode_unicode=True):
+                if line:
+                    if line.startswith('data:'):
+                        data_lines.append(line[5:].lstrip())
+                    # ignore comments (keep-alives), event names and ids
+                    continue
+                # a blank line terminates the event
+                if not data_lines:
+                    continue
+                text = '\n'.join(data_lines)
+                data_lines = []
+                with metrics.time('status decode'):
+                    try:
+                        response_body = json.loads(text)
+                    except ValueError:
+                        response_body = None
+                    status = self._parse_current_state(response_body, text)
+                yield status
+        except requests.exceptions.RequestException as exc:
+            logging.error(f"Lost connection to state stream: {exc}")
+            self.connection_error = True
+            metrics.increment('connection error')
+        finally:
+            response.close()
 
     def get_artwork_info(self, info_uri_path):
         if info_uri_path is None:
@@ -83,7 +208,7 @@ class ApiClient:
         assert info_uri_path.startswith('/')
         uri = self.base_uri + info_uri_path
         try:
-            response = requests.get(uri, timeout=PIJU_SERVER_TIMEOUT)
+            response = self.session.get(uri, timeout=PIJU_SERVER_TIMEOUT)
         except requests.exceptions.RequestException:
             logging.error("Unable to connect to piju")
             self.connection_error = True
@@ -96,7 +221,10 @@ class ApiClient:
                           response.text)
             return ArtworkInfo(None, None, None)
 
-        response_body = response.json()
+        try:
+            response_body = response.json()
+        except ValueError:
+            response_body = None
         if not response_body:
             logging.error("Unable to decode json response body: %s", response.text)
             return ArtworkInfo(None, None, None)
@@ -105,7 +233,44 @@ class ApiClient:
                            response_body.get('height'),
                            response_body.get('image'))
 
-    def get_artwork(self, artwork_uri_path):
+    def get_json(self, uri_path):
+        """
+        Returns the decoded body of a GET of the given path (eg an album or track), or None on error.
+        As for artwork, the path may be an absolute URI.
+        """
+        if not uri_path or not isinstance(uri_path, str):
+            logging.error("Unable to fetch %r", uri_path)
+            return None
+        uri = (self.base_uri + uri_path) if uri_path.startswith('/') else uri_path
+        try:
+            response = self.session.get(uri, timeout=PIJU_SERVER_TIMEOUT)
+        except requests.exceptions.RequestException:
+            logging.error("Unable to fetch %s", uri)
+            return None
+
+        if not response.ok:
+            logging.error('Failed to get %s from piju: status=%u, error=%s',
+                          uri,
+                          response.status_code,
+                          response.text)
+            return None
+
+        try:
+            return response.json()
+        except ValueError:
+            logging.error("Unable to decode json response body: %s", response.text)
+            return None
+
+    def get_artwork(self, artwork_uri_path, size=None, on_chunk=None):
+        """
+        size, if given, is the (width, height) wanted, for servers that can provide a scaled version
+        The artwork is read a chunk at a time, and abandoned as soon as it is larger
+        than max_artwork_bytes. on_chunk(chunk), if given, is called with each chunk
+        as it arrives (eg to decode the artwork while it downloads), and can
+        return False to abandon the download.
+        Returns the artwork as a bytearray, which is the only copy of it that is
+        kept, or None.
+        """
         if artwork_uri_path is None:
             return None
 
@@ -113,11 +278,14 @@ class ApiClient:
             uri = self.base_uri + artwork_uri_path
         else:
             uri = artwork_uri_path
+        params = {'width': size[0], 'height': size[1]} if size else None
+        start = time.perf_counter()
         try:
-            response = requests.get(uri, timeout=PIJU_SERVER_TIMEOUT)
+            response = self.session.get(uri, params=params, stream=True, timeout=PIJU_SERVER_TIMEOUT)
         except requests.exceptions.RequestException:
             logging.error("Unable to fetch artwork")
             self.connection_error = True
+            metrics.increment('connection error')
             return None
 
         self.connection_error = False
@@ -128,12 +296,37 @@ class ApiClient:
                           response.text)
             return None
 
-        return response.content
+        content_length = response.headers.get('Content-Length')
+        if content_length and content_length.isdigit() and int(content_length) > self.max_artwork_bytes:
+            logging.error("Not fetching artwork %s: %s bytes is too large", uri, content_length)
+            response.close()
+            return None
+
+        content = bytearray()
+        try:
+            for chunk in response.iter_content(ARTWORK_CHUNK_SIZE):
+                if len(content) + len(chunk) > self.max_artwork_bytes:
+                    logging.error("Abandoned artwork %s: more than %u bytes", uri, self.max_artwork_bytes)
+                    metrics.increment('artwork too large')
+                    return None
+                content += chunk
+                if on_chunk and on_chunk(chunk) is False:
+                    logging.debug("Abandoned artwork %s", uri)
+                    return None
+        except requests.exceptions.RequestException as exc:
+            logging.error(f"Lost connection fetching artwork {uri}: {exc}")
+            self.connection_error = True
+            metrics.increment('connection error')
+            return None
+        finally:
+            response.close()
+        metrics.observe('artwork download', time.perf_counter() - start)
+        return content
 
     def _simple_operation(self, uri_suffix, operation_desc):
         uri = self.base_uri + uri_suffix
         try:
-            response = requests.post(uri, timeout=PIJU_SERVER_TIMEOUT)
+            response = self.session.post(uri, timeout=PIJU_SERVER_TIMEOUT)
         except requests.exceptions.RequestException as exc:
             logging.error(f"Failed to {operation_desc}: Exception {exc}")
             return False
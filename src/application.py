@@ -0,0 +1,336 @@
+import asyncio
+import concurrent.futures
+import logging
+import threading
+import time
+
+import gi
+gi.require_version('Gtk', '4.0')
+# pylint: disable=wrong-import-position,wrong-import-order
+# (need to call require_version before we can import the other gi libraries, and we want
+# third-party libraries before local libraries)
+from gi.repository import Gtk  # noqa: E402 # need to call require_version before we can call this
+
+gi.require_version('GLib', '2.0')
+from gi.repository import GLib  # noqa: E402 # need to call require_version before we can call this
+
+from apiclient import ApiClient, CurrentStatus  # noqa: E402  # local imports after libraries
+from artworkcache import ArtworkCache  # noqa: E402  # local imports after libraries
+from commandqueue import CommandDispatcher  # noqa: E402  # local imports after libraries
+from diskcache import DiskArtworkCache  # noqa: E402  # local imports after libraries
+from engine import Engine, run_blocking  # noqa: E402  # local imports after libraries
+from iconatlas import ICON_VARIANTS  # noqa: E402  # local imports after libraries
+from iconregistry import icons  # noqa: E402  # local imports after libraries
+from mainwindow import MainWindow, MAX_IMAGE_SIZE  # noqa: E402  # local imports after libraries
+from mainwindow import expected_button_icon_size  # noqa: E402  # local imports after libraries
+from metrics import metrics  # noqa: E402  # local imports after libraries
+from nowplaying import NowPlaying  # noqa: E402  # local imports after libraries
+from pollscheduler import PollScheduler  # noqa: E402  # local imports after libraries
+from prefetcher import ArtworkPrefetcher  # noqa: E402  # local imports after libraries
+import screenblankbackend  # noqa: E402  # local imports after libraries
+import screenblankmgr  # noqa: E402  # local imports after libraries
+from serverstate import follow_state_stream, get_state_async  # noqa: E402  # local imports after libraries
+from updatefilter import UpdateFilter  # noqa: E402  # local imports after libraries
+from updatemailbox import UpdateMailbox  # noqa: E402  # local imports after libraries
+from loopwatchdog import MainLoopWatchdog  # noqa: E402  # local imports after libraries
+# pylint: enable=wrong-import-position,wrong-import-order
+
+artwork_cache = ArtworkCache(target_size=MAX_IMAGE_SIZE)
+
+# Longest to wait for artwork, beyond the ApiClient's own timeouts
+ARTWORK_TIMEOUT = 10
+
+
+def make_now_playing(status: CurrentStatus) -> NowPlaying:
+    """
+    A snapshot of the status, and whatever artwork is current in the artwork cache.
+    The artwork bytes are shared with the cache, not copied.
+    """
+    current_track = status.current_track
+    image_uri, image = artwork_cache.get_current()
+    return NowPlaying(is_track=bool(current_track),
+                      artist_name=current_track.get('artist'),
+                      track_name=current_track.get('title'),
+                      track_number=status.current_track_index,
+                      album_tracks=status.maximum_track_index,
+                      stream_name=status.current_stream,
+                      current_state=status.status,
+                      current_volume=status.volume,
+                      image_uri=image_uri,
+                      image=image,
+                      scanning_active=status.scanning)
+
+
+class ServerStateFollower:
+    """
+    Keeps now_playing up to date with the server, and passes each change to
+    the main window. Statuses and artwork are fetched concurrently, by
+    coroutines on the engine; the update filter is only touched on the
+    engine's thread. Each change makes a new, immutable, now_playing snapshot,
+    which is passed to the main thread as it is.
+    While dormant (the screen is blanked), nothing is shown or fetched apart
+    from the status, which is polled slowly, until playing starts or the
+    screen is woken.
+    """
+    def __init__(self, engine: Engine, apiclient: ApiClient, window: MainWindow, scheduler: PollScheduler,
+                 update_filter: UpdateFilter, prefetcher: ArtworkPrefetcher,
+                 screenmgr: screenblankmgr.ScreenBlankMgr, push_updates: bool, mark_startup=None):
+        """
+        mark_startup(step), if given, is called when the first state is received
+        and when the first track is shown: see StartupProfile.mark
+        """
+        self.engine = engine
+        self.apiclient = apiclient
+        # Artwork is fetched at the same time as statuses, so needs its own connection_error
+        self.artwork_client = ApiClient(apiclient.base_uri, apiclient.session, apiclient.max_artwork_bytes)
+        self.window = window
+        self.scheduler = scheduler
+        self.update_filter = update_filter
+        self.prefetcher = prefetcher
+        self.screenmgr = screenmgr
+        self.screen_blank_state = ()  # the last state passed to screenmgr: () for none yet, as None is a state
+        self.push_updates = push_updates
+        self.now_playing = NowPlaying()
+        # If the main loop is held up, only the latest snapshot is shown when it catches up
+        self.window_updates = UpdateMailbox(GLib.idle_add, self.show_on_window)
+        self.mark_startup = mark_startup if mark_startup else (lambda step: None)
+        self.status = None
+        self.connection_error = None
+        self.artwork_uri = None
+        self.artwork_task = None
+        self.polling = False
+        self.dormant = False
+        self.awake_since = (time.monotonic(), time.process_time())
+        self.awake_cpu_rate = 0
+        self.dormant_since = None
+        self.dormant_polls = 0
+        self.dormant_updates = 0
+
+    def start(self, first_state: concurrent.futures.Future = None):
+        """
+        first_state, if given, is get_state_async() already running on the engine,
+        having been started before the window was created
+        """
+        if self.push_updates:
+            if first_state:
+                self.engine.run(self.handle_first_state(first_state))
+            # The stream is read with blocking calls, so has a thread of its own
+            threading.Thread(target=self.follow_state_stream, name='state-stream', daemon=True).start()
+        else:
+            self.engine.run(self.poll(first_state))
+
+    async def handle_first_state(self, first_state: concurrent.futures.Future):
+        status, connection_error = await asyncio.wrap_future(first_state)
+        if self.status is None:
+            # the stream hasn't got there first
+            self.handle_status(status, connection_error)
+
+    def follow_state_stream(self):
+        follow_state_stream(self.apiclient,
+                            lambda status, connection_error: self.engine.call_soon(self.handle_status,
+                                                                                   status, connection_error),
+                            self.scheduler)
+        self.engine.run(self.poll())
+
+    async def poll(self, first_state: concurrent.futures.Future = None):
+        self.polling = True
+        while True:
+            if self.dormant:
+                self.dormant_polls += 1
+            try:
+                if first_state:
+                    status, connection_error = await asyncio.wrap_future(first_state)
+                    first_state = None
+                else:
+                    status, connection_error = await get_state_async(self.apiclient)
+                self.handle_status(status, connection_error)
+                self.scheduler.observe(status, connection_error)
+            except Exception:  # pylint: disable=broad-except  # polling must carry on whatever goes wrong
+                logging.exception("Failed to get the current state")
+            await self.scheduler.wait_async()
+
+    def handle_status(self, status: CurrentStatus, connection_error: bool):
+        self.mark_startup('first state received')
+        self.status = status
+        self.connection_error = connection_error
+        if status.status != self.screen_blank_state:
+            # ScreenBlankMgr keeps its own time, so only needs to know about changes
+            self.screen_blank_state = status.status
+            GLib.idle_add(self.screenmgr.set_state, self.screen_blank_state)
+        if self.dormant:
+            if status.status == 'playing':
+                # no need to wait for ScreenBlankMgr: this shows the status
+                self.set_dormant(False)
+            else:
+                self.dormant_updates += 1
+            return
+        if status.current_artwork != self.artwork_uri:
+            self.artwork_uri = status.current_artwork
+            if self.artwork_task:
+                self.artwork_task.cancel()
+                self.artwork_task = None
+            image_uri = status.current_artwork
+            image = artwork_cache.get(image_uri) if (image_uri is not None and image_uri in artwork_cache) else None
+            if image_uri is None or image is not None:
+                self.set_artwork(image_uri, image)
+            else:
+                # The rest of the status is shown while the artwork is fetched
+                self.artwork_task = asyncio.create_task(self.fetch_artwork(status.current_artwork))
+        self.show_now_playing()
+        if self.artwork_task is None:
+            # otherwise, not until the current artwork has been fetched, so as not to hold it up
+            self.prefetcher.on_status(status)
+
+    async def fetch_artwork(self, image_uri: str):
+        try:
+            image = await run_blocking(artwork_cache.update_inner, self.artwork_client, image_uri,
+                                       timeout=ARTWORK_TIMEOUT)
+        except asyncio.TimeoutError:
+            logging.error("Timed out fetching artwork %s", image_uri)
+            image = None
+            failed = True
+        except Exception:  # pylint: disable=broad-except  # as for a timeout, try again with the next status
+            logging.exception("Failed to fetch artwork %s", image_uri)
+            image = None
+            failed = True
+        else:
+            failed = False
+        self.artwork_task = None
+        if image is None and (failed or self.artwork_client.connection_error):
+            # Later statuses carry the same artwork URI: forget it, so the next one tries again
+            self.artwork_uri = None
+        self.set_artwork(image_uri, image)
+        self.show_now_playing()
+        self.prefetcher.on_status(self.status)
+
+    def set_artwork(self, image_uri: str, image: bytes):
+        artwork_cache.set_current(image_uri, image)
+
+    def show_now_playing(self):
+        self.now_playing = make_now_playing(self.status)
+        logging.debug(self.now_playing)
+        if snapshot := self.update_filter.filter(self.connection_error, self.now_playing):
+            self.window_updates.put(self.connection_error, snapshot)
+
+    def show_on_window(self, connection_error: bool, snapshot: NowPlaying):
+        # Called on the GTK main thread
+        self.window.show_now_playing(connection_error, snapshot)
+        if not connection_error and (snapshot.is_track or snapshot.stream_name):
+            self.mark_startup('first track shown')
+
+    def set_dormant(self, dormant: bool):
+        if dormant == self.dormant:
+            return
+        self.dormant = dormant
+        self.scheduler.set_dormant(dormant)
+        now, cpu = time.monotonic(), time.process_time()
+        if dormant:
+            self.awake_cpu_rate = (cpu - self.awake_since[1]) / max(now - self.awake_since[0], 1)
+            self.dormant_since = (now, cpu)
+            self.dormant_polls = 0
+            self.dormant_updates = 0
+            return
+        self.log_dormancy(now, cpu)
+        self.awake_since = (now, cpu)
+        # Catch up with anything that changed while dormant
+        self.update_filter.invalidate()
+        if self.status:
+            self.handle_status(self.status, self.connection_error)
+
+    def log_dormancy(self, now: float, cpu: float):
+        duration = now - self.dormant_since[0]
+        cpu_used = cpu - self.dormant_since[1]
+        cpu_saved = max(0, self.awake_cpu_rate * duration - cpu_used)
+        if self.polling:
+            polls = f"{self.dormant_polls} polls (about {duration / self.scheduler.interval:.0f} if awake), "
+        else:
+            polls = ""
+        logging.info(f"Dormant for {duration:.0f}s: {polls}{self.dormant_updates} updates not shown, "
+                     f"{cpu_used:.2f}s CPU (about {cpu_saved:.2f}s saved)")
+
+
+async def log_metrics(interval: float):
+    while True:
+        await asyncio.sleep(interval)
+        logging.info(metrics.summary())
+
+
+def add_timer(delay: float, callback):
+    return GLib.timeout_add(int(delay * 1000), callback)
+
+
+def on_activate(app, args, engine: Engine, apiclient: ApiClient, first_state: concurrent.futures.Future,
+                mark_startup):
+    artwork_cache.resize(int(args.artwork_cache_size * 1024 * 1024))
+    if args.artwork_disk_cache:
+        try:
+            artwork_cache.disk_cache = DiskArtworkCache(str(args.artwork_disk_cache),
+                                                        int(args.artwork_disk_cache_size * 1024 * 1024))
+        except OSError as exc:
+            logging.error(f"Unable to use artwork disk cache: {exc}")
+    scheduler = PollScheduler(args.poll_interval, args.poll_interval_fast, args.poll_interval_max,
+                              args.poll_backoff_after, args.poll_interval_dormant)
+    update_filter = UpdateFilter()
+    if args.metrics_port:
+        # Only needed for --metrics-port, so not imported until then, to speed up startup
+        from metricsserver import MetricsServer  # pylint: disable=import-outside-toplevel
+        MetricsServer.start(args.metrics_port)
+    if args.metrics_log_interval:
+        engine.run(log_metrics(args.metrics_log_interval))
+    watchdog = MainLoopWatchdog(GLib.idle_add, add_timer, args.stall_threshold).start() \
+        if args.stall_threshold else None
+
+    def on_command_complete():
+        # Make sure the next state is shown even if it's unchanged, to replace any optimistic update
+        update_filter.invalidate()
+        scheduler.expedite()
+
+    commands = CommandDispatcher(engine, post=GLib.idle_add, on_complete=on_command_complete)
+    # Commands are sent at the same time as statuses are fetched, so need their own connection_error
+    command_client = ApiClient(args.host, apiclient.session)
+    window = MainWindow(app, command_client, commands, artwork_cache,
+                        args.dark_mode, args.full_screen, args.fixed_layout, args.show_close_button,
+                        args.hide_mouse_pointer)
+    window.connect('realize', lambda *_: mark_startup('window realized'))
+    window.present()
+
+    def on_dormant_change(dormant: bool):
+        # Called on the GTK main thread
+        if watchdog:
+            if dormant:
+                watchdog.pause()
+            else:
+                watchdog.resume()
+        engine.call_soon(follower.set_dormant, dormant)
+
+    screenmgr = screenblankmgr.ScreenBlankMgr(screenblankmgr.profiles[args.screenblanker_profile],
+                                              screenblankbackend.make_backend(args.screenblanker_backend)
+                                              if args.screenblanker_profile != 'none' else None,
+                                              timer_add=add_timer, timer_remove=GLib.source_remove,
+                                              on_dormant_change=on_dormant_change)
+    window.input_listeners.append(screenmgr.wake)
+
+    # Artwork is decoded as it downloads, whether it's the current artwork or prefetched
+    artwork_cache.make_decoder = window.artwork_decoder.incremental
+    prefetcher = ArtworkPrefetcher(ApiClient(args.host, apiclient.session, apiclient.max_artwork_bytes),
+                                   artwork_cache, window.artwork_decoder.decode)
+
+    follower = ServerStateFollower(engine, apiclient, window, scheduler, update_filter, prefetcher, screenmgr,
+                                   args.push_updates, mark_startup)
+    follower.start(first_state)
+
+
+def run(args, engine: Engine, apiclient: ApiClient, first_state: concurrent.futures.Future, mark_startup):
+    """
+    Create the window, and run the GTK main loop
+    """
+    # Decode the icons for the theme and size in use while GTK starts up. If the size can't be told
+    # yet, both sizes are decoded.
+    icon_size = expected_button_icon_size(args.full_screen)
+    variants = [(icon_name, dark_mode, size) for icon_name, dark_mode, size in ICON_VARIANTS
+                if dark_mode in (args.dark_mode, None) and (dark_mode is None or icon_size in (size, None))]
+    threading.Thread(target=icons.preload, name='icon-preload', daemon=True, args=(variants,)).start()
+
+    app = Gtk.Application()
+    app.connect('activate', on_activate, args, engine, apiclient, first_state, mark_startup)
+    app.run(None)
@@ -1,24 +1,136 @@
+from collections import OrderedDict
 import logging
+import threading
+import time
 
 from apiclient import ApiClient
+from diskcache import DiskArtworkCache
+from metrics import metrics
 
+DEFAULT_MAX_BYTES = 8 * 1024 * 1024
+
+# How long to wait before trying again to fetch artwork that the server failed to provide
+UNAVAILABLE_RETRY_INTERVAL = 60
+
+# Number of artwork info responses to remember
+MAX_ARTWORK_INFO = 256
+
+# Number of URIs of unavailable artwork to remember
+MAX_UNAVAILABLE = 256
+
+# A response to a request for artwork at a given size can't have been scaled to that size if
+# it's larger than this many bytes per pixel (ie uncompressed), plus some room for metadata
+MAX_SIZED_BYTES_PER_PIXEL = 4
+MAX_SIZED_METADATA_BYTES = 64 * 1024
+
+# Once the server has been seen to ignore the requested size, larger originals aren't downloaded
+MAX_UNSIZED_PIXELS = 2000 * 2000
+
+
+def fit_within(width: int, height: int, max_size: int):
+    """
+    Returns the (width, height) that fits within a max_size square, preserving the aspect ratio
+    """
+    if width > height:
+        return max_size, max(1, round(height * max_size / width))
+    return max(1, round(width * max_size / height)), max_size
+
+
+class ArtworkCacheEntry:
+    __slots__ = ('image', 'decoded', 'decoded_size')
+
+    def __init__(self, image: bytes):
+        self.image = image
+        self.decoded = None
+        self.decoded_size = 0
+
+    @property
+    def size(self):
+        return len(self.image) + self.decoded_size
+
+
+class ArtworkFetch:
+    """
+    A download in progress, for any other thread that wants the same artwork to wait for
+    """
+    __slots__ = ('done', 'artwork', 'connection_error')
 
-class ArtworkCache:
     def __init__(self):
+        self.done = threading.Event()
+        self.artwork = None
+        self.connection_error = False
+
+    def finish(self, artwork, connection_error: bool):
+        self.artwork = artwork
+        self.connection_error = connection_error
+        self.done.set()
+
+
+class ArtworkCache:
+    """
+    Holds the artwork for the current track (current_image_uri, current_image),
+    plus recently displayed artwork, keyed by artwork URI. Each entry has the
+    artwork bytes and, once it has been displayed, its decoded form. The least
+    recently used entries are evicted to keep the total size within max_bytes.
+    If there is a disk cache, artwork bytes are also written to it, and
+    artwork is looked for there before being fetched from the server.
+    Artwork larger than target_size (in either dimension) is requested from the
+    server at a size that fits within target_size. If the server turns out to
+    ignore the requested size, originals of more than MAX_UNSIZED_PIXELS are
+    not downloaded at all.
+    If there is a make_decoder function, artwork is decoded as it downloads:
+    make_decoder(image_uri) returns an object with feed(chunk), which returns
+    False if the artwork cannot be decoded, finish(), which returns
+    (decoded, decoded_size) or None, and abort().
+    Safe to use from multiple threads: if a thread asks for artwork that another
+    is already downloading, it waits for that download rather than starting its own.
+    """
+    def __init__(self, max_bytes: int = DEFAULT_MAX_BYTES, disk_cache: DiskArtworkCache = None, target_size=None):
         self.current_image_uri = None
         self.current_image = None
+        self.max_bytes = max_bytes
+        self.entries = OrderedDict()  # uri -> ArtworkCacheEntry, least recently used first
+        self.total_bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.disk_cache = disk_cache
+        self.disk_hits = 0
+        self.target_size = target_size
+        self.unavailable = OrderedDict()  # uri -> time.monotonic() after which to try again
+        self.fetches = {}  # uri -> ArtworkFetch, for downloads in progress
+        self.artwork_info = OrderedDict()  # uri -> ArtworkInfo
+        self.downloads = 0
+        self.bytes_downloaded = 0
+        self.sized_requests = 0  # downloads requested at target_size
+        self.sized_downloads = 0  # of those, the ones that the server scaled
+        self.sizes_ignored = False  # whether the server has sent the original in response to a sized request
+        self.originals_skipped = 0
+        self.make_decoder = None
+        self.lock = threading.Lock()
 
     def update(self, apiclient: ApiClient, new_image_uri: str):
         if new_image_uri == self.current_image_uri:
             # nothing to do
             return
 
-        if artwork := self.update_inner(apiclient, new_image_uri):
-            self.current_image_uri = new_image_uri
-            self.current_image = artwork
-        else:
-            self.current_image_uri = None
-            self.current_image = None
+        artwork = self.update_inner(apiclient, new_image_uri)
+        self.set_current(new_image_uri, artwork)
+
+    def set_current(self, image_uri: str, image: bytes):
+        """
+        Set the artwork for the current track: if image is None, there is none
+        """
+        with self.lock:
+            self.current_image_uri = image_uri if image else None
+            self.current_image = image if image else None
+
+    def get_current(self):
+        """
+        Returns (current_image_uri, current_image)
+        """
+        with self.lock:
+            return self.current_image_uri, self.current_image
 
     def update_inner(self, apiclient: ApiClient, new_image_uri: str):
         """
@@ -27,6 +139,203 @@ class ArtworkCache:
         if new_image_uri is None:
             return None
 
+        if (artwork := self.get(new_image_uri)) is not None:
+            return artwork
+
+        if self.disk_cache:
+            disk_key = new_image_uri if not new_image_uri.startswith('/') else apiclient.base_uri + new_image_uri
+            if artwork := self.disk_cache.get(disk_key):
+                with self.lock:
+                    self.disk_hits += 1
+                metrics.increment('artwork disk cache hit')
+                logging.debug("Artwork found in disk cache: %s", new_image_uri)
+                self.put(new_image_uri, artwork)
+                return artwork
+
+        with self.lock:
+            if (retry_at := self.unavailable.get(new_image_uri)) is not None:
+                if time.monotonic() < retry_at:
+                    return None
+                del self.unavailable[new_image_uri]
+            fetch = self.fetches.get(new_image_uri)
+            already_fetching = fetch is not None
+            if not already_fetching:
+                fetch = self.fetches[new_image_uri] = ArtworkFetch()
+
+        if already_fetching:
+            # eg the prefetcher is downloading the artwork that has just become current
+            logging.debug("Waiting for artwork already being fetched: %s", new_image_uri)
+            fetch.done.wait()
+            apiclient.connection_error = fetch.connection_error
+            return fetch.artwork
+
+        artwork = None
+        try:
+            artwork = self._fetch_new(apiclient, new_image_uri, disk_key if self.disk_cache else None)
+        finally:
+            with self.lock:
+                del self.fetches[new_image_uri]
+            fetch.finish(artwork, apiclient.connection_error)
+        return artwork
+
+    def _fetch_new(self, apiclient: ApiClient, new_image_uri: str, disk_key: str):
         # if we get here, we need to update our cache
         logging.debug("Fetching new artwork: %s", new_image_uri)
-        return apiclient.get_artwork(new_image_uri)  # returns artwork bytes or None
+        decoder = self.make_decoder(new_image_uri) if self.make_decoder else None
+        artwork = self.fetch(apiclient, new_image_uri, decoder)  # returns artwork bytes or None
+        if artwork:
+            self.put(new_image_uri, artwork)
+            if decoder and (decoded := decoder.finish()):
+                self.set_decoded(new_image_uri, *decoded)
+            if self.disk_cache:
+                self.disk_cache.put(disk_key, artwork)
+            return artwork
+        if decoder:
+            decoder.abort()
+        if not apiclient.connection_error:
+            # the server responded, but there's no (usable) artwork: don't keep asking
+            with self.lock:
+                self.unavailable[new_image_uri] = time.monotonic() + UNAVAILABLE_RETRY_INTERVAL
+                if len(self.unavailable) > MAX_UNAVAILABLE:
+                    self.unavailable.popitem(last=False)
+        return artwork
+
+    def fetch(self, apiclient: ApiClient, image_uri: str, decoder=None):
+        """
+        Download artwork, using the artwork info (for piju artwork) to ask for
+        no more than target_size, and passing it to decoder as it arrives
+        """
+        if not image_uri.startswith('/'):
+            # eg a radio station logo: there's no artwork info
+            return self._download(apiclient, image_uri, decoder=decoder)
+        with self.lock:
+            info = self.artwork_info.get(image_uri)
+        if info is None:
+            info = apiclient.get_artwork_info(image_uri)
+            if not info.imageuri:
+                return None
+            with self.lock:
+                self.artwork_info[image_uri] = info
+                if len(self.artwork_info) > MAX_ARTWORK_INFO:
+                    self.artwork_info.popitem(last=False)
+        if self.target_size and info.width and info.height and max(info.width, info.height) > self.target_size:
+            if self.sizes_ignored and info.width * info.height > MAX_UNSIZED_PIXELS:
+                with self.lock:
+                    self.originals_skipped += 1
+                metrics.increment('artwork original skipped')
+                logging.info("Not downloading %ux%u artwork %s: the server does not scale artwork",
+                             info.width, info.height, info.imageuri)
+                return None
+            size = fit_within(info.width, info.height, self.target_size)
+            artwork = self._download(apiclient, info.imageuri, size, decoder)
+            if artwork:
+                self._check_sized(info, size, artwork)
+            return artwork
+        return self._download(apiclient, info.imageuri, decoder=decoder)
+
+    def _check_sized(self, info, size, artwork: bytes):
+        """
+        Note whether the server scaled artwork requested at the given size
+        """
+        scaled = len(artwork) <= size[0] * size[1] * MAX_SIZED_BYTES_PER_PIXEL + MAX_SIZED_METADATA_BYTES
+        with self.lock:
+            self.sized_requests += 1
+            if scaled:
+                self.sized_downloads += 1
+            newly_ignored = not scaled and not self.sizes_ignored
+            if newly_ignored:
+                self.sizes_ignored = True
+            sized_requests, sized_downloads = self.sized_requests, self.sized_downloads
+        metrics.increment('artwork sized request')
+        if scaled:
+            metrics.increment('artwork sized download')
+            logging.debug("Requested %s at %ux%u instead of %ux%u (%u of %u sized requests scaled)",
+                          info.imageuri, size[0], size[1], info.width, info.height, sized_downloads, sized_requests)
+        elif newly_ignored:
+            logging.warning("Server sent %u bytes for %s requested at %ux%u: it does not seem to scale artwork",
+                            len(artwork), info.imageuri, size[0], size[1])
+
+    def _download(self, apiclient: ApiClient, image_uri: str, size=None, decoder=None):
+        if decoder:
+            artwork = apiclient.get_artwork(image_uri, size, on_chunk=decoder.feed)
+        else:
+            artwork = apiclient.get_artwork(image_uri, size)
+        if artwork:
+            metrics.increment('artwork download')
+            metrics.increment('artwork bytes downloaded', len(artwork))
+            with self.lock:
+                self.downloads += 1
+                self.bytes_downloaded += len(artwork)
+                downloads, bytes_downloaded = self.downloads, self.bytes_downloaded
+            logging.debug("Downloaded %u bytes of artwork (%u downloads, %u bytes in total)",
+                          len(artwork), downloads, bytes_downloaded)
+        return artwork
+
+    def get(self, image_uri: str):
+        """
+        Returns the cached artwork bytes, or None if not cached
+        """
+        with self.lock:
+            entry = self.entries.get(image_uri)
+            if entry is None:
+                self.misses += 1
+                metrics.increment('artwork cache miss')
+                logging.debug("Artwork cache miss: %s (hits=%u, misses=%u)", image_uri, self.hits, self.misses)
+                return None
+            self.hits += 1
+            metrics.increment('artwork cache hit')
+            self.entries.move_to_end(image_uri)
+            logging.debug("Artwork cache hit: %s (hits=%u, misses=%u)", image_uri, self.hits, self.misses)
+            return entry.image
+
+    def __contains__(self, image_uri: str):
+        """
+        Whether the artwork bytes are held in memory. Does not count as a use of them.
+        """
+        with self.lock:
+            return image_uri in self.entries
+
+    def put(self, image_uri: str, image: bytes):
+        with self.lock:
+            if (entry := self.entries.pop(image_uri, None)) is not None:
+                self.total_bytes -= entry.size
+            entry = ArtworkCacheEntry(image)
+            self.entries[image_uri] = entry
+            self.total_bytes += entry.size
+            self._evict()
+
+    def get_decoded(self, image_uri: str):
+        """
+        Returns the decoded form of the artwork, as stored by set_decoded, or None
+        """
+        with self.lock:
+            entry = self.entries.get(image_uri)
+            if entry is None or entry.decoded is None:
+                return None
+            self.entries.move_to_end(image_uri)
+            return entry.decoded
+
+    def set_decoded(self, image_uri: str, decoded, decoded_size: int):
+        """
+        Store the decoded form of artwork that is already cached
+        """
+        with self.lock:
+            entry = self.entries.get(image_uri)
+            if entry is None:
+                return
+            self.total_bytes += decoded_size - entry.decoded_size
+            entry.decoded = decoded
+            entry.decoded_size = decoded_size
+            self._evict()
+
+    def resize(self, max_bytes: int):
+        with self.lock:
+            self.max_bytes = max_bytes
+            self._evict()
+
+    def _evict(self):
+        while self.total_bytes > self.max_bytes and self.entries:
+            image_uri, entry = self.entries.popitem(last=False)
+            self.total_bytes -= entry.size
+            self.evictions += 1
+            logging.debug("Evicted artwork from cache: %s", image_uri)
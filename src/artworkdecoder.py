@@ -0,0 +1,245 @@
+import logging
+import time
+
+import gi
+
+gi.require_version('Gdk', '4.0')
+# pylint: disable=wrong-import-position,wrong-import-order
+# (need to call require_version before we can import the other gi libraries, and we want
+# third-party libraries before local libraries)
+from gi.repository import Gdk  # noqa: E402 # need to call require_version before we can call this
+from gi.repository import GdkPixbuf  # noqa: E402 # need to call require_version before we can call this
+gi.require_version('GLib', '2.0')
+from gi.repository import GLib  # noqa: E402 # need to call require_version before we can call this
+
+from artworkcache import ArtworkCache, fit_within  # noqa: E402 # libraries before local imports
+from backgroundworker import Job, LatestJobWorker  # noqa: E402 # libraries before local imports
+from metrics import metrics  # noqa: E402 # libraries before local imports
+# pylint: enable=wrong-import-position,wrong-import-order
+
+
+def is_svg(image_uri: str, image: bytes) -> bool:
+    if image_uri.endswith('.svg'):
+        return True
+    start = bytes(image[:256]).lstrip()
+    return start.startswith(b'<svg') or (start.startswith(b'<?xml') and b'<svg' in start)
+
+
+def pixbuf_from_svg_bytes(image: bytes, max_size: int) -> GdkPixbuf.Pixbuf:
+    """
+    Render the SVG directly at the size it will be displayed
+    """
+    # Only needed for SVG artwork (eg radio station logos), so not imported until then, to speed up startup
+    import cairo  # pylint: disable=import-outside-toplevel
+    gi.require_foreign('cairo')
+    gi.require_version('Rsvg', '2.0')
+    from gi.repository import Rsvg  # pylint: disable=import-outside-toplevel
+    try:
+        handle = Rsvg.Handle.new_from_data(bytes(image))
+    except GLib.GError as exc:
+        logging.error(f"Error loading SVG: {exc}")
+        return None
+    if not hasattr(handle, 'render_document'):
+        # librsvg before 2.46: render at the SVG's own size, then scale
+        return scale_to_fit(handle.get_pixbuf(), max_size)
+    if hasattr(handle, 'get_intrinsic_size_in_pixels'):
+        has_size, width, height = handle.get_intrinsic_size_in_pixels()
+    else:
+        # librsvg before 2.52: the size in pixels at 90dpi
+        dimensions = handle.get_dimensions()
+        has_size, width, height = True, dimensions.width, dimensions.height
+    if has_size and width > 0 and height > 0:
+        width, height = fit_within(round(width), round(height), max_size)
+    else:
+        # only a viewBox (or nothing): let librsvg fit it into the whole box
+        width = height = max_size
+    surface = cairo.ImageSurface(cairo.FORMAT_ARGB32, width, height)
+    context = cairo.Context(surface)
+    viewport = Rsvg.Rectangle()
+    viewport.x = viewport.y = 0
+    viewport.width = width
+    viewport.height = height
+    try:
+        handle.render_document(context, viewport)
+    except GLib.GError as exc:
+        logging.error(f"Error rendering SVG: {exc}")
+        return None
+    return Gdk.pixbuf_get_from_surface(surface, 0, 0, width, height)
+
+
+def decode_at_size(loader: GdkPixbuf.PixbufLoader, max_size: int):
+    """
+    Have the loader decode images larger than max_size straight to a size that fits within it
+    """
+    def on_size_prepared(loader, width, height):
+        if (width > max_size) or (height > max_size):
+            loader.set_size(*fit_within(width, height, max_size))
+    loader.connect('size-prepared', on_size_prepared)
+
+
+def pixbuf_from_image_bytes(image: bytes, max_size: int = None) -> GdkPixbuf.Pixbuf:
+    """
+    If max_size is given, the image is decoded straight to a size that fits
+    within it, rather than decoded in full and then scaled
+    """
+    if not isinstance(image, bytes):
+        # eg memory-mapped from the disk cache, or a bytearray as downloaded
+        image = bytes(image)
+    loader = GdkPixbuf.PixbufLoader()
+    if max_size:
+        decode_at_size(loader, max_size)
+    try:
+        loader.write(image)
+    except GLib.GError as exc:
+        logging.error(f"Error loading image into pixbuf: {exc}")
+        return None
+    if not loader.close():
+        logging.error("Image data could not be parsed")
+        return None
+    pixbuf = loader.get_pixbuf()
+    return pixbuf
+
+
+def scale_to_fit(pixbuf: GdkPixbuf.Pixbuf, max_size: int) -> GdkPixbuf.Pixbuf:
+    width = pixbuf.get_width()
+    height = pixbuf.get_height()
+    if (width > max_size) or (height > max_size):
+        dest_width, dest_height = fit_within(width, height, max_size)
+        pixbuf = pixbuf.scale_simple(dest_width, dest_height, GdkPixbuf.InterpType.BILINEAR)
+    return pixbuf
+
+
+def texture_from_pixbuf(pixbuf: GdkPixbuf.Pixbuf, max_size: int):
+    """
+    Returns (texture, decoded size in bytes)
+    """
+    # in case the loader could not decode at the requested size
+    pixbuf = scale_to_fit(pixbuf, max_size)
+    texture = Gdk.Texture.new_for_pixbuf(pixbuf)
+    return texture, texture.get_width() * texture.get_height() * 4
+
+
+class IncrementalDecoder:
+    """
+    Decodes artwork a chunk at a time, as it downloads: see ArtworkCache.make_decoder.
+    SVGs are left to ArtworkDecoder, to be rendered at the size they will be displayed.
+    """
+    def __init__(self, image_uri: str, max_size: int):
+        self.image_uri = image_uri
+        self.max_size = max_size
+        self.loader = None
+        self.skipped = False  # not decoding this artwork here
+        self.decode_time = 0.0
+
+    def feed(self, chunk: bytes) -> bool:
+        """
+        Returns False if the artwork cannot be decoded
+        """
+        if self.skipped:
+            return True
+        start = time.perf_counter()
+        if self.loader is None:
+            if is_svg(self.image_uri, chunk):
+                self.skipped = True
+                return True
+            self.loader = GdkPixbuf.PixbufLoader()
+            decode_at_size(self.loader, self.max_size)
+        try:
+            self.loader.write(chunk)
+        except GLib.GError as exc:
+            logging.error(f"Error loading image {self.image_uri} into pixbuf: {exc}")
+            self.abort()
+            return False
+        self.decode_time += time.perf_counter() - start
+        return True
+
+    def finish(self):
+        """
+        Returns (texture, decoded size in bytes), or None
+        """
+        if self.loader is None:
+            return None
+        start = time.perf_counter()
+        loader, self.loader = self.loader, None
+        try:
+            if not loader.close():
+                logging.error("Image data could not be parsed")
+                return None
+        except GLib.GError as exc:
+            logging.error(f"Error loading image {self.image_uri} into pixbuf: {exc}")
+            return None
+        if not (pixbuf := loader.get_pixbuf()):
+            return None
+        decoded = texture_from_pixbuf(pixbuf, self.max_size)
+        metrics.observe('artwork decode', self.decode_time + time.perf_counter() - start)
+        return decoded
+
+    def abort(self):
+        if self.loader is not None:
+            loader, self.loader = self.loader, None
+            try:
+                loader.close()
+            except GLib.GError:
+                pass  # it's expected to complain about the incomplete image
+
+
+class ArtworkDecoder:
+    """
+    Turns artwork bytes into a texture, decoded at a size to fit the display,
+    on a background thread. Only the most recent request is completed:
+    anything in progress when a new request arrives is abandoned.
+    Textures are kept in the artwork cache, alongside the bytes they came from.
+    """
+    def __init__(self, artwork_cache: ArtworkCache, max_size: int):
+        self.artwork_cache = artwork_cache
+        self.max_size = max_size
+        self.worker = LatestJobWorker('artwork-decoder')
+
+    def request(self, image_uri: str, image: bytes, on_ready):
+        """
+        on_ready(texture) is called on the GTK main thread, with None if the
+        artwork could not be decoded, unless another request has been made since.
+        If the texture is already cached, on_ready is called before this returns.
+        """
+        if texture := self.artwork_cache.get_decoded(image_uri):
+            self.worker.cancel()
+            on_ready(texture)
+            return
+        self.worker.submit(lambda job, texture: GLib.idle_add(self._deliver, job, on_ready, texture),
+                           self.decode, image_uri, image)
+
+    def cancel(self):
+        self.worker.cancel()
+
+    def incremental(self, image_uri: str) -> IncrementalDecoder:
+        """
+        Returns a decoder for artwork that is downloading: see ArtworkCache.make_decoder
+        """
+        return IncrementalDecoder(image_uri, self.max_size)
+
+    def _deliver(self, job: Job, on_ready, texture):
+        # a newer request may have been made while this was waiting for the main loop
+        if not job.cancelled:
+            on_ready(texture)
+        return GLib.SOURCE_REMOVE
+
+    def decode(self, job: Job, image_uri: str, image: bytes):
+        """
+        Decode artwork into the cache, on the calling thread, returning the texture.
+        Gives up, returning None, if the job is cancelled.
+        """
+        if texture := self.artwork_cache.get_decoded(image_uri):
+            return texture
+        with metrics.time('artwork decode'):
+            if is_svg(image_uri, image):
+                pixbuf = pixbuf_from_svg_bytes(image, self.max_size)
+            else:
+                pixbuf = pixbuf_from_image_bytes(image, self.max_size)
+        if not pixbuf or job.cancelled:
+            return None
+        with metrics.time('artwork scale'):
+            texture, decoded_size = texture_from_pixbuf(pixbuf, self.max_size)
+        if job.cancelled:
+            return None
+        self.artwork_cache.set_decoded(image_uri, texture, decoded_size)
+        return texture
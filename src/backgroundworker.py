@@ -0,0 +1,73 @@
+import logging
+import os
+import threading
+
+
+class Job:
+    """
+    Handed to the function run by a LatestJobWorker, so that it can stop early
+    once a newer job has been submitted
+    """
+    def __init__(self, worker: 'LatestJobWorker', generation: int):
+        self.worker = worker
+        self.generation = generation
+
+    @property
+    def cancelled(self) -> bool:
+        return not self.worker.is_current(self.generation)
+
+
+class LatestJobWorker:
+    """
+    Runs jobs on a single background thread, where only the most recently
+    submitted job matters: a job that has not yet started is replaced by a newer
+    one, and a running job is told that it has been cancelled.
+    A positive niceness lowers the priority of the worker thread, where supported.
+    """
+    def __init__(self, name: str, niceness: int = 0):
+        self.niceness = niceness
+        self.condition = threading.Condition()
+        self.generation = 0
+        self.pending = None  # (job, fn, args, on_done)
+        self.thread = threading.Thread(target=self._run, name=name, daemon=True)
+        self.thread.start()
+
+    def submit(self, on_done, fn, *args) -> Job:
+        """
+        Run fn(job, *args) in the background, and call on_done(job, result) (on
+        the worker thread) if the job has not been cancelled by the time fn returns
+        """
+        with self.condition:
+            self.generation += 1
+            job = Job(self, self.generation)
+            self.pending = (job, fn, args, on_done)
+            self.condition.notify()
+        return job
+
+    def cancel(self):
+        with self.condition:
+            self.generation += 1
+            self.pending = None
+
+    def is_current(self, generation: int) -> bool:
+        return generation == self.generation
+
+    def _run(self):
+        if self.niceness:
+            try:
+                # On Linux, the priority of an individual thread can be set using its thread id
+                os.setpriority(os.PRIO_PROCESS, threading.get_native_id(), self.niceness)
+            except (AttributeError, OSError) as exc:
+                logging.debug(f"Unable to lower the priority of {self.thread.name}: {exc}")
+        while True:
+            with self.condition:
+                self.condition.wait_for(lambda: self.pending is not None)
+                job, fn, args, on_done = self.pending
+                self.pending = None
+            try:
+                result = fn(job, *args)
+            except Exception:  # pylint: disable=broad-except  # the worker must survive a failed job
+                logging.exception("Background job failed")
+                continue
+            if not job.cancelled:
+                on_done(job, result)
@@ -0,0 +1,101 @@
+import asyncio
+import logging
+import threading
+import time
+
+from engine import Engine, run_blocking
+from metrics import metrics
+
+# Longest to wait for a command to be sent, beyond the ApiClient's own timeouts
+COMMAND_TIMEOUT = 5
+
+
+class LatencyStats:
+    """
+    Count, mean and maximum of a set of latencies, by kind
+    """
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.stats = {}  # kind -> [count, total, maximum]
+
+    def record(self, kind: str, seconds: float):
+        with self.lock:
+            stats = self.stats.setdefault(kind, [0, 0.0, 0.0])
+            stats[0] += 1
+            stats[1] += seconds
+            stats[2] = max(stats[2], seconds)
+        metrics.observe(kind, seconds)
+        logging.debug("%s latency: %.1fms", kind, seconds * 1000)
+
+    def summary(self):
+        """
+        Returns {kind: (count, mean seconds, maximum seconds)}
+        """
+        with self.lock:
+            return {kind: (count, total / count, maximum) for kind, (count, total, maximum) in self.stats.items()}
+
+
+class CommandDispatcher:
+    """
+    Runs player commands (eg ApiClient.next) one at a time, in the order they
+    were submitted, as a coroutine on the engine, so that the caller never waits
+    for the server. Commands run alongside the status and artwork traffic.
+    """
+    def __init__(self, engine: Engine, post=None, on_complete=None, timeout: float = COMMAND_TIMEOUT):
+        """
+        post(fn, *args) is used to call the on_done callbacks: GLib.idle_add, to
+        call them on the GTK main thread. By default, they are called on the
+        engine's thread.
+        on_complete(), if given, is called on the engine's thread after every command.
+        """
+        self.engine = engine
+        self.post = post if post else (lambda fn, *args: fn(*args))
+        self.on_complete = on_complete
+        self.timeout = timeout
+        self.latency = LatencyStats()
+        self.queue = None  # created on the engine's thread: before Python 3.10, a Queue binds to the current loop
+        # Incremented by submit(), on the caller's thread, and decremented by _done(), on whichever thread
+        # post() calls it: with GLib.idle_add, both are on the GTK main thread
+        self.in_flight = 0
+        engine.run(self._run())
+
+    def submit(self, description: str, command, on_done=None):
+        """
+        command() should return True on success. on_done(success) is post()ed
+        once the command has completed.
+        """
+        self.in_flight += 1
+        self.engine.call_soon(self._enqueue, (description, command, on_done, time.perf_counter()))
+
+    def _get_queue(self) -> asyncio.Queue:
+        # On the engine's thread. A command may be submitted before _run() has started.
+        if self.queue is None:
+            self.queue = asyncio.Queue()
+        return self.queue
+
+    def _enqueue(self, item):
+        self._get_queue().put_nowait(item)
+
+    def _done(self, on_done, success):
+        self.in_flight -= 1
+        if on_done:
+            on_done(success)
+
+    async def _run(self):
+        queue = self._get_queue()
+        while True:
+            description, command, on_done, submitted_at = await queue.get()
+            try:
+                success = bool(await run_blocking(command, timeout=self.timeout))
+                if not success:
+                    logging.error("Failed to %s", description)
+            except asyncio.TimeoutError:
+                logging.error("Timed out trying to %s", description)
+                success = False
+            except Exception:  # pylint: disable=broad-except  # the dispatcher must survive a failed command
+                logging.exception("Failed to %s", description)
+                success = False
+            self.latency.record('command', time.perf_counter() - submitted_at)
+            if self.on_complete:
+                self.on_complete()
+            self.post(self._done, on_done, success)
@@ -0,0 +1,122 @@
+import hashlib
+import logging
+import mmap
+import os
+import os.path
+import tempfile
+import threading
+
+DEFAULT_MAX_BYTES = 50 * 1024 * 1024
+
+
+def default_cache_dir():
+    cache_home = os.environ.get('XDG_CACHE_HOME') or os.path.join(os.path.expanduser('~'), '.cache')
+    return os.path.join(cache_home, 'piju-touchscreen', 'artwork')
+
+
+def _digest(data) -> str:
+    return hashlib.sha256(data).hexdigest()
+
+
+class DiskArtworkCache:
+    """
+    A persistent, content-addressed store of artwork, so that covers are available
+    immediately after a restart. The layout is:
+
+        objects/<sha256 of the artwork>   the artwork bytes
+        refs/<sha256 of the uri>          the sha256 of the artwork for that uri
+
+    so artwork shared by every track of an album is only stored once.
+
+    To be kind to SD cards, files are only ever written when artwork is added,
+    each with a single atomic rename, and never on a read. This means that
+    eviction (to keep the objects within max_bytes) is oldest-written first,
+    rather than least recently used; the in-memory cache takes care of recency.
+    Refs to evicted objects are removed when they are next looked up.
+    """
+    def __init__(self, directory: str, max_bytes: int = DEFAULT_MAX_BYTES):
+        self.directory = directory
+        self.objects_dir = os.path.join(directory, 'objects')
+        self.refs_dir = os.path.join(directory, 'refs')
+        self.max_bytes = max_bytes
+        self.lock = threading.Lock()
+        self.objects = {}  # digest -> (mtime, size)
+        self.total_bytes = 0
+        os.makedirs(self.objects_dir, exist_ok=True)
+        os.makedirs(self.refs_dir, exist_ok=True)
+        with os.scandir(self.objects_dir) as entries:
+            for entry in entries:
+                if entry.name.startswith('.'):
+                    # a temporary file left behind by an interrupted write
+                    self._remove(entry.path)
+                    continue
+                stat = entry.stat()
+                self.objects[entry.name] = (stat.st_mtime, stat.st_size)
+                self.total_bytes += stat.st_size
+        self._evict()
+
+    def get(self, uri: str):
+        """
+        Returns the artwork as a read-only memory-mapped buffer, or None if not cached
+        """
+        ref_path = os.path.join(self.refs_dir, _digest(uri.encode('utf-8')))
+        try:
+            with open(ref_path, 'r', encoding='ascii') as handle:
+                digest = handle.read().strip()
+        except OSError:
+            return None
+        try:
+            with open(os.path.join(self.objects_dir, digest), 'rb') as handle:
+                return mmap.mmap(handle.fileno(), 0, access=mmap.ACCESS_READ)
+        except (OSError, ValueError):  # ValueError: an empty file can't be mapped
+            logging.debug("Removing stale artwork ref for %s", uri)
+            self._remove(ref_path)
+            return None
+
+    def put(self, uri: str, data: bytes):
+        digest = _digest(data)
+        with self.lock:
+            if digest not in self.objects:
+                object_path = os.path.join(self.objects_dir, digest)
+                if not self._write_atomically(object_path, data, fsync=True):
+                    return
+                self.objects[digest] = (os.stat(object_path).st_mtime, len(data))
+                self.total_bytes += len(data)
+                self._evict()
+        self._write_atomically(os.path.join(self.refs_dir, _digest(uri.encode('utf-8'))), digest.encode('ascii'))
+
+    def _write_atomically(self, path, data, fsync=False):
+        try:
+            fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path), prefix='.')
+        except OSError as exc:
+            logging.error(f"Unable to write to artwork cache: {exc}")
+            return False
+        try:
+            with os.fdopen(fd, 'wb') as handle:
+                handle.write(data)
+                if fsync:
+                    handle.flush()
+                    os.fsync(handle.fileno())
+            os.replace(tmp_path, path)
+        except OSError as exc:
+            logging.error(f"Unable to write to artwork cache: {exc}")
+            self._remove(tmp_path)
+            return False
+        return True
+
+    def _evict(self):
+        if self.total_bytes <= self.max_bytes:
+            return
+        for digest, (_, size) in sorted(self.objects.items(), key=lambda item: item[1][0]):
+            self._remove(os.path.join(self.objects_dir, digest))
+            del self.objects[digest]
+            self.total_bytes -= size
+            if self.total_bytes <= self.max_bytes:
+                break
+
+    @staticmethod
+    def _remove(path):
+        try:
+            os.remove(path)
+        except OSError:
+            pass
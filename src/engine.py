@@ -0,0 +1,66 @@
+import asyncio
+import concurrent.futures
+import logging
+import threading
+
+
+async def run_blocking(fn, *args, timeout: float = None):
+    """
+    Call a blocking function (eg an ApiClient method) on a worker thread, so
+    that the event loop carries on. Raises asyncio.TimeoutError after timeout
+    seconds, although the function itself runs to completion in the background,
+    so should have a timeout of its own.
+    """
+    return await asyncio.wait_for(asyncio.to_thread(fn, *args), timeout)
+
+
+class Engine:
+    """
+    An asyncio event loop, running on its own thread, for the coroutines that
+    talk to the server. Because they all run on the one thread, they can share
+    state without any locking; results are handed over to the GTK main thread
+    with GLib.idle_add.
+    """
+    def __init__(self, name: str = 'engine'):
+        self.loop = asyncio.new_event_loop()
+        self.thread = threading.Thread(target=self._run, name=name, daemon=True)
+
+    def start(self):
+        self.thread.start()
+
+    def _run(self):
+        asyncio.set_event_loop(self.loop)
+        self.loop.run_forever()
+
+    def run(self, coroutine) -> concurrent.futures.Future:
+        """
+        Start a coroutine on the event loop. May be called from any thread.
+        """
+        future = asyncio.run_coroutine_threadsafe(coroutine, self.loop)
+        future.add_done_callback(self._on_done)
+        return future
+
+    def call_soon(self, fn, *args):
+        """
+        Call fn(*args) on the event loop's thread. May be called from any thread.
+        """
+        self.loop.call_soon_threadsafe(fn, *args)
+
+    def stop(self, timeout: float = 1):
+        """
+        Cancel everything running on the event loop, and stop it
+        """
+        async def cancel_all():
+            tasks = [task for task in asyncio.all_tasks() if task is not asyncio.current_task()]
+            for task in tasks:
+                task.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
+            self.loop.stop()
+        if self.thread.is_alive():
+            asyncio.run_coroutine_threadsafe(cancel_all(), self.loop)
+            self.thread.join(timeout)
+
+    @staticmethod
+    def _on_done(future: concurrent.futures.Future):
+        if not future.cancelled() and (exc := future.exception()):
+            logging.error("Engine task failed", exc_info=exc)
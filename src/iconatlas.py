@@ -0,0 +1,84 @@
+import json
+import logging
+import os
+import os.path
+
+ICON_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), os.path.pardir, 'icons')
+
+# Made by tools/mk_icon_atlas.py
+ATLAS_IMAGE = 'atlas.png'
+ATLAS_INDEX = 'atlas.json'
+
+# Every icon the main window can show
+ICON_VARIANTS = ([(icon_name, dark_mode, icon_size)
+                  for icon_name in ('play', 'pause', 'backward', 'forward')
+                  for dark_mode in (True, False)
+                  for icon_size in (100, 200)]
+                 + [('circle', None, 16), ('window-close', None, 0)])
+
+
+def icon_leafname(icon_name: str, dark_mode, icon_size) -> str:
+    '''
+    icon_name is the base name of the image to load
+    dark_mode is True ("-dark"), False ("-light") or None ("")
+    icon_size is an int or None
+    '''
+    leafname = icon_name
+    if dark_mode is True:
+        leafname += '-dark'
+    elif dark_mode is False:
+        leafname += '-light'
+    if icon_size:
+        leafname += f'_{icon_size}'
+    return leafname + '.png'
+
+
+def pack(sizes):
+    """
+    Lay out images in rows, tallest first, in an atlas no wider than the
+    widest row needs to be (about square).
+    sizes is {name: (width, height)}. Returns ((atlas width, atlas height),
+    {name: (x, y, width, height)}).
+    """
+    if not sizes:
+        return (0, 0), {}
+    area = sum(width * height for width, height in sizes.values())
+    max_width = max(max(width for width, _ in sizes.values()), int(area ** 0.5))
+    positions = {}
+    x = y = row_height = atlas_width = 0
+    for name, (width, height) in sorted(sizes.items(), key=lambda item: (-item[1][1], item[0])):
+        if x + width > max_width:
+            x = 0
+            y += row_height
+            row_height = 0
+        positions[name] = (x, y, width, height)
+        x += width
+        row_height = max(row_height, height)
+        atlas_width = max(atlas_width, x)
+    return (atlas_width, y + row_height), positions
+
+
+def read_index(icon_dir: str = ICON_DIR):
+    """
+    Returns {leafname: (x, y, width, height)} from the atlas index, or None if
+    there is no atlas, or it is older than any of the icons in it
+    """
+    index_path = os.path.join(icon_dir, ATLAS_INDEX)
+    try:
+        with open(index_path, encoding='utf-8') as handle:
+            index = {leafname: tuple(position) for leafname, position in json.load(handle)['icons'].items()}
+        built = min(os.path.getmtime(index_path), os.path.getmtime(os.path.join(icon_dir, ATLAS_IMAGE)))
+        if any(os.path.getmtime(os.path.join(icon_dir, leafname)) > built for leafname in index):
+            logging.warning("Icon atlas is out of date: loading icons individually. Run tools/mk_icon_atlas.py")
+            return None
+    except FileNotFoundError:
+        return None
+    except (OSError, ValueError, KeyError, TypeError) as exc:
+        logging.error(f"Unable to read icon atlas index: {exc}")
+        return None
+    return index
+
+
+def write_index(positions, icon_dir: str = ICON_DIR):
+    with open(os.path.join(icon_dir, ATLAS_INDEX), 'w', encoding='utf-8') as handle:
+        json.dump({'image': ATLAS_IMAGE, 'icons': positions}, handle, indent=2, sort_keys=True)
@@ -0,0 +1,80 @@
+import logging
+import os.path
+import threading
+
+import gi
+
+gi.require_version('Gtk', '4.0')
+gi.require_version('Gdk', '4.0')
+gi.require_version('GdkPixbuf', '2.0')
+# pylint: disable=wrong-import-position,wrong-import-order
+# (need to call require_version before we can import the other gi libraries, and we want
+# third-party libraries before local libraries)
+from gi.repository import Gtk  # noqa: E402 # need to call require_version before we can call this
+from gi.repository import Gdk  # noqa: E402 # need to call require_version before we can call this
+from gi.repository import GdkPixbuf  # noqa: E402 # need to call require_version before we can call this
+from gi.repository import GLib  # noqa: E402 # need to call require_version before we can call this
+
+from iconatlas import ATLAS_IMAGE, ICON_DIR, icon_leafname, read_index  # noqa: E402 # libraries before local imports
+# pylint: enable=wrong-import-position,wrong-import-order
+
+
+class IconRegistry:
+    """
+    Decodes each icon once, and hands out the same texture for every image
+    that shows it, however many times the window is realized. If the atlas
+    made by tools/mk_icon_atlas.py is up to date, every icon comes from it, so
+    there is only one file to read and decode; otherwise, each icon is decoded
+    from its own file.
+    """
+    def __init__(self, icon_dir: str = ICON_DIR):
+        self.icon_dir = icon_dir
+        self.textures = {}  # leafname -> Gdk.Texture
+        self.atlas = None  # GdkPixbuf.Pixbuf
+        self.atlas_index = None  # leafname -> (x, y, width, height)
+        self.atlas_loaded = False
+        self.lock = threading.Lock()
+
+    def _load_atlas(self):
+        self.atlas_loaded = True
+        if (index := read_index(self.icon_dir)) is None:
+            return
+        try:
+            self.atlas = GdkPixbuf.Pixbuf.new_from_file(os.path.join(self.icon_dir, ATLAS_IMAGE))
+        except GLib.GError as exc:
+            logging.error(f"Unable to load icon atlas: {exc}")
+            return
+        self.atlas_index = index
+
+    def texture(self, icon_name: str, dark_mode, icon_size) -> Gdk.Texture:
+        """
+        Arguments are as for icon_leafname
+        """
+        leafname = icon_leafname(icon_name, dark_mode, icon_size)
+        with self.lock:
+            if (texture := self.textures.get(leafname)) is not None:
+                return texture
+            if not self.atlas_loaded:
+                self._load_atlas()
+            if self.atlas_index and (position := self.atlas_index.get(leafname)):
+                texture = Gdk.Texture.new_for_pixbuf(self.atlas.new_subpixbuf(*position))
+            else:
+                icon_filename = os.path.join(self.icon_dir, leafname)
+                assert os.path.exists(icon_filename), f'{icon_filename} not found'
+                texture = Gdk.Texture.new_from_filename(icon_filename)
+            self.textures[leafname] = texture
+            return texture
+
+    def preload(self, variants):
+        """
+        Decode the given (icon_name, dark_mode, icon_size) variants now, rather than when first shown
+        """
+        for variant in variants:
+            self.texture(*variant)
+
+    def image(self, icon_name: str, dark_mode, icon_size) -> Gtk.Image:
+        return Gtk.Image.new_from_paintable(self.texture(icon_name, dark_mode, icon_size))
+
+
+# The icons shared by every window
+icons = IconRegistry()
@@ -0,0 +1,144 @@
+import logging
+import sys
+import threading
+import time
+import traceback
+
+from metrics import metrics
+
+# How often the main loop is checked, in seconds
+HEARTBEAT_INTERVAL = 0.5
+# How late the heartbeat can be, in seconds, before the main loop counts as stalled
+STALL_THRESHOLD = 0.25
+
+
+class MainLoopWatchdog:
+    """
+    Detects stalls of the GTK main loop. A heartbeat timer on the main loop
+    notes when it runs; a thread of the watchdog's own checks on it, and, if
+    the heartbeat is more than threshold seconds late, logs the main thread's
+    Python stack, to show what is holding it up. The duration of the stall is
+    recorded once the heartbeat runs again.
+    The watchdog's thread also measures how long the main loop takes to
+    dispatch a callback posted to it.
+    While paused (eg while the screen is blanked), neither the heartbeat nor
+    the watchdog's thread wakes the main loop.
+    """
+    def __init__(self, post, timer_add, threshold: float = STALL_THRESHOLD, interval: float = HEARTBEAT_INTERVAL,
+                 clock=time.monotonic, main_thread_id: int = None):
+        """
+        post(fn, *args) calls fn(*args) on the main loop: GLib.idle_add.
+        timer_add(delay, callback) should arrange for callback() to be called on
+        the main loop after delay seconds; callback() returns False.
+        Must be created on the main thread, unless main_thread_id is given.
+        """
+        self.post = post
+        self.timer_add = timer_add
+        self.threshold = threshold
+        self.interval = interval
+        self.clock = clock
+        self.main_thread_id = main_thread_id if main_thread_id is not None else threading.get_ident()
+        self.lock = threading.Lock()
+        self.beat_due = None  # when the heartbeat should next run
+        self.stall_reported = False  # whether the main thread's stack has been logged for the current stall
+        self.probe_pending = False
+        self.beat_scheduled = False  # only used on the main thread
+        self.paused = False
+        self.awake = threading.Event()
+        self.awake.set()
+        self.stalls = 0
+        self.total_stall = 0.0
+        self.longest_stall = 0.0
+        self.stopped = threading.Event()
+        self.thread = threading.Thread(target=self._run, name='watchdog', daemon=True)
+
+    def start(self):
+        self._schedule_beat()
+        self.thread.start()
+        return self
+
+    def stop(self):
+        self.stopped.set()
+        self.awake.set()
+
+    def pause(self):
+        """
+        Stop checking on the main loop until resume() is called. On the main thread.
+        """
+        self.paused = True
+        self.awake.clear()
+        with self.lock:
+            self.beat_due = None
+
+    def resume(self):
+        """
+        On the main thread
+        """
+        if not self.paused:
+            return
+        self.paused = False
+        self._schedule_beat()
+        self.awake.set()
+
+    def _schedule_beat(self):
+        with self.lock:
+            self.beat_due = self.clock() + self.interval
+        if not self.beat_scheduled:
+            # (if it is, the heartbeat from before a pause is still to run)
+            self.beat_scheduled = True
+            self.timer_add(self.interval, self._beat)
+
+    def _beat(self):
+        # On the main thread
+        self.beat_scheduled = False
+        with self.lock:
+            beat_due, self.beat_due = self.beat_due, None
+            self.stall_reported = False
+        if self.paused:
+            return False
+        lateness = self.clock() - beat_due
+        if lateness >= self.threshold:
+            self.stalls += 1
+            self.total_stall += lateness
+            self.longest_stall = max(self.longest_stall, lateness)
+            metrics.observe('main loop stall', lateness)
+            metrics.increment('main loop stall')
+            logging.warning("Main loop stalled for %.0fms (%u stalls, %.0fms in total, longest %.0fms)",
+                            lateness * 1000, self.stalls, self.total_stall * 1000, self.longest_stall * 1000)
+        self._schedule_beat()
+        return False
+
+    def _probe(self, posted_at: float):
+        # On the main thread
+        metrics.observe('main loop dispatch', self.clock() - posted_at)
+        self.probe_pending = False
+        return False
+
+    def _run(self):
+        while self.awake.wait() and not self.stopped.wait(self.interval / 2):
+            self.check()
+
+    def check(self):
+        """
+        Called periodically on the watchdog's thread
+        """
+        if self.paused:
+            return
+        now = self.clock()
+        if not self.probe_pending:
+            self.probe_pending = True
+            self.post(self._probe, now)
+        with self.lock:
+            if self.stall_reported or self.beat_due is None or now - self.beat_due < self.threshold:
+                return
+            self.stall_reported = True
+            # the heartbeat may run, and clear beat_due, as soon as the lock is released
+            stalled_for = now - self.beat_due + self.interval
+        logging.warning("Main loop has not run for %.0fms; it is in:\n%s",
+                        stalled_for * 1000, self.capture_stack())
+
+    def capture_stack(self) -> str:
+        frame = sys._current_frames().get(self.main_thread_id)  # pylint: disable=protected-access
+        if frame is None:
+            return ''
+        return ''.join(traceback.format_stack(frame))
@@ -1,28 +1,20 @@
 import argparse
 import logging
 import pathlib
-import threading
-import time
 from urllib.parse import urlparse, urlunparse
 
-import gi
-gi.require_version('Gtk', '4.0')
-# pylint: disable=wrong-import-position,wrong-import-order
-# (need to call require_version before we can import the other gi libraries, and we want
-# third-party libraries before local libraries)
-from gi.repository import Gtk  # noqa: E402 # need to call require_version before we can call this
+# Only what's needed to request the first state: GTK and the user interface are imported by main(),
+# while the request is in progress
+from apiclient import ApiClient, MAX_ARTWORK_BYTES
+from diskcache import default_cache_dir
+from engine import Engine
+from startupprofile import StartupProfile
+import screenblankbackend
+import screenblankmgr
+from serverstate import get_state_async
 
-gi.require_version('GLib', '2.0')
-from gi.repository import GLib  # noqa: E402 # need to call require_version before we can call this
-
-from apiclient import ApiClient  # noqa: E402  # local imports after libraries
-from artworkcache import ArtworkCache  # noqa: E402  # local imports after libraries
-from mainwindow import MainWindow  # noqa: E402  # local imports after libraries
-from nowplaying import NowPlaying  # noqa: E402  # local imports after libraries
-import screenblankmgr  # noqa: E402  # local imports after libraries
-# pylint: enable=wrong-import-position,wrong-import-order
-
-artwork_cache = ArtworkCache()
+# The steps timed by --startup-profile
+STARTUP_STEPS = ('imports done', 'GTK imported', 'first state received', 'window realized', 'first track shown')
 
 
 def construct_server_url(host):
@@ -71,8 +63,54 @@ def parse_args():
                                  help="Hide the mouse pointer over the window")
     mainwindowgroup.add_argument('--no-hide-mouse-pointer', action='store_false', dest='hide_mouse_pointer',
                                  help="Do not hide the mouse pointer (default)")
+    parser.add_argument('--artwork-cache-size', action='store', type=float, metavar='MB',
+                        help="Memory to use for caching recently displayed artwork (default %(default)s)")
+    parser.add_argument('--artwork-disk-cache', action='store', type=pathlib.Path, metavar='DIR',
+                        dest='artwork_disk_cache',
+                        help="Directory in which to keep artwork between restarts (default %(default)s)")
+    parser.add_argument('--no-artwork-disk-cache', action='store_const', const=None, dest='artwork_disk_cache',
+                        help="Do not keep artwork between restarts")
+    parser.add_argument('--artwork-disk-cache-size', action='store', type=float, metavar='MB',
+                        help="Disk space to use for artwork kept between restarts (default %(default)s)")
+    parser.add_argument('--max-artwork-size', action='store', type=float, metavar='MB',
+                        help="Abandon downloading any artwork larger than this (default %(default)s)")
+    parser.add_argument('--push-updates', action='store_true', dest='push_updates',
+                        help="Subscribe to state changes pushed by the server, falling back to polling "
+                             "if the server does not support it (default)")
+    parser.add_argument('--no-push-updates', action='store_false', dest='push_updates',
+                        help="Poll the server for state changes")
+    pollgroup = parser.add_argument_group('Polling options',
+                                          description='Options related to how often the server is polled, '
+                                                      'if it does not push updates')
+    pollgroup.add_argument('--poll-interval', action='store', type=float, metavar='SECONDS',
+                           help="Interval between polls while playing (default %(default)s)")
+    pollgroup.add_argument('--poll-interval-fast', action='store', type=float, metavar='SECONDS',
+                           help="Interval between polls after a button press or near the end of a track "
+                                "(default %(default)s)")
+    pollgroup.add_argument('--poll-interval-max', action='store', type=float, metavar='SECONDS',
+                           help="Longest interval between polls when backing off (default %(default)s)")
+    pollgroup.add_argument('--poll-backoff-after', action='store', type=float, metavar='SECONDS',
+                           help="Start backing off once the player has been stopped or paused, or the server "
+                                "unreachable, for this long (default %(default)s)")
+    pollgroup.add_argument('--poll-interval-dormant', action='store', type=float, metavar='SECONDS',
+                           help="Interval between polls once the screen has been blanked (default %(default)s)")
     parser.add_argument('--screenblanker-profile', action='store', choices=screenblankmgr.profiles.keys(),
                         help="Actively manage the screen blank based on playback state")
+    parser.add_argument('--screenblanker-backend', action='store', choices=screenblankbackend.backends,
+                        help="Control the screen blank directly through X11, or by running xset "
+                             "(default %(default)s, falling back to xset if X11 is not available)")
+    parser.add_argument('--metrics-port', action='store', type=int, metavar='PORT',
+                        help="Serve timings and counts of each stage of updating the screen, in the Prometheus "
+                             "text format, at http://localhost:PORT/metrics")
+    parser.add_argument('--metrics-log-interval', action='store', type=float, metavar='SECONDS',
+                        help="Log a summary of the timings and counts this often (default: never)")
+    parser.add_argument('--stall-threshold', action='store', type=float, metavar='SECONDS',
+                        help="Log the main loop's stack, and count a stall, if it is held up for longer than "
+                             "this, eg 0.25 (default: don't watch the main loop, as doing so wakes it several "
+                             "times a second)")
+    parser.add_argument('--startup-profile', action='store_true',
+                        help="Log how long after starting the imports were done, the first state was "
+                             "received, the window was realized and the first track was shown")
     parser.set_defaults(debug=False,
                         logfile=None,
                         host='localhost',
@@ -81,69 +119,46 @@ def parse_args():
                         fixed_layout=True,
                         show_close_button=True,
                         hide_mouse_pointer=False,
-                        screenblanker_profile='none')
+                        artwork_cache_size=8,
+                        artwork_disk_cache=pathlib.Path(default_cache_dir()),
+                        artwork_disk_cache_size=50,
+                        max_artwork_size=MAX_ARTWORK_BYTES / (1024 * 1024),
+                        push_updates=True,
+                        poll_interval=1,
+                        poll_interval_fast=0.25,
+                        poll_interval_max=30,
+                        poll_backoff_after=60,
+                        poll_interval_dormant=30,
+                        screenblanker_profile='none',
+                        screenblanker_backend='x11',
+                        metrics_port=None,
+                        metrics_log_interval=None,
+                        stall_threshold=None,
+                        startup_profile=False)
     args = parser.parse_args()
     args.host = construct_server_url(args.host)
     return args
 
 
-def get_current_track(apiclient: ApiClient, now_playing: NowPlaying):
-    status = apiclient.get_current_state()
-
-    current_track = status.current_track
-    artwork_cache.update(apiclient, status.current_artwork)
-
-    now_playing.refresh_countdown = 5
-    now_playing.is_track = bool(current_track)
-    now_playing.artist_name = current_track.get('artist')
-    now_playing.track_name = current_track.get('title')
-    now_playing.track_number = status.current_track_index
-    now_playing.album_tracks = status.maximum_track_index
-    now_playing.stream_name = status.current_stream
-    now_playing.current_state = status.status
-    now_playing.current_volume = status.volume
-    now_playing.image_uri = artwork_cache.current_image_uri
-    now_playing.image = artwork_cache.current_image
-
-    now_playing.scanning_active = status.scanning
-
-    return now_playing
-
-
-def update_track_display(apiclient: ApiClient, window: MainWindow, screenmgr: screenblankmgr.ScreenBlankMgr):
-    def update_window(now_playing):
-        window.show_now_playing(apiclient.connection_error, now_playing)
-        screenmgr.set_state(now_playing.current_state)
-
-    now_playing = NowPlaying()
-    while True:
-        get_current_track(apiclient, now_playing)
-        logging.debug(now_playing)
-        GLib.idle_add(update_window, now_playing)
-        time.sleep(1)
-
-
-def on_activate(app):
-    args = parse_args()
-    logging.basicConfig(level=logging.DEBUG if args.debug else logging.ERROR, filename=args.logfile)
-
-    apiclient = ApiClient(args.host)
-    window = MainWindow(app, apiclient,
-                        args.dark_mode, args.full_screen, args.fixed_layout, args.show_close_button,
-                        args.hide_mouse_pointer)
-    window.present()
-    screenmgr = screenblankmgr.ScreenBlankMgr(screenblankmgr.profiles[args.screenblanker_profile])
-
-    thread = threading.Thread(target=update_track_display, args=(apiclient, window, screenmgr), daemon=True)
-    thread.start()
-
-
 def main():
+    args = parse_args()
+    logging.basicConfig(level=logging.DEBUG if args.debug
+                        else logging.INFO if (args.metrics_log_interval or args.startup_profile)
+                        else logging.WARNING if args.stall_threshold
+                        else logging.ERROR, filename=args.logfile)
     logging.getLogger("urllib3").setLevel(logging.WARNING)
-
-    app = Gtk.Application()
-    app.connect('activate', on_activate)
-    app.run(None)
+    mark_startup = StartupProfile(STARTUP_STEPS).mark if args.startup_profile else (lambda step: None)
+    mark_startup('imports done')
+
+    # Get the current state while GTK and the user interface modules are imported, and the window is created
+    engine = Engine()
+    engine.start()
+    apiclient = ApiClient(args.host, max_artwork_bytes=int(args.max_artwork_size * 1024 * 1024))
+    first_state = engine.run(get_state_async(apiclient))
+
+    import application  # pylint: disable=import-outside-toplevel  # imports GTK: see above
+    mark_startup('GTK imported')
+    application.run(args, engine, apiclient, first_state, mark_startup)
 
 
 if __name__ == '__main__':
@@ -1,23 +1,25 @@
 import logging
 import os.path
+import time
 
 import gi
-import requests
 
-from nowplaying import NowPlaying
+from nowplaying import NowPlaying, changed_fields
 gi.require_version('Gtk', '4.0')
 # pylint: disable=wrong-import-position,wrong-import-order
 # (need to call require_version before we can import the other gi libraries, and we want
 # third-party libraries before local libraries)
 from gi.repository import Gtk  # noqa: E402 # need to call require_version before we can call this
 from gi.repository import Gdk  # noqa: E402 # need to call require_version before we can call this
-from gi.repository import GdkPixbuf  # noqa: E402 # need to call require_version before we can call this
 gi.require_version('Pango', '1.0')
 from gi.repository import Pango  # noqa: E402 # need to call require_version before we can call this
-gi.require_version('Rsvg', '2.0')
-from gi.repository import Rsvg  # noqa: E402 # need to call require_version before we can call this
 
 from apiclient import ApiClient  # noqa: E402 # libraries before local imports
+from artworkcache import ArtworkCache  # noqa: E402 # libraries before local imports
+from artworkdecoder import ArtworkDecoder  # noqa: E402 # libraries before local imports
+from commandqueue import CommandDispatcher  # noqa: E402 # libraries before local imports
+from iconregistry import icons  # noqa: E402 # libraries before local imports
+from metrics import metrics  # noqa: E402 # libraries before local imports
 # pylint: enable=wrong-import-position,wrong-import-order
 
 SCREEN_WIDTH = 800
@@ -26,23 +28,32 @@ SCREEN_HEIGHT = 480
 MAX_IMAGE_SIZE = 300
 
 
+def button_icon_size(window_width: int) -> int:
+    return 200 if (window_width > 1000) else 100
+
+
+def expected_button_icon_size(full_screen: bool):
+    """
+    The size of button icon that a window will use, before it has been created,
+    or None if that cannot be told (eg there is no display yet)
+    """
+    if not full_screen:
+        return button_icon_size(SCREEN_WIDTH)
+    display = Gdk.Display.get_default()
+    monitors = display.get_monitors() if display else None
+    if not monitors or monitors.get_n_items() == 0:
+        return None
+    return button_icon_size(monitors.get_item(0).get_geometry().width)
+
+
 def load_local_image(icon_name, dark_mode, icon_size) -> Gtk.Image:
     '''
     icon_name is the base name of the image to load
     dark_mode is True ("-dark"), False ("-light") or None ("")
     icon_size is an int or None
+    The image shares its texture with every other image of the same icon.
     '''
-    leafname = icon_name
-    if dark_mode is True:
-        leafname += '-dark'
-    elif dark_mode is False:
-        leafname += '-light'
-    if icon_size:
-        leafname += f'_{icon_size}'
-    leafname += '.png'
-    icon_filename = os.path.join(os.path.dirname(__file__), os.path.pardir, 'icons', leafname)
-    assert os.path.exists(icon_filename), f'{icon_filename} not found'
-    return Gtk.Image.new_from_file(icon_filename)
+    return icons.image(icon_name, dark_mode, icon_size)
 
 
 def set_font(label, weight, font_size, colour):
@@ -72,33 +83,6 @@ def mk_label(justification=Gtk.Justification.CENTER,
     return label
 
 
-def pixbuf_from_svg_uri(image_uri: str) -> GdkPixbuf.Pixbuf:
-    logging.debug(f"Loading SVG from {image_uri}")
-    try:
-        response = requests.get(image_uri, timeout=3)
-    except requests.exceptions.RequestException:
-        return None
-    if not response.ok:
-        return None
-    rsvg = Rsvg.Handle.new_from_data(response.content)
-    pixbuf = rsvg.get_pixbuf()
-    return pixbuf
-
-
-def pixbuf_from_image_bytes(image: str) -> GdkPixbuf.Pixbuf:
-    loader = GdkPixbuf.PixbufLoader()
-    try:
-        loader.write(image)
-    except gi.repository.GLib.GError as exc:
-        logging.error(f"Error loading image into pixbuf: {exc}")
-        return None
-    if not loader.close():
-        logging.error("Image data could not be parsed")
-        return None
-    pixbuf = loader.get_pixbuf()
-    return pixbuf
-
-
 class MainWindow(Gtk.ApplicationWindow):
     """
     Main application window
@@ -107,6 +91,8 @@ class MainWindow(Gtk.ApplicationWindow):
     def __init__(self,
                  application: Gtk.Application,
                  apiclient: ApiClient,
+                 commands: CommandDispatcher,
+                 artwork_cache: ArtworkCache,
                  dark_mode: bool,
                  full_screen: bool,
                  fixed_layout: bool,
@@ -120,6 +106,7 @@ class MainWindow(Gtk.ApplicationWindow):
 
         self.connect("destroy", self.on_quit)
         self.apiclient = apiclient
+        self.commands = commands
         if full_screen:
             self.fullscreen()
         else:
@@ -133,6 +120,14 @@ class MainWindow(Gtk.ApplicationWindow):
         self.pause_icon = None
 
         self.current_image_uri = None
+        self.artwork_decoder = ArtworkDecoder(artwork_cache, MAX_IMAGE_SIZE)
+        self.displayed_connection_error = None
+        self.displayed_now_playing = None
+        self.server_connection_error = None
+        self.server_now_playing = None
+        self.server_update_held = False
+        self.awaiting_confirmation = None  # time the button was tapped for the last successful command
+        self.displayed_at = None  # time of the last display(), until the window has been painted
 
         self.artwork = Gtk.Image()
         self.artwork.set_hexpand(False)
@@ -245,15 +240,65 @@ class MainWindow(Gtk.ApplicationWindow):
         self.hide_mouse_pointer = hide_mouse_pointer
         self.connect('realize', self.on_realized)
 
+        self.input_listeners = []  # called on every press or touch, eg to wake the screen
+        input_controller = Gtk.EventControllerLegacy()
+        input_controller.connect('event', self.on_input_event)
+        self.add_controller(input_controller)
+
+    def on_input_event(self, _controller, event):
+        if event.get_event_type() in (Gdk.EventType.BUTTON_PRESS, Gdk.EventType.TOUCH_BEGIN,
+                                      Gdk.EventType.KEY_PRESS):
+            for listener in self.input_listeners:
+                listener()
+        return False  # let the event through to the widgets
+
     def on_next(self, *_):
-        self.apiclient.next()
+        self.skip(+1, "skip to next track", self.apiclient.next)
 
     def on_play_pause(self, *_):
-        if self.play_pause_action:
-            self.play_pause_action()
+        if not self.play_pause_action:
+            return
+        tapped_at = time.perf_counter()
+        action = self.play_pause_action
+        if self.displayed_connection_error is False:
+            optimistic = self.displayed_now_playing._replace(
+                current_state='paused' if (action == self.apiclient.pause) else 'playing')
+            self.show_optimistic(optimistic, tapped_at)
+        self.send_command("pause" if (action == self.apiclient.pause) else "resume", action, tapped_at)
 
     def on_previous(self, *_):
-        self.apiclient.previous()
+        self.skip(-1, "skip to previous track", self.apiclient.previous)
+
+    def skip(self, delta: int, description: str, command):
+        tapped_at = time.perf_counter()
+        if self.displayed_connection_error is False and self.displayed_now_playing.track_number:
+            # Only the buttons can be updated until the server reports the new track
+            optimistic = self.displayed_now_playing._replace(
+                track_number=self.displayed_now_playing.track_number + delta)
+            self.show_optimistic(optimistic, tapped_at)
+        self.send_command(description, command, tapped_at)
+
+    def show_optimistic(self, now_playing: NowPlaying, tapped_at: float):
+        """
+        Show the expected result of a command before the server has confirmed it
+        """
+        self.display(False, now_playing)
+        self.commands.latency.record('tap to feedback', time.perf_counter() - tapped_at)
+
+    def send_command(self, description: str, command, tapped_at: float):
+        self.commands.submit(description, command, lambda success: self.on_command_done(success, tapped_at))
+
+    def on_command_done(self, success: bool, tapped_at: float):
+        if success:
+            self.awaiting_confirmation = tapped_at
+        if self.commands.in_flight:
+            return
+        if self.server_update_held or not success:
+            # Show what the server last told us: the result of the commands,
+            # or, if one failed, undo its optimistic update
+            self.server_update_held = False
+            if self.server_connection_error is not None:
+                self.show_now_playing(self.server_connection_error, self.server_now_playing)
 
     def on_quit(self, *_):
         Gtk.main_quit()
@@ -263,7 +308,8 @@ class MainWindow(Gtk.ApplicationWindow):
             self.set_cursor(Gdk.Cursor.new_from_name('none', None))
         logging.debug("Main window realized: allocated size %ux%u",
                       self.get_allocated_width(), self.get_allocated_height())
-        icon_size = 200 if (self.get_allocated_width() > 1000) else 100
+        self.get_frame_clock().connect('after-paint', self.on_after_paint)
+        icon_size = button_icon_size(self.get_allocated_width())
         self.pause_icon = load_local_image('pause', self.dark_mode, icon_size)
         self.pause_icon.set_parent(self.play_pause_button)
         self.play_icon = load_local_image('play', self.dark_mode, icon_size)
@@ -272,6 +318,14 @@ class MainWindow(Gtk.ApplicationWindow):
         prev_icon.set_parent(self.prev_button)
         next_icon = load_local_image('forward', self.dark_mode, icon_size)
         next_icon.set_parent(self.next_button)
+        if self.displayed_connection_error is not None:
+            # Anything shown before now didn't have the icons available
+            self.redisplay()
+
+    def on_after_paint(self, *_):
+        if self.displayed_at is not None:
+            metrics.observe('layout and paint', time.perf_counter() - self.displayed_at)
+            self.displayed_at = None
 
     def show_connection_error(self):
         self.artist_label.hide()
@@ -280,8 +334,9 @@ class MainWindow(Gtk.ApplicationWindow):
         self.no_track_label.show()
         self.no_track_label.set_label("Connection error")
         self.scanning_indicator_icon.hide()
-        self.play_icon.set_visible(True)
-        self.pause_icon.set_visible(False)
+        if self.play_icon:
+            self.play_icon.set_visible(True)
+            self.pause_icon.set_visible(False)
         self.prev_button.set_sensitive(False)
         self.play_pause_button.set_sensitive(False)
         self.next_button.set_sensitive(False)
@@ -304,32 +359,6 @@ class MainWindow(Gtk.ApplicationWindow):
             self.no_track_label.set_label('No track')
             self.no_track_label.show()
 
-    def show_now_playing_image_inner(self, now_playing: NowPlaying):
-        """
-        Returns True if successful
-        """
-        if not now_playing.image:
-            return False
-        if now_playing.image_uri.endswith('.svg'):
-            pixbuf = pixbuf_from_svg_uri(now_playing.image_uri)
-        else:
-            pixbuf = pixbuf_from_image_bytes(now_playing.image)
-        if not pixbuf:
-            return False
-        width = pixbuf.get_width()
-        height = pixbuf.get_height()
-        if (width > MAX_IMAGE_SIZE) or (height > MAX_IMAGE_SIZE):
-            if width > height:
-                dest_width = MAX_IMAGE_SIZE
-                dest_height = height * dest_width / width
-            else:
-                dest_height = MAX_IMAGE_SIZE
-                dest_width = width * dest_height / height
-            pixbuf = pixbuf.scale_simple(dest_width, dest_height, GdkPixbuf.InterpType.BILINEAR)
-        self.artwork.set_from_pixbuf(pixbuf)
-        self.artwork.show()
-        return True
-
     def show_now_playing_image(self, now_playing: NowPlaying):
         logging.debug(f"show_now_playing_image: {now_playing.image_uri}")
         if now_playing.image_uri == self.current_image_uri:
@@ -337,10 +366,21 @@ class MainWindow(Gtk.ApplicationWindow):
             if now_playing.image:
                 self.artwork.show()
             return
-        logging.debug("Updating image display")
-        if not self.show_now_playing_image_inner(now_playing):
-            self.artwork.hide()
         self.current_image_uri = now_playing.image_uri
+        if not now_playing.image:
+            self.artwork_decoder.cancel()
+            self.artwork.hide()
+            return
+        # The previous artwork stays on screen until the new one has been decoded
+        logging.debug("Decoding new image for display")
+        self.artwork_decoder.request(now_playing.image_uri, now_playing.image, self.on_artwork_decoded)
+
+    def on_artwork_decoded(self, texture):
+        if texture:
+            self.artwork.set_from_paintable(texture)
+            self.artwork.show()
+        else:
+            self.artwork.hide()
 
     def show_now_playing_play_pause_icon(self, now_playing: NowPlaying):
         if now_playing.current_state == 'stopped':
@@ -372,13 +412,60 @@ class MainWindow(Gtk.ApplicationWindow):
                                        and (now_playing.track_number < now_playing.album_tracks))
 
     def show_now_playing(self, connection_error: bool, now_playing: NowPlaying):
-        if connection_error:
-            self.show_connection_error()
+        """
+        Show the state reported by the server. While commands are still being
+        sent, this is held back, so that an optimistic update isn't briefly
+        undone by a state from before the command took effect.
+        """
+        self.server_connection_error = connection_error
+        self.server_now_playing = now_playing
+        if self.commands.in_flight:
+            self.server_update_held = True
+            metrics.increment('update held')
             return
+        if self.awaiting_confirmation is not None:
+            self.commands.latency.record('tap to confirmed', time.perf_counter() - self.awaiting_confirmation)
+            self.awaiting_confirmation = None
+        self.display(connection_error, now_playing)
 
-        self.show_now_playing_artist_and_track(now_playing)
-        self.show_now_playing_image(now_playing)
-        self.show_now_playing_play_pause_icon(now_playing)
-        self.show_now_playing_prev_next(now_playing)
-
-        self.scanning_indicator_icon.set_visible(now_playing.scanning_active)
+    def display(self, connection_error: bool, now_playing: NowPlaying):
+        """
+        Only the widgets affected by fields that differ from what is currently displayed are updated
+        """
+        with metrics.time('display'):
+            if connection_error:
+                if not self.displayed_connection_error:
+                    self.show_connection_error()
+                self.displayed_connection_error = True
+                self.displayed_at = time.perf_counter()
+                return
+
+            if self.displayed_connection_error is False:
+                changed = changed_fields(self.displayed_now_playing, now_playing)
+            else:
+                changed = changed_fields(None, now_playing)
+            self.displayed_connection_error = False
+            self.displayed_now_playing = now_playing
+
+            if changed & {'is_track', 'artist_name', 'track_name', 'stream_name'}:
+                self.show_now_playing_artist_and_track(now_playing)
+            if changed & {'image_uri', 'image'}:
+                self.show_now_playing_image(now_playing)
+            else:
+                logging.debug("show_now_playing_image: %s unchanged", now_playing.image_uri)
+            if 'current_state' in changed:
+                self.show_now_playing_play_pause_icon(now_playing)
+            if changed & {'track_number', 'album_tracks'}:
+                self.show_now_playing_prev_next(now_playing)
+            if 'scanning_active' in changed:
+                self.scanning_indicator_icon.set_visible(now_playing.scanning_active)
+        self.displayed_at = time.perf_counter()
+
+    def redisplay(self):
+        """
+        Update every widget from the last state shown
+        """
+        connection_error, now_playing = self.displayed_connection_error, self.displayed_now_playing
+        self.displayed_connection_error = None
+        self.displayed_now_playing = None
+        self.display(connection_error, now_playing)
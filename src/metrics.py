@@ -0,0 +1,137 @@
+import bisect
+import threading
+import time
+
+# Upper bounds of the histogram buckets, in seconds
+BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+
+PROMETHEUS_PREFIX = 'piju_touchscreen'
+PROMETHEUS_CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+
+class Histogram:
+    __slots__ = ('counts', 'count', 'total', 'maximum')
+
+    def __init__(self):
+        self.counts = [0] * (len(BUCKETS) + 1)  # the last is for anything longer than BUCKETS[-1]
+        self.count = 0
+        self.total = 0.0
+        self.maximum = 0.0
+
+    def observe(self, seconds: float):
+        self.counts[bisect.bisect_left(BUCKETS, seconds)] += 1
+        self.count += 1
+        self.total += seconds
+        self.maximum = max(self.maximum, seconds)
+
+    def quantile(self, fraction: float):
+        """
+        Returns the upper bound of the bucket containing the given fraction of
+        observations, or the maximum, if that's smaller
+        """
+        wanted = fraction * self.count
+        seen = 0
+        for bound, count in zip(BUCKETS, self.counts):
+            seen += count
+            if seen >= wanted:
+                return min(bound, self.maximum)
+        return self.maximum
+
+    def copy(self):
+        histogram = Histogram()
+        histogram.counts = list(self.counts)
+        histogram.count = self.count
+        histogram.total = self.total
+        histogram.maximum = self.maximum
+        return histogram
+
+
+class Timer:
+    """
+    Context manager that records the time taken by its body
+    """
+    __slots__ = ('metrics', 'stage', 'start')
+
+    def __init__(self, metrics, stage: str):
+        self.metrics = metrics
+        self.stage = stage
+        self.start = None
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *_):
+        self.metrics.observe(self.stage, time.perf_counter() - self.start)
+
+
+class Metrics:
+    """
+    Timings of each stage of getting the server's state onto the screen, as
+    histograms, and counts of events of interest (eg connection errors, cache
+    hits). Stages and events are created by being recorded.
+    Safe to use from multiple threads.
+    """
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.histograms = {}  # stage -> Histogram
+        self.counters = {}  # event -> count
+
+    def observe(self, stage: str, seconds: float):
+        with self.lock:
+            if (histogram := self.histograms.get(stage)) is None:
+                histogram = self.histograms[stage] = Histogram()
+            histogram.observe(seconds)
+
+    def time(self, stage: str) -> Timer:
+        return Timer(self, stage)
+
+    def increment(self, event: str, amount: int = 1):
+        with self.lock:
+            self.counters[event] = self.counters.get(event, 0) + amount
+
+    def snapshot(self):
+        """
+        Returns copies of ({stage: Histogram}, {event: count})
+        """
+        with self.lock:
+            return {stage: histogram.copy() for stage, histogram in self.histograms.items()}, dict(self.counters)
+
+    def prometheus_text(self) -> str:
+        histograms, counters = self.snapshot()
+        lines = [f"# HELP {PROMETHEUS_PREFIX}_stage_seconds Time taken by each stage of getting the server's state "
+                 "onto the screen",
+                 f"# TYPE {PROMETHEUS_PREFIX}_stage_seconds histogram"]
+        for stage, histogram in sorted(histograms.items()):
+            label = f'stage="{escape_label(stage)}"'
+            cumulative = 0
+            for bound, count in zip(BUCKETS, histogram.counts):
+                cumulative += count
+                lines.append(f'{PROMETHEUS_PREFIX}_stage_seconds_bucket{{{label},le="{bound}"}} {cumulative}')
+            lines.append(f'{PROMETHEUS_PREFIX}_stage_seconds_bucket{{{label},le="+Inf"}} {histogram.count}')
+            lines.append(f'{PROMETHEUS_PREFIX}_stage_seconds_sum{{{label}}} {histogram.total}')
+            lines.append(f'{PROMETHEUS_PREFIX}_stage_seconds_count{{{label}}} {histogram.count}')
+        lines += [f"# HELP {PROMETHEUS_PREFIX}_events_total Number of times each event has happened",
+                  f"# TYPE {PROMETHEUS_PREFIX}_events_total counter"]
+        for event, count in sorted(counters.items()):
+            lines.append(f'{PROMETHEUS_PREFIX}_events_total{{event="{escape_label(event)}"}} {count}')
+        return '\n'.join(lines) + '\n'
+
+    def summary(self) -> str:
+        """
+        A one-line summary, for logging
+        """
+        histograms, counters = self.snapshot()
+        stages = [f"{stage} n={histogram.count} mean={histogram.total / histogram.count * 1000:.1f}ms "
+                  f"p95<={histogram.quantile(0.95) * 1000:.1f}ms max={histogram.maximum * 1000:.1f}ms"
+                  for stage, histogram in sorted(histograms.items())]
+        events = [f"{event}={count}" for event, count in sorted(counters.items())]
+        return "Metrics: " + "; ".join(stages + events)
+
+
+def escape_label(value: str) -> str:
+    return value.replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+# The metrics recorded throughout the application
+metrics = Metrics()
@@ -0,0 +1,49 @@
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import logging
+import threading
+
+from metrics import metrics, Metrics, PROMETHEUS_CONTENT_TYPE
+
+
+class MetricsRequestHandler(BaseHTTPRequestHandler):
+    def do_GET(self):  # pylint: disable=invalid-name
+        if self.path.split('?', 1)[0] != '/metrics':
+            self.send_error(404)
+            return
+        body = self.server.metrics.prometheus_text().encode('utf-8')
+        self.send_response(200)
+        self.send_header('Content-Type', PROMETHEUS_CONTENT_TYPE)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):  # pylint: disable=redefined-builtin
+        pass
+
+
+class MetricsServer(ThreadingHTTPServer):
+    """
+    Serves the metrics in the Prometheus text format, at /metrics, on a thread of its own
+    """
+    daemon_threads = True
+
+    def __init__(self, port: int, address: str = '127.0.0.1', metrics_to_serve: Metrics = None):
+        super().__init__((address, port), MetricsRequestHandler)
+        self.metrics = metrics_to_serve if metrics_to_serve else metrics
+
+    @classmethod
+    def start(cls, port: int, address: str = '127.0.0.1', metrics_to_serve: Metrics = None):
+        """
+        Returns the running server, or None if it could not be started
+        """
+        try:
+            server = cls(port, address, metrics_to_serve)
+        except OSError as exc:
+            logging.error(f"Unable to serve metrics on port {port}: {exc}")
+            return None
+        threading.Thread(target=server.serve_forever, name='metrics', daemon=True).start()
+        return server
+
+    def stop(self):
+        self.shutdown()
+        self.server_close()
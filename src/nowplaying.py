@@ -1,22 +1,25 @@
+from collections import namedtuple
 
-class NowPlaying:
-    def __init__(self):
-        self.refresh_countdown = 0
-        self.artist_name = None
-        self.is_track = None
-        self.track_name = None
-        self.track_number = None
-        self.album_tracks = None
-        self.stream_name = None
-        self.current_state = None
-        self.current_volume = None
-        self.image_uri = None
-        self.image = None
-        self.scanning_active = None
+
+# The fields that affect what is shown on screen
+DISPLAYED_FIELDS = ('artist_name', 'is_track', 'track_name', 'track_number', 'album_tracks', 'stream_name',
+                    'current_state', 'image_uri', 'image', 'scanning_active')
+
+
+class NowPlaying(namedtuple('NowPlaying', 'artist_name, is_track, track_name, track_number, album_tracks, '
+                                          'stream_name, current_state, current_volume, image_uri, image, '
+                                          'scanning_active',
+                            defaults=(None,) * 11)):
+    """
+    An immutable snapshot of what is playing, so can be handed from one thread
+    to another as it is. Use _replace() to make a changed snapshot: the artwork
+    bytes (image) are shared, not copied.
+    """
+    __slots__ = ()
 
     def __str__(self):
+        # not the artwork bytes
         return ('NowPlaying('
-                f'{self.refresh_countdown}, '
                 f'{self.artist_name}, '
                 f'{self.is_track}, '
                 f'{self.track_name}, '
@@ -27,3 +30,25 @@ class NowPlaying:
                 f'{self.current_volume}, '
                 f'{self.image_uri}, '
                 f'{self.scanning_active})')
+
+    __repr__ = __str__
+
+
+def changed_fields(old: NowPlaying, new: NowPlaying) -> set:
+    """
+    Returns the names of the displayed fields that differ between old and new.
+    old may be None, meaning that nothing has been displayed yet.
+    """
+    if old is None:
+        return set(DISPLAYED_FIELDS)
+    if old == new:
+        # tuple comparison checks identity first, so the artwork bytes are not compared if they're the same object
+        return set()
+    changed = set()
+    for field in DISPLAYED_FIELDS:
+        old_value = getattr(old, field)
+        new_value = getattr(new, field)
+        # the identity check avoids comparing artwork bytes: the cache returns the same object if unchanged
+        if (old_value is not new_value) and (old_value != new_value):
+            changed.add(field)
+    return changed
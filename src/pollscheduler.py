@@ -0,0 +1,130 @@
+import asyncio
+import logging
+import threading
+import time
+
+from apiclient import CurrentStatus
+
+
+class PollScheduler:
+    """
+    Decides how long to wait before the next poll of the server:
+
+    * fast_interval for a few seconds after a button press, and around the expected
+      end of the current track
+    * interval while playing, and initially after any other change
+    * doubling on every poll, up to max_interval, once the player has been stopped or
+      paused, or the server unreachable, for backoff_after seconds
+    * dormant_interval while dormant (the screen is blanked)
+    """
+    FAST_DURATION = 3  # seconds after expedite() during which to poll quickly
+
+    def __init__(self,
+                 interval: float = 1,
+                 fast_interval: float = 0.25,
+                 max_interval: float = 30,
+                 backoff_after: float = 60,
+                 dormant_interval: float = 30,
+                 clock=time.monotonic):
+        self.interval = interval
+        self.fast_interval = fast_interval
+        self.max_interval = max_interval
+        self.backoff_after = backoff_after
+        self.dormant_interval = dormant_interval
+        self.dormant = False
+        self.clock = clock
+        self.wake_event = threading.Event()
+        self.loop = None  # the event loop for wait_async
+        self.async_wake_event = None
+        self.fast_until = None
+        self.state = None  # 'playing', 'paused', 'stopped' or None for a connection error
+        self.state_since = clock()
+        self.track = None
+        self.track_started = None  # only set if we saw the track start
+        self.backoff_interval = interval
+
+    def expedite(self):
+        """
+        Poll now, and quickly for a few seconds, because the state is expected to change
+        (eg a button has just been pressed). May be called from any thread.
+        """
+        self.fast_until = self.clock() + self.FAST_DURATION
+        self._wake()
+
+    def set_dormant(self, dormant: bool):
+        """
+        Nobody can see the display while dormant, so there's no hurry to poll.
+        Leaving dormancy polls straight away. May be called from any thread.
+        """
+        self.dormant = dormant
+        if not dormant:
+            self._wake()
+
+    def _wake(self):
+        self.wake_event.set()
+        if self.loop:
+            self.loop.call_soon_threadsafe(self.async_wake_event.set)
+
+    def observe(self, status: CurrentStatus, connection_error: bool):
+        now = self.clock()
+        state = None if connection_error else status.status
+        if state != self.state:
+            self.state = state
+            self.state_since = now
+            self.backoff_interval = self.interval
+            if state != 'playing':
+                self.track_started = None
+        if status.current_track != self.track:
+            self.track_started = now if (self.track is not None and state == 'playing') else None
+            self.track = status.current_track
+            self.backoff_interval = self.interval
+
+    def _remaining_track_time(self, now):
+        if self.state != 'playing' or self.track_started is None:
+            return None
+        duration = self.track.get('duration')
+        if not isinstance(duration, (int, float)):
+            return None
+        return self.track_started + duration - now
+
+    def next_interval(self) -> float:
+        now = self.clock()
+        if self.fast_until is not None and now < self.fast_until:
+            return self.fast_interval
+        if self.dormant:
+            return self.dormant_interval
+        remaining = self._remaining_track_time(now)
+        if remaining is not None:
+            if -self.interval < remaining <= self.interval:
+                # the track is about to change
+                return self.fast_interval
+            return self.interval
+        if self.state != 'playing' and (now - self.state_since) >= self.backoff_after:
+            interval = self.backoff_interval
+            self.backoff_interval = min(self.backoff_interval * 2, self.max_interval)
+            return interval
+        return self.interval
+
+    def wait(self):
+        """
+        Sleep until the next poll is due, or until expedite() is called
+        """
+        interval = self.next_interval()
+        logging.debug("Next poll in %.2fs", interval)
+        self.wake_event.wait(interval)
+        self.wake_event.clear()
+
+    async def wait_async(self):
+        """
+        As wait(), but without blocking the event loop
+        """
+        if self.loop is None:
+            self.loop = asyncio.get_running_loop()
+            self.async_wake_event = asyncio.Event()
+        interval = self.next_interval()
+        logging.debug("Next poll in %.2fs", interval)
+        try:
+            await asyncio.wait_for(self.async_wake_event.wait(), interval)
+        except asyncio.TimeoutError:
+            pass
+        self.async_wake_event.clear()
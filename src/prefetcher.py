@@ -0,0 +1,75 @@
+import logging
+
+from apiclient import ApiClient, CurrentStatus
+from artworkcache import ArtworkCache
+from backgroundworker import Job, LatestJobWorker
+
+PREFETCH_NICENESS = 10
+
+
+class ArtworkPrefetcher:
+    """
+    Fetches (and, given a predecode function, decodes) the artwork for the tracks
+    either side of the current track into the artwork cache, on a low-priority
+    background thread, so that it can be shown immediately on skipping.
+
+    The neighbouring tracks are found from the tracklist (album or playlist) that
+    is being played, which is expected to have a list of 'tracks', each of which
+    is either a track object or the uri of one. A track's 'artwork' is the same
+    kind of uri as the status' CurrentArtwork.
+    """
+    def __init__(self, apiclient: ApiClient, artwork_cache: ArtworkCache, predecode=None):
+        """
+        predecode(job, image_uri, image), if given, is called on the prefetch thread
+        """
+        self.apiclient = apiclient
+        self.artwork_cache = artwork_cache
+        self.predecode = predecode
+        self.worker = LatestJobWorker('artwork-prefetch', niceness=PREFETCH_NICENESS)
+        self.last_request = None
+        self.tracklist_uri = None
+        self.tracks = None
+        self.prefetched = 0
+
+    def on_status(self, status: CurrentStatus):
+        """
+        Called with each new status; does nothing unless the current track has changed
+        """
+        if not status.current_tracklist or not status.current_track_index:
+            return
+        request = (status.current_tracklist, status.current_track_index)
+        if request == self.last_request:
+            return
+        self.last_request = request
+        self.worker.submit(self._on_done, self._prefetch, status.current_tracklist, status.current_track_index)
+
+    def _on_done(self, job: Job, count: int):
+        logging.debug("Prefetched artwork for %u tracks", count)
+
+    def _get_tracks(self, tracklist_uri):
+        if tracklist_uri != self.tracklist_uri:
+            tracklist = self.apiclient.get_json(tracklist_uri)
+            self.tracks = tracklist.get('tracks', []) if isinstance(tracklist, dict) else None
+            self.tracklist_uri = tracklist_uri if self.tracks is not None else None
+        return self.tracks or []
+
+    def _prefetch(self, job: Job, tracklist_uri: str, track_index: int):
+        tracks = self._get_tracks(tracklist_uri)
+        count = 0
+        # track_index is 1-based; the next track is the most likely to be wanted
+        for neighbour in (track_index + 1, track_index - 1):
+            if job.cancelled:
+                break
+            if not 1 <= neighbour <= len(tracks):
+                continue
+            track = tracks[neighbour - 1]
+            if isinstance(track, str):
+                track = self.apiclient.get_json(track)
+            if not isinstance(track, dict) or not (artwork_uri := track.get('artwork')):
+                continue
+            image = self.artwork_cache.update_inner(self.apiclient, artwork_uri)
+            if image and self.predecode and not job.cancelled:
+                self.predecode(job, artwork_uri, image)
+            count += 1
+        self.prefetched += count
+        return count
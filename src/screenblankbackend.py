@@ -0,0 +1,244 @@
+import ctypes
+import ctypes.util
+import logging
+import subprocess
+import threading
+import time
+
+# XForceScreenSaver modes
+SCREEN_SAVER_RESET = 0
+SCREEN_SAVER_ACTIVE = 1
+
+# XSetScreenSaver timeout meaning 'the server default'
+SERVER_DEFAULT_TIMEOUT = -1
+
+DPMS_MODE_ON = 0
+
+
+class XsetBackend:
+    """
+    Controls the screen saver by running xset, as `xset s ...`
+    """
+    name = 'xset'
+
+    def set_timeout(self, timeout: int):
+        self.perform([('set_timeout', (timeout,))])
+
+    def enable(self):
+        self.perform([('enable', ())])
+
+    def disable(self):
+        self.perform([('disable', ())])
+
+    def reset(self):
+        self.perform([('reset', ())])
+
+    def activate(self):
+        self.perform([('activate', ())])
+
+    def perform(self, actions):
+        """
+        Carry out a list of (method name, args), with a single xset process
+        """
+        s_args = {'enable': 'on', 'disable': 'off', 'reset': 'reset', 'activate': 'activate'}
+        cmd = ['xset']
+        for name, args in actions:
+            cmd += ['s', str(args[0]) if name == 'set_timeout' else s_args[name]]
+        logging.debug(cmd)
+        try:
+            subprocess.run(cmd, check=False)  # Although it's not ideal if it fails, raising an Exception won't help
+        except OSError as exc:
+            logging.error(f"Unable to run xset: {exc}")
+
+
+class X11Backend:
+    """
+    Controls the screen saver (and wakes the display from DPMS power saving)
+    through libX11 and libXext, on a connection to the X server that is kept
+    open, so nothing needs to be spawned. Does the same as the corresponding
+    xset commands.
+
+    Use open() to create one: it returns None if the libraries or the display
+    are not available.
+    """
+    name = 'x11'
+
+    def __init__(self, xlib, xext, display):
+        self.xlib = xlib
+        self.xext = xext
+        self.display = display
+        self.dpms = bool(xext and xext.DPMSCapable(display))
+
+    @classmethod
+    def open(cls, display_name: str = None):
+        xlib_path = ctypes.util.find_library('X11')
+        if not xlib_path:
+            logging.info("libX11 not found")
+            return None
+        try:
+            xlib = ctypes.cdll.LoadLibrary(xlib_path)
+        except OSError as exc:
+            logging.info(f"Unable to load libX11: {exc}")
+            return None
+        xlib.XOpenDisplay.argtypes = [ctypes.c_char_p]
+        xlib.XOpenDisplay.restype = ctypes.c_void_p
+        xlib.XSetScreenSaver.argtypes = [ctypes.c_void_p, ctypes.c_int, ctypes.c_int, ctypes.c_int, ctypes.c_int]
+        xlib.XGetScreenSaver.argtypes = [ctypes.c_void_p] + [ctypes.POINTER(ctypes.c_int)] * 4
+        xlib.XForceScreenSaver.argtypes = [ctypes.c_void_p, ctypes.c_int]
+        xlib.XFlush.argtypes = [ctypes.c_void_p]
+        xlib.XCloseDisplay.argtypes = [ctypes.c_void_p]
+        display = xlib.XOpenDisplay(display_name.encode() if display_name else None)
+        if not display:
+            logging.info("Unable to open the X display")
+            return None
+        xext = None
+        if xext_path := ctypes.util.find_library('Xext'):
+            try:
+                xext = ctypes.cdll.LoadLibrary(xext_path)
+                xext.DPMSCapable.argtypes = [ctypes.c_void_p]
+                xext.DPMSInfo.argtypes = [ctypes.c_void_p, ctypes.POINTER(ctypes.c_ushort),
+                                          ctypes.POINTER(ctypes.c_ubyte)]
+                xext.DPMSForceLevel.argtypes = [ctypes.c_void_p, ctypes.c_ushort]
+            except (OSError, AttributeError) as exc:
+                logging.info(f"DPMS not available: {exc}")
+                xext = None
+        return cls(xlib, xext, display)
+
+    def close(self):
+        if self.display:
+            self.xlib.XCloseDisplay(self.display)
+            self.display = None
+
+    def _get_screen_saver(self):
+        values = [ctypes.c_int() for _ in range(4)]
+        self.xlib.XGetScreenSaver(self.display, *[ctypes.byref(value) for value in values])
+        return [value.value for value in values]  # timeout, interval, prefer_blanking, allow_exposures
+
+    def _set_screen_saver_timeout(self, timeout: int):
+        _, interval, prefer_blanking, allow_exposures = self._get_screen_saver()
+        self.xlib.XSetScreenSaver(self.display, timeout, interval, prefer_blanking, allow_exposures)
+        self.xlib.XFlush(self.display)
+
+    def set_timeout(self, timeout: int):
+        logging.debug("XSetScreenSaver timeout=%d", timeout)
+        self._set_screen_saver_timeout(timeout)
+
+    def enable(self):
+        logging.debug("XSetScreenSaver timeout=default")
+        self._set_screen_saver_timeout(SERVER_DEFAULT_TIMEOUT)
+
+    def disable(self):
+        logging.debug("XSetScreenSaver timeout=0")
+        self._set_screen_saver_timeout(0)
+
+    def reset(self):
+        logging.debug("XForceScreenSaver reset")
+        self.xlib.XForceScreenSaver(self.display, SCREEN_SAVER_RESET)
+        if self.dpms:
+            power_level = ctypes.c_ushort()
+            enabled = ctypes.c_ubyte()
+            self.xext.DPMSInfo(self.display, ctypes.byref(power_level), ctypes.byref(enabled))
+            # forcing the level is an error (fatal, by default) unless DPMS is enabled
+            if enabled.value and power_level.value != DPMS_MODE_ON:
+                self.xext.DPMSForceLevel(self.display, DPMS_MODE_ON)
+        self.xlib.XFlush(self.display)
+
+    def activate(self):
+        logging.debug("XForceScreenSaver activate")
+        self.xlib.XForceScreenSaver(self.display, SCREEN_SAVER_ACTIVE)
+        self.xlib.XFlush(self.display)
+
+    def perform(self, actions):
+        """
+        Carry out a list of (method name, args)
+        """
+        for name, args in actions:
+            getattr(self, name)(*args)
+
+
+def coalesce(actions):
+    """
+    Reduce a list of (method name, args) to the ones that affect the end
+    result: the last change to the timeout, followed by the last reset or
+    activation of the screen saver
+    """
+    last_timeout = None
+    last_force = None
+    for action in actions:
+        if action[0] in ('set_timeout', 'enable', 'disable'):
+            last_timeout = action
+        else:
+            last_force = action
+    return [action for action in (last_timeout, last_force) if action]
+
+
+class ScreenBlankExecutor:
+    """
+    Carries out screen blank actions for a backend on a dedicated thread, so
+    that the caller (the GTK main thread) never waits for them. Actions are
+    collected until flush() is called, and then performed together, reduced
+    to the ones that affect the end result; if the thread is still busy with
+    earlier actions, those still waiting are merged with the new ones.
+    """
+    def __init__(self, backend):
+        self.backend = backend
+        self.condition = threading.Condition()
+        self.requested = []  # actions not yet flushed
+        self.pending = []  # actions flushed, waiting for the thread
+        self.batches = 0
+        self.actions_requested = 0
+        self.actions_performed = 0
+        self.thread = threading.Thread(target=self._run, name='screen-blank', daemon=True)
+        self.thread.start()
+
+    def set_timeout(self, timeout: int):
+        self.requested.append(('set_timeout', (timeout,)))
+
+    def enable(self):
+        self.requested.append(('enable', ()))
+
+    def disable(self):
+        self.requested.append(('disable', ()))
+
+    def reset(self):
+        self.requested.append(('reset', ()))
+
+    def activate(self):
+        self.requested.append(('activate', ()))
+
+    def flush(self):
+        if not self.requested:
+            return
+        with self.condition:
+            self.actions_requested += len(self.requested)
+            self.pending = coalesce(self.pending + self.requested)
+            self.requested = []
+            self.condition.notify()
+
+    def _run(self):
+        while True:
+            with self.condition:
+                while not self.pending:
+                    self.condition.wait()
+                actions, self.pending = self.pending, []
+            start = time.perf_counter()
+            self.backend.perform(actions)
+            self.batches += 1
+            self.actions_performed += len(actions)
+            logging.debug("Screen blank %s: %.1fms (%u actions requested, %u performed)",
+                          ', '.join(name for name, _ in actions), (time.perf_counter() - start) * 1000,
+                          self.actions_requested, self.actions_performed)
+
+
+def make_backend(name: str):
+    """
+    name is 'x11' or 'xset'. Falls back to xset if X11 cannot be used directly.
+    """
+    if name == 'x11':
+        if backend := X11Backend.open():
+            return backend
+        logging.warning("Unable to control the screen saver through X11: using xset")
+    return XsetBackend()
+
+
+backends = ('x11', 'xset')
@@ -1,7 +1,9 @@
 import logging
-import subprocess
+import time
 from typing import Optional
 
+from screenblankbackend import ScreenBlankExecutor, XsetBackend
+
 
 class PlayingState:
     inactive = 0
@@ -9,6 +11,9 @@ class PlayingState:
 
 
 class ProfileBase:
+    backend = XsetBackend()  # replaced by ScreenBlankMgr
+    blanks_screen = True  # whether on_stopped_delayed blanks the screen
+
     def __init__(self):
         raise NotImplementedError()
 
@@ -26,29 +31,26 @@ class ProfileBase:
 
     def on_playing_tick(self):
         """
-        Callback called every 5 'playing' updates
+        Callback called every 5 seconds while playing
         """
         raise NotImplementedError()
 
     def on_stopped_delayed(self):
         """
-        Callback called once, 10 updates after the transition from 'playing' to 'not playing'
+        Callback called once, 10 seconds after the transition from 'playing' to 'not playing'
         """
         raise NotImplementedError()
 
     def _set_timeout(self, timeout):
-        self._run_xset(str(timeout))
-
-    def _run_xset(self, s_arg):
-        cmd = ['xset', 's', s_arg]
-        logging.debug(cmd)
-        subprocess.run(cmd, check=False)  # Although it's not ideal if it fails, raising an Exception won't help
+        self.backend.set_timeout(timeout)
 
     def _blank_screen_now(self):
-        self._run_xset('activate')
+        self.backend.activate()
 
 
 class ScreenBlankProfileNone(ProfileBase):
+    blanks_screen = False
+
     def __init__(self):
         "Do nothing except prevent the NotImplementedError"
 
@@ -90,45 +92,132 @@ class ScreenBlankProfileOnWhenPlaying(ProfileBase):
         self._set_timeout(60 * 60)
 
     def on_stop_playing(self):
-        self._run_xset('on')
+        self.backend.enable()
         self._set_timeout(10)
 
     def on_playing_tick(self):
-        self._run_xset('off')
-        self._run_xset('reset')
+        self.backend.disable()
+        self.backend.reset()
 
     def on_stopped_delayed(self):
         self._blank_screen_now()
 
 
 class ScreenBlankMgr:
-    def __init__(self, profile: ProfileBase):
+    """
+    Calls the profile's callbacks as the playing state changes, and at
+    deadlines measured with a monotonic clock, so the timing does not depend
+    on how often set_state is called.
+    Deadlines are checked on every call to set_state and, given a timer, when
+    they are due; eg, with GLib:
+
+        timer_add=lambda delay, callback: GLib.timeout_add(int(delay * 1000), callback)
+        timer_remove=GLib.source_remove
+
+    Once the profile has blanked the screen, the manager is dormant, until
+    playing starts or wake() is called because of user input; it becomes
+    dormant again after DORMANT_AFTER_INPUT seconds without input.
+    """
+    PLAYING_TICK_INTERVAL = 5  # seconds between calls to on_playing_tick
+    STOPPED_DELAY = 10  # seconds from stopping to on_stopped_delayed
+    DORMANT_AFTER_INPUT = 60
+
+    def __init__(self, profile: ProfileBase, backend=None, clock=time.monotonic, timer_add=None, timer_remove=None,
+                 on_dormant_change=None):
+        """
+        backend controls the screen saver: see screenblankbackend.make_backend().
+        Its actions are carried out on a thread of their own.
+        timer_add(delay, callback) should arrange for callback() to be called after
+        delay seconds, returning an id that can be passed to timer_remove(id).
+        callback() returns False.
+        on_dormant_change(dormant), if given, is called when the manager becomes
+        dormant, or stops being dormant.
+        """
         self.state: Optional[int] = None
         self.profile = profile
-        self.tick_countdown = 5
+        self.executor = None
+        if backend:
+            self.executor = ScreenBlankExecutor(backend)
+            profile.backend = self.executor
+        self.clock = clock
+        self.timer_add = timer_add
+        self.timer_remove = timer_remove
+        self.deadline = None  # when the next on_playing_tick or on_stopped_delayed is due
+        self.timer = None
+        self.timer_deadline = None
+        self.blanked = False  # on_stopped_delayed has been called since playing stopped
+        self.dormant = False
+        self.on_dormant_change = on_dormant_change
 
     def set_state(self, new_state_str: str):
         """
         new_state in ('playing', 'paused', 'stopped')
         """
         new_state = PlayingState.active if (new_state_str == 'playing') else PlayingState.inactive
-        if self.state == new_state:
-            self.tick_countdown -= 1
-            if self.state == PlayingState.active:
-                if self.tick_countdown <= 0:
-                    self.profile.on_playing_tick()
-                    self.tick_countdown = 5
-            else:
-                if self.tick_countdown == 0:
-                    self.profile.on_stopped_delayed()
-        else:
+        if self.state != new_state:
             self.state = new_state
+            self.blanked = False
+            self._set_dormant(False)
             if self.state == PlayingState.active:
                 self.profile.on_start_playing()
-                self.tick_countdown = 5
+                self.deadline = self.clock() + self.PLAYING_TICK_INTERVAL
             else:
                 self.profile.on_stop_playing()
-                self.tick_countdown = 10
+                self.deadline = self.clock() + self.STOPPED_DELAY
+        self._check_deadline()
+
+    def _check_deadline(self):
+        now = self.clock()
+        if self.deadline is not None and now >= self.deadline:
+            if self.state == PlayingState.active:
+                self.profile.on_playing_tick()
+                self.deadline += self.PLAYING_TICK_INTERVAL
+                if self.deadline <= now:
+                    # we've fallen behind (eg the main loop was busy): don't try to catch up
+                    self.deadline = now + self.PLAYING_TICK_INTERVAL
+            else:
+                if not self.blanked:
+                    self.profile.on_stopped_delayed()
+                    self.blanked = True
+                self.deadline = None
+                self._set_dormant(self.profile.blanks_screen)
+        if self.executor:
+            # whatever the profile has just asked for is done together, in the background
+            self.executor.flush()
+        self._schedule()
+
+    def wake(self):
+        """
+        Called on user input, which makes a blanked screen visible again
+        """
+        if self.blanked:
+            self._set_dormant(False)
+            self.deadline = self.clock() + self.DORMANT_AFTER_INPUT
+            self._schedule()
+
+    def _set_dormant(self, dormant: bool):
+        if dormant == self.dormant:
+            return
+        self.dormant = dormant
+        logging.debug("Screen blank manager %s", "dormant" if dormant else "awake")
+        if self.on_dormant_change:
+            self.on_dormant_change(dormant)
+
+    def _schedule(self):
+        if not self.timer_add or self.deadline == self.timer_deadline:
+            return
+        if self.timer is not None:
+            self.timer_remove(self.timer)
+            self.timer = None
+        self.timer_deadline = self.deadline
+        if self.deadline is not None:
+            self.timer = self.timer_add(max(0, self.deadline - self.clock()), self._on_timer)
+
+    def _on_timer(self):
+        self.timer = None
+        self.timer_deadline = None
+        self._check_deadline()
+        return False
 
 
 profiles = {
@@ -0,0 +1,43 @@
+import asyncio
+import logging
+
+from apiclient import ApiClient, CURRENT_STATUS_ERROR
+from engine import run_blocking
+from pollscheduler import PollScheduler
+
+# Longest to wait for a status, beyond the ApiClient's own timeouts
+STATE_TIMEOUT = 5
+
+
+def get_state(apiclient: ApiClient):
+    """
+    Returns the current state and whether there was a connection error getting it
+    """
+    return apiclient.get_current_state(), apiclient.connection_error
+
+
+async def get_state_async(apiclient: ApiClient):
+    """
+    As get_state, without blocking the event loop
+    """
+    try:
+        return await run_blocking(get_state, apiclient, timeout=STATE_TIMEOUT)
+    except asyncio.TimeoutError:
+        logging.error("Timed out getting the current state")
+        return CURRENT_STATUS_ERROR, True
+
+
+def follow_state_stream(apiclient: ApiClient, handle_status, scheduler: PollScheduler):
+    """
+    Handle state changes pushed by the server.
+    Only returns if the server does not support streaming. When the stream is
+    lost, the scheduler decides when to reconnect, so that an unreachable
+    server is tried less and less often.
+    """
+    while (stream := apiclient.open_state_stream()) is not None:
+        for status in stream:
+            handle_status(status, apiclient.connection_error)
+            scheduler.observe(status, apiclient.connection_error)
+        # The stream has finished: either the connection was lost or the server closed it
+        scheduler.wait()
+    logging.info("Server does not support pushed updates: polling instead")
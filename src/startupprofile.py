@@ -0,0 +1,59 @@
+import logging
+import os
+import threading
+import time
+
+
+def process_age():
+    """
+    Returns the number of seconds since this process started, or None if that
+    cannot be found (it is read from /proc)
+    """
+    try:
+        with open('/proc/self/stat', encoding='ascii') as handle:
+            # the process name, in brackets, may contain spaces
+            fields = handle.read().rsplit(')', 1)[1].split()
+        start_ticks = int(fields[19])  # field 22 of the whole line
+        return time.clock_gettime(time.CLOCK_BOOTTIME) - start_ticks / os.sysconf('SC_CLK_TCK')
+    except (OSError, ValueError, IndexError, AttributeError):
+        return None
+
+
+class StartupProfile:
+    """
+    Notes how long after the process started each step of starting up
+    happened, and logs them all once the last step has happened
+    """
+    def __init__(self, steps, clock=time.perf_counter, age=None):
+        """
+        steps are the names of the steps to be marked, in the order they are expected.
+        age is the number of seconds since the process started: by default,
+        found with process_age(), or, if that fails, times are from now.
+        """
+        self.steps = steps
+        self.clock = clock
+        if age is None:
+            age = process_age()
+            if age is None:
+                logging.warning("Unable to find the process start time: startup is timed from now")
+                age = 0
+        self.origin = clock() - age
+        self.lock = threading.Lock()
+        self.times = {}  # step -> seconds since the process started
+
+    def mark(self, step: str):
+        """
+        Note that a step has happened, unless it has already. May be called from any thread.
+        """
+        with self.lock:
+            if step in self.times:
+                return
+            self.times[step] = self.clock() - self.origin
+            finished = len(self.times) == len(self.steps)
+        if finished:
+            logging.info(self.report())
+
+    def report(self) -> str:
+        with self.lock:
+            return "Startup: " + ", ".join(f"{step} at {self.times[step] * 1000:.0f}ms"
+                                           for step in sorted(self.times, key=self.times.get))
@@ -0,0 +1,48 @@
+import logging
+from typing import Optional
+
+from metrics import metrics
+from nowplaying import NowPlaying, changed_fields
+
+
+class UpdateFilter:
+    """
+    Sits between the poller and the main window, so that the GTK main loop is
+    only woken up when something on screen needs to change
+    """
+    def __init__(self):
+        self.last_connection_error = None
+        self.last_now_playing = None
+        self.dispatched = 0
+        self.suppressed = 0
+
+    def filter(self, connection_error: bool, now_playing: NowPlaying) -> Optional[NowPlaying]:
+        """
+        Returns the now_playing snapshot if it is to be displayed, or None if
+        the display would not change
+        """
+        if connection_error and self.last_connection_error:
+            changed = set()
+        elif connection_error != self.last_connection_error:
+            changed = {'connection_error'}
+        else:
+            changed = changed_fields(self.last_now_playing, now_playing)
+        if not changed:
+            self.suppressed += 1
+            metrics.increment('update suppressed')
+            logging.debug("No change to display: %u updates suppressed, %u dispatched",
+                          self.suppressed, self.dispatched)
+            return None
+        self.dispatched += 1
+        metrics.increment('update dispatched')
+        self.last_connection_error = connection_error
+        # Snapshots are immutable, so can be kept and handed on as they are
+        self.last_now_playing = now_playing
+        return now_playing
+
+    def invalidate(self):
+        """
+        Ensure the next update is dispatched, even if nothing has changed
+        """
+        self.last_connection_error = None
+        self.last_now_playing = None
@@ -0,0 +1,63 @@
+import logging
+import threading
+import time
+
+from metrics import metrics
+
+
+class UpdateMailbox:
+    """
+    Passes updates from another thread to the main loop, latest wins. At most
+    one callback is ever waiting on the main loop: an update put while the
+    previous one is still waiting replaces it, so a main loop that has been
+    held up catches up with a single update, rather than a burst of
+    out-of-date ones.
+    """
+    def __init__(self, post, deliver, clock=time.perf_counter):
+        """
+        post(fn) calls fn() on the main loop: GLib.idle_add.
+        deliver(*args) is called on the main loop with the arguments of the latest put.
+        """
+        self.post = post
+        self.deliver = deliver
+        self.clock = clock
+        self.lock = threading.Lock()
+        self.pending = None  # the arguments of the update waiting to be delivered
+        self.posted_at = None  # when the callback for the pending update was posted
+        self.delivered = 0
+        self.coalesced = 0
+        self.max_lag = 0.0
+
+    def put(self, *args):
+        """
+        Called on any thread
+        """
+        with self.lock:
+            replaced = self.pending is not None
+            if replaced:
+                self.coalesced += 1
+            else:
+                self.posted_at = self.clock()
+            self.pending = args
+        if replaced:
+            metrics.increment('update coalesced')
+            logging.debug("Update replaced one not yet shown: %u coalesced, %u delivered",
+                          self.coalesced, self.delivered)
+        else:
+            self.post(self._deliver)
+
+    def _deliver(self):
+        # On the main loop
+        with self.lock:
+            args = self.pending
+            self.pending = None
+            lag = self.clock() - self.posted_at
+            self.delivered += 1
+            new_max = lag > self.max_lag
+            if new_max:
+                self.max_lag = lag
+        metrics.observe('main loop wait', lag)
+        if new_max:
+            logging.debug("Longest wait for the main loop so far: %.0fms", lag * 1000)
+        self.deliver(*args)
+        return False
@@ -12,13 +12,57 @@ import apiclient  # noqa: E402
 
 
 FakeTextResponse = namedtuple('FakeTextResponse', 'ok status_code text json')
-FakeBinaryResponse = namedtuple('FakeBinaryResponse', 'ok status_code text content')
+
+
+class FakeBinaryResponse:
+    def __init__(self, ok, status_code, text, content, headers=None, exc=None):
+        self.ok = ok
+        self.status_code = status_code
+        self.text = text
+        self.content = content
+        self.headers = headers or {}
+        self.exc = exc
+        self.chunks_read = 0
+        self.closed = False
+
+    def iter_content(self, chunk_size):
+        for offset in range(0, len(self.content), chunk_size):
+            self.chunks_read += 1
+            yield self.content[offset:offset + chunk_size]
+        if self.exc:
+            raise self.exc
+
+    def close(self):
+        self.closed = True
+
+
+class FakeStreamResponse:
+    def __init__(self, lines, ok=True, status_code=200, content_type='text/event-stream', exc=None):
+        self.ok = ok
+        self.status_code = status_code
+        self.headers = {'Content-Type': content_type}
+        self.lines = lines
+        self.exc = exc
+        self.closed = False
+
+    def iter_lines(self, chunk_size, decode_unicode):
+        yield from self.lines
+        if self.exc:
+            raise self.exc
+
+    def close(self):
+        self.closed = True
+
+
+def invalid_json():
+    raise ValueError("not json")
+
 
 logging.disable(logging.CRITICAL)  # disable logging from the apiclient code
 
 
 class TestGetCurrentState(unittest.TestCase):
-    @patch('apiclient.requests.get', side_effect=requests.exceptions.ConnectionError)
+    @patch('apiclient.requests.Session.get', side_effect=requests.exceptions.ConnectionError)
     def test_connection_error_sets_flag(self, mock_requests_get):
         client = apiclient.ApiClient('http://address/')
         self.assertFalse(client.connection_error)
@@ -26,7 +70,7 @@ class TestGetCurrentState(unittest.TestCase):
         self.assertEqual(state.status, None)
         self.assertTrue(client.connection_error)
 
-    @patch('apiclient.requests.get', side_effect=[
+    @patch('apiclient.requests.Session.get', side_effect=[
         requests.exceptions.ConnectionError,
         FakeTextResponse(ok=False, status_code=500, text='', json=None)
     ])
@@ -43,28 +87,35 @@ class TestGetCurrentState(unittest.TestCase):
         state = client.get_current_state()
         self.assertFalse(client.connection_error)
 
-    @patch('apiclient.requests.get',
+    @patch('apiclient.requests.Session.get',
            return_value=FakeTextResponse(ok=False, status_code=500, text='', json=None))
     def test_non_ok_response(self, mock_requests_get):
         client = apiclient.ApiClient('http://address/')
         state = client.get_current_state()
         self.assertEqual(state.status, None)
 
-    @patch('apiclient.requests.get',
+    @patch('apiclient.requests.Session.get',
            return_value=FakeTextResponse(ok=True, status_code=200, text='', json=lambda: None))
     def test_non_json_repsonse(self, mock_requests_get):
         client = apiclient.ApiClient('http://address/')
         state = client.get_current_state()
         self.assertEqual(state.status, None)
 
-    @patch('apiclient.requests.get',
+    @patch('apiclient.requests.Session.get',
+           return_value=FakeTextResponse(ok=True, status_code=200, text='<html>', json=invalid_json))
+    def test_invalid_json_response(self, mock_requests_get):
+        client = apiclient.ApiClient('http://address/')
+        state = client.get_current_state()
+        self.assertEqual(state.status, None)
+
+    @patch('apiclient.requests.Session.get',
            return_value=FakeTextResponse(ok=True, status_code=200, text='', json=lambda: {}))
     def test_json_without_status(self, mock_requests_get):
         client = apiclient.ApiClient('http://address/')
         state = client.get_current_state()
         self.assertEqual(state.status, None)
 
-    @patch('apiclient.requests.get', side_effect=[
+    @patch('apiclient.requests.Session.get', side_effect=[
         FakeTextResponse(ok=True, status_code=200, text='', json=lambda: {'PlayerStatus': 'stopped'}),
         FakeTextResponse(ok=True, status_code=200, text='', json=lambda: {'PlayerStatus': 'playing'}),
         FakeTextResponse(ok=True, status_code=200, text='', json=lambda: {'PlayerStatus': 'paused'}),
@@ -76,8 +127,73 @@ class TestGetCurrentState(unittest.TestCase):
         self.assertEqual(client.get_current_state().status, "paused")
 
 
+class TestOpenStateStream(unittest.TestCase):
+    @patch('apiclient.requests.Session.get', side_effect=requests.exceptions.ConnectionError)
+    def test_connection_error_yields_error_status(self, mock_requests_get):
+        client = apiclient.ApiClient('http://address/')
+        stream = client.open_state_stream()
+        self.assertEqual(list(stream), [apiclient.CURRENT_STATUS_ERROR])
+        self.assertTrue(client.connection_error)
+
+    @patch('apiclient.requests.Session.get',
+           return_value=FakeStreamResponse([], ok=False, status_code=404, content_type='application/json'))
+    def test_not_found_means_unsupported(self, mock_requests_get):
+        client = apiclient.ApiClient('http://address/')
+        self.assertIsNone(client.open_state_stream())
+        self.assertTrue(mock_requests_get.return_value.closed)
+
+    @patch('apiclient.requests.Session.get',
+           return_value=FakeStreamResponse([], ok=False, status_code=415, content_type='application/json'))
+    def test_unsupported_media_type_means_unsupported(self, mock_requests_get):
+        client = apiclient.ApiClient('http://address/')
+        self.assertIsNone(client.open_state_stream())
+
+    @patch('apiclient.requests.Session.get',
+           return_value=FakeStreamResponse([], content_type='application/json'))
+    def test_non_event_stream_yields_error_status(self, mock_requests_get):
+        client = apiclient.ApiClient('http://address/')
+        self.assertEqual(list(client.open_state_stream()), [apiclient.CURRENT_STATUS_ERROR])
+        self.assertTrue(client.connection_error)
+        self.assertTrue(mock_requests_get.return_value.closed)
+
+    @patch('apiclient.requests.Session.get',
+           return_value=FakeStreamResponse([], ok=False, status_code=503, content_type='text/html'))
+    def test_server_error_yields_error_status(self, mock_requests_get):
+        client = apiclient.ApiClient('http://address/')
+        self.assertEqual(list(client.open_state_stream()), [apiclient.CURRENT_STATUS_ERROR])
+        self.assertTrue(client.connection_error)
+
+    @patch('apiclient.requests.Session.get', return_value=FakeStreamResponse([
+        ': keep-alive',
+        '',
+        'data: {"PlayerStatus": "playing",',
+        'data:  "CurrentTrack": {"title": "One"}}',
+        '',
+        'event: ignored',
+        'data: {"PlayerStatus": "paused"}',
+        '',
+        'data: not json',
+        '',
+    ]))
+    def test_events_are_parsed(self, mock_requests_get):
+        client = apiclient.ApiClient('http://address/')
+        statuses = list(client.open_state_stream())
+        self.assertEqual([status.status for status in statuses], ['playing', 'paused', None])
+        self.assertEqual(statuses[0].current_track, {'title': 'One'})
+        self.assertTrue(mock_requests_get.return_value.closed)
+
+    @patch('apiclient.requests.Session.get', return_value=FakeStreamResponse(
+        ['data: {"PlayerStatus": "playing"}', ''],
+        exc=requests.exceptions.ConnectionError))
+    def test_lost_connection_sets_flag(self, mock_requests_get):
+        client = apiclient.ApiClient('http://address/')
+        statuses = list(client.open_state_stream())
+        self.assertEqual(len(statuses), 1)
+        self.assertTrue(client.connection_error)
+
+
 class TestGetArtworkInfo(unittest.TestCase):
-    @patch('apiclient.requests.get', side_effect=requests.exceptions.ConnectionError)
+    @patch('apiclient.requests.Session.get', side_effect=requests.exceptions.ConnectionError)
     def test_connection_error_sets_flag(self, mock_requests_get):
         client = apiclient.ApiClient('http://address/')
         self.assertFalse(client.connection_error)
@@ -87,7 +203,7 @@ class TestGetArtworkInfo(unittest.TestCase):
         self.assertEqual(info.imageuri, None)
         self.assertTrue(client.connection_error)
 
-    @patch('apiclient.requests.get', side_effect=[
+    @patch('apiclient.requests.Session.get', side_effect=[
         requests.exceptions.ConnectionError,
         FakeTextResponse(ok=False, status_code=500, text='', json=None)
     ])
@@ -104,7 +220,7 @@ class TestGetArtworkInfo(unittest.TestCase):
         state = client.get_artwork_info('/artworkinfo/27')
         self.assertFalse(client.connection_error)
 
-    @patch('apiclient.requests.get',
+    @patch('apiclient.requests.Session.get',
            return_value=FakeTextResponse(ok=False, status_code=500, text='', json=None))
     def test_non_ok_response(self, mock_requests_get):
         client = apiclient.ApiClient('http://address/')
@@ -113,7 +229,13 @@ class TestGetArtworkInfo(unittest.TestCase):
         self.assertEqual(info.height, None)
         self.assertEqual(info.imageuri, None)
 
-    @patch('apiclient.requests.get',
+    @patch('apiclient.requests.Session.get',
+           return_value=FakeTextResponse(ok=True, status_code=200, text='<html>', json=invalid_json))
+    def test_invalid_json_response(self, mock_requests_get):
+        client = apiclient.ApiClient('http://address/')
+        self.assertEqual(client.get_artwork_info('/artworkinfo/784'), apiclient.ArtworkInfo(None, None, None))
+
+    @patch('apiclient.requests.Session.get',
            return_value=FakeTextResponse(ok=True, status_code=200, text='', json=lambda: None))
     def test_non_json_repsonse(self, mock_requests_get):
         client = apiclient.ApiClient('http://address/')
@@ -122,7 +244,7 @@ class TestGetArtworkInfo(unittest.TestCase):
         self.assertEqual(info.height, None)
         self.assertEqual(info.imageuri, None)
 
-    @patch('apiclient.requests.get',
+    @patch('apiclient.requests.Session.get',
            return_value=FakeTextResponse(ok=True,
                                          status_code=200,
                                          text='',
@@ -136,13 +258,37 @@ class TestGetArtworkInfo(unittest.TestCase):
         self.assertEqual(info.imageuri, "/artwork/12")
 
 
+class TestGetJson(unittest.TestCase):
+    @patch('apiclient.requests.Session.get',
+           return_value=FakeTextResponse(ok=True, status_code=200, text='', json=lambda: {'tracks': []}))
+    def test_relative_and_absolute_paths(self, mock_requests_get):
+        client = apiclient.ApiClient('http://address/')
+        self.assertEqual(client.get_json('/albums/1'), {'tracks': []})
+        mock_requests_get.assert_called_with('http://address/albums/1', timeout=apiclient.PIJU_SERVER_TIMEOUT)
+        self.assertEqual(client.get_json('http://other/albums/1'), {'tracks': []})
+        mock_requests_get.assert_called_with('http://other/albums/1', timeout=apiclient.PIJU_SERVER_TIMEOUT)
+
+    @patch('apiclient.requests.Session.get')
+    def test_missing_path(self, mock_requests_get):
+        client = apiclient.ApiClient('http://address/')
+        self.assertIsNone(client.get_json(''))
+        self.assertIsNone(client.get_json(None))
+        mock_requests_get.assert_not_called()
+
+    @patch('apiclient.requests.Session.get',
+           return_value=FakeTextResponse(ok=True, status_code=200, text='<html>', json=invalid_json))
+    def test_invalid_json_response(self, mock_requests_get):
+        client = apiclient.ApiClient('http://address/')
+        self.assertIsNone(client.get_json('/albums/1'))
+
+
 class TestGetArtwork(unittest.TestCase):
     def test_get_none(self):
         client = apiclient.ApiClient('http://address/')
         artwork = client.get_artwork(None)
         self.assertEqual(artwork, None)
 
-    @patch('apiclient.requests.get', side_effect=requests.exceptions.ConnectionError)
+    @patch('apiclient.requests.Session.get', side_effect=requests.exceptions.ConnectionError)
     def test_connection_error_returns_none_and_sets_flag(self, mock_requests_get):
         client = apiclient.ApiClient('http://address/')
         self.assertFalse(client.connection_error)
@@ -150,7 +296,7 @@ class TestGetArtwork(unittest.TestCase):
         self.assertEqual(artwork, None)
         self.assertTrue(client.connection_error)
 
-    @patch('apiclient.requests.get', side_effect=[
+    @patch('apiclient.requests.Session.get', side_effect=[
         requests.exceptions.ConnectionError,
         FakeBinaryResponse(ok=False, status_code=500, text='', content=None)
     ])
@@ -167,45 +313,121 @@ class TestGetArtwork(unittest.TestCase):
         artwork = client.get_artwork('/artwork/123')
         self.assertFalse(client.connection_error)
 
-    @patch('apiclient.requests.get',
+    @patch('apiclient.requests.Session.get',
            return_value=FakeBinaryResponse(ok=False, status_code=500, text='', content=None))
     def test_non_ok_response(self, mock_requests_get):
         client = apiclient.ApiClient('http://address/')
         artwork = client.get_artwork('/artwork/123')
         self.assertEqual(artwork, None)
 
-    @patch('apiclient.requests.get',
-           return_value=FakeBinaryResponse(ok=True, status_code=200, text='', content='MyArtworkHere'))
+    @patch('apiclient.requests.Session.get',
+           return_value=FakeBinaryResponse(ok=True, status_code=200, text='', content=b'MyArtworkHere'))
     def test_ok_response(self, mock_requests_get):
         client = apiclient.ApiClient('http://address/')
         artwork = client.get_artwork('/artwork/123')
-        self.assertEqual(artwork, 'MyArtworkHere')
+        self.assertEqual(artwork, b'MyArtworkHere')
+        self.assertEqual(mock_requests_get.call_args.kwargs['params'], None)
+
+    @patch('apiclient.requests.Session.get',
+           return_value=FakeBinaryResponse(ok=True, status_code=200, text='', content=b'MyArtworkHere'))
+    def test_sized_request(self, mock_requests_get):
+        client = apiclient.ApiClient('http://address/')
+        artwork = client.get_artwork('/artwork/123', (300, 200))
+        self.assertEqual(artwork, b'MyArtworkHere')
+        mock_requests_get.assert_called_once_with('http://address/artwork/123', params={'width': 300, 'height': 200},
+                                                  stream=True, timeout=apiclient.PIJU_SERVER_TIMEOUT)
+
+    @patch('apiclient.requests.Session.get')
+    def test_oversized_response_is_not_downloaded(self, mock_requests_get):
+        response = mock_requests_get.return_value
+        response.ok = True
+        response.headers = {'Content-Length': str(apiclient.MAX_ARTWORK_BYTES + 1)}
+        client = apiclient.ApiClient('http://address/')
+        self.assertIsNone(client.get_artwork('/artwork/123'))
+        response.close.assert_called_once()
+
+    @patch('apiclient.requests.Session.get')
+    def test_oversized_response_is_abandoned(self, mock_requests_get):
+        # eg a chunked response, which has no Content-Length
+        response = FakeBinaryResponse(ok=True, status_code=200, text='', content=bytes(10 * 64 * 1024))
+        mock_requests_get.return_value = response
+        client = apiclient.ApiClient('http://address/', max_artwork_bytes=3 * 64 * 1024)
+        self.assertIsNone(client.get_artwork('/artwork/123'))
+        self.assertEqual(response.chunks_read, 4)
+        self.assertTrue(response.closed)
+
+    @patch('apiclient.requests.Session.get')
+    def test_chunks_are_passed_on(self, mock_requests_get):
+        content = bytes(range(256)) * 1024
+        mock_requests_get.return_value = FakeBinaryResponse(ok=True, status_code=200, text='', content=content)
+        chunks = []
+        client = apiclient.ApiClient('http://address/')
+        artwork = client.get_artwork('/artwork/123', on_chunk=chunks.append)
+        self.assertEqual(artwork, content)
+        self.assertIsInstance(artwork, bytearray)
+        self.assertEqual(b''.join(chunks), content)
+        self.assertEqual(len(chunks), 4)
+
+    @patch('apiclient.requests.Session.get')
+    def test_on_chunk_can_abandon(self, mock_requests_get):
+        response = FakeBinaryResponse(ok=True, status_code=200, text='', content=bytes(256 * 1024))
+        mock_requests_get.return_value = response
+        client = apiclient.ApiClient('http://address/')
+        self.assertIsNone(client.get_artwork('/artwork/123', on_chunk=lambda chunk: False))
+        self.assertEqual(response.chunks_read, 1)
+
+    @patch('apiclient.requests.Session.get')
+    def test_connection_lost_while_reading(self, mock_requests_get):
+        mock_requests_get.return_value = FakeBinaryResponse(ok=True, status_code=200, text='', content=b'partial',
+                                                            exc=requests.exceptions.ChunkedEncodingError())
+        client = apiclient.ApiClient('http://address/')
+        self.assertIsNone(client.get_artwork('/artwork/123'))
+        self.assertTrue(client.connection_error)
 
 
 class TestApiCommands(unittest.TestCase):
-    @patch('apiclient.requests.post')
+    @patch('apiclient.requests.Session.post')
     def test_pause(self, mock_post):
         client = apiclient.ApiClient('http://address/')
         client.pause()
-        mock_post.assert_called_once_with('http://address/player/pause')
+        mock_post.assert_called_once_with('http://address/player/pause', timeout=apiclient.PIJU_SERVER_TIMEOUT)
 
-    @patch('apiclient.requests.post')
+    @patch('apiclient.requests.Session.post')
     def test_resume(self, mock_post):
         client = apiclient.ApiClient('http://address/')
         client.resume()
-        mock_post.assert_called_once_with('http://address/player/resume')
+        mock_post.assert_called_once_with('http://address/player/resume', timeout=apiclient.PIJU_SERVER_TIMEOUT)
 
-    @patch('apiclient.requests.post')
+    @patch('apiclient.requests.Session.post')
     def test_previous(self, mock_post):
         client = apiclient.ApiClient('http://address/')
         client.previous()
-        mock_post.assert_called_once_with('http://address/player/previous')
+        mock_post.assert_called_once_with('http://address/player/previous', timeout=apiclient.PIJU_SERVER_TIMEOUT)
 
-    @patch('apiclient.requests.post')
+    @patch('apiclient.requests.Session.post')
     def test_next(self, mock_post):
         client = apiclient.ApiClient('http://address/')
         client.next()
-        mock_post.assert_called_once_with('http://address/player/next')
+        mock_post.assert_called_once_with('http://address/player/next', timeout=apiclient.PIJU_SERVER_TIMEOUT)
+
+
+class TestSession(unittest.TestCase):
+    def test_session_is_shared_and_pooled(self):
+        client = apiclient.ApiClient('http://address/')
+        adapter = client.session.get_adapter('http://address/')
+        self.assertEqual(adapter._pool_maxsize, apiclient.CONNECTION_POOL_SIZE)
+        self.assertTrue(adapter._pool_block)
+
+    def test_request_that_reached_server_is_not_retried(self):
+        client = apiclient.ApiClient('http://address/')
+        retries = client.session.get_adapter('http://address/').max_retries
+        self.assertEqual(retries.read, 0)
+        self.assertEqual(retries.connect, 1)
+
+    def test_explicit_session_is_used(self):
+        session = requests.Session()
+        client = apiclient.ApiClient('http://address/', session=session)
+        self.assertIs(client.session, session)
 
 
 if __name__ == '__main__':
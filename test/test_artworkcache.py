@@ -1,8 +1,9 @@
+import threading
 import unittest
 from unittest.mock import patch, call
 
 from apiclient import ApiClient, ArtworkInfo
-from artworkcache import ArtworkCache
+from artworkcache import ArtworkCache, fit_within, MAX_UNAVAILABLE
 
 
 class TestUpdate(unittest.TestCase):
@@ -22,7 +23,7 @@ class TestUpdate(unittest.TestCase):
         cache = ArtworkCache()
         cache.update(apiclient, '/artwork_info/123')
         mock_get_artwork_info.assert_called_once_with('/artwork_info/123')
-        mock_get_artwork.assert_called_once_with('/artwork/123')
+        mock_get_artwork.assert_called_once_with('/artwork/123', None)
 
     @patch.object(ApiClient, 'get_artwork_info',
                   return_value=ArtworkInfo(width=27, height=36, imageuri='/artwork/123'))
@@ -75,8 +76,297 @@ class TestUpdate(unittest.TestCase):
         cache = ArtworkCache()
         cache.update(apiclient, '/artwork_info/999')
         mock_get_artwork_info.assert_called_once_with('/artwork_info/999')
-        mock_get_artwork.assert_called_once_with('/artwork/999')
+        mock_get_artwork.assert_called_once_with('/artwork/999', None)
 
         cache.update(apiclient, '/artwork_info/998')
         mock_get_artwork_info.has_calls([call('/artwork_info/999'), call('/artwork_info/998')])
-        mock_get_artwork.assert_called_once_with('/artwork/999')
+        mock_get_artwork.assert_called_once_with('/artwork/999', None)
+
+
+class TestLru(unittest.TestCase):
+    @patch.object(ApiClient, 'get_artwork', side_effect=[b'one', b'two'])
+    def test_previous_artwork_is_not_refetched(self, mock_get_artwork):
+        apiclient = ApiClient('http://address/')
+        cache = ArtworkCache()
+        cache.update(apiclient, 'http://server/one.jpg')
+        cache.update(apiclient, 'http://server/two.jpg')
+        cache.update(apiclient, 'http://server/one.jpg')
+        self.assertEqual(cache.current_image_uri, 'http://server/one.jpg')
+        self.assertEqual(cache.current_image, b'one')
+        self.assertEqual(mock_get_artwork.call_count, 2)
+        self.assertEqual((cache.hits, cache.misses), (1, 2))
+
+    @patch.object(ApiClient, 'get_artwork', return_value=None)
+    def test_unavailable_artwork_is_retried_later(self, mock_get_artwork):
+        apiclient = ApiClient('http://address/')
+        cache = ArtworkCache()
+        cache.update(apiclient, 'http://server/one.jpg')
+        self.assertIsNone(cache.current_image)
+        cache.update(apiclient, 'http://server/one.jpg')
+        self.assertEqual(mock_get_artwork.call_count, 1)
+        cache.unavailable['http://server/one.jpg'] = 0  # the retry interval has passed
+        cache.update(apiclient, 'http://server/one.jpg')
+        self.assertEqual(mock_get_artwork.call_count, 2)
+
+    @patch.object(ApiClient, 'get_artwork', return_value=None)
+    def test_unavailable_is_bounded(self, mock_get_artwork):
+        apiclient = ApiClient('http://address/')
+        cache = ArtworkCache()
+        for index in range(MAX_UNAVAILABLE + 10):
+            cache.update_inner(apiclient, f'http://server/{index}.jpg')
+        self.assertEqual(len(cache.unavailable), MAX_UNAVAILABLE)
+        self.assertNotIn('http://server/0.jpg', cache.unavailable)
+
+    def test_artwork_is_retried_after_connection_error(self):
+        apiclient = ApiClient('http://address/')
+        cache = ArtworkCache()
+
+        def connection_error(uri, size):
+            apiclient.connection_error = True
+
+        with patch.object(ApiClient, 'get_artwork', side_effect=connection_error) as mock_get_artwork:
+            cache.update(apiclient, 'http://server/one.jpg')
+            cache.update(apiclient, 'http://server/one.jpg')
+            self.assertEqual(mock_get_artwork.call_count, 2)
+
+    def test_least_recently_used_is_evicted(self):
+        cache = ArtworkCache(max_bytes=10)
+        cache.put('a', b'aaaa')
+        cache.put('b', b'bbbb')
+        self.assertEqual(cache.get('a'), b'aaaa')  # b is now least recently used
+        cache.put('c', b'cccc')
+        self.assertEqual(cache.get('b'), None)
+        self.assertEqual(cache.get('a'), b'aaaa')
+        self.assertEqual(cache.get('c'), b'cccc')
+        self.assertEqual(cache.total_bytes, 8)
+        self.assertEqual(cache.evictions, 1)
+
+    def test_decoded_size_counts_towards_budget(self):
+        cache = ArtworkCache(max_bytes=10)
+        cache.put('a', b'aaaa')
+        cache.put('b', b'bbbb')
+        cache.set_decoded('b', 'decoded b', 2)
+        self.assertEqual(cache.get_decoded('b'), 'decoded b')
+        self.assertEqual(cache.total_bytes, 10)
+        self.assertEqual(cache.get('a'), b'aaaa')  # b is now least recently used
+        cache.set_decoded('a', 'decoded a', 2)
+        self.assertEqual(cache.get('b'), None)
+        self.assertEqual(cache.get_decoded('a'), 'decoded a')
+        self.assertEqual(cache.total_bytes, 6)
+
+    def test_decoded_requires_cached_bytes(self):
+        cache = ArtworkCache()
+        cache.set_decoded('a', 'decoded a', 2)
+        self.assertEqual(cache.get_decoded('a'), None)
+        self.assertEqual(cache.total_bytes, 0)
+
+    def test_resize_evicts(self):
+        cache = ArtworkCache()
+        cache.put('a', b'aaaa')
+        cache.put('b', b'bbbb')
+        cache.resize(4)
+        self.assertEqual(list(cache.entries), ['b'])
+
+
+class WatchedEvent(threading.Event):
+    """
+    Notes when a thread starts waiting for it
+    """
+    def __init__(self):
+        super().__init__()
+        self.waiting = threading.Event()
+
+    def wait(self, timeout=None):
+        self.waiting.set()
+        return super().wait(timeout)
+
+
+class TestConcurrentFetch(unittest.TestCase):
+    def wait_for_second_fetch(self, cache, uri, second):
+        """
+        Start the second thread, and return once it is waiting for the first thread's download
+        """
+        done = cache.fetches[uri].done = WatchedEvent()
+        second.start()
+        self.assertTrue(done.waiting.wait(5))
+
+    def test_same_artwork_is_downloaded_once(self):
+        apiclient = ApiClient('http://address/')
+        other_client = ApiClient('http://address/')
+        cache = ArtworkCache()
+        started = threading.Event()
+        release = threading.Event()
+
+        def get_artwork(uri, *args, **kwargs):
+            started.set()
+            release.wait(5)
+            return b'image'
+
+        results = []
+        with patch.object(ApiClient, 'get_artwork', side_effect=get_artwork) as mock_get_artwork:
+            first = threading.Thread(target=lambda: results.append(cache.update_inner(apiclient,
+                                                                                      'http://server/one.jpg')))
+            first.start()
+            self.assertTrue(started.wait(5))
+            second = threading.Thread(target=lambda: results.append(cache.update_inner(other_client,
+                                                                                       'http://server/one.jpg')))
+            self.wait_for_second_fetch(cache, 'http://server/one.jpg', second)
+            release.set()
+            first.join(5)
+            second.join(5)
+            self.assertEqual(mock_get_artwork.call_count, 1)
+        self.assertEqual(results, [b'image', b'image'])
+        self.assertEqual(cache.fetches, {})
+
+    def test_waiting_thread_sees_connection_error(self):
+        apiclient = ApiClient('http://address/')
+        other_client = ApiClient('http://address/')
+        cache = ArtworkCache()
+        started = threading.Event()
+        release = threading.Event()
+
+        def get_artwork(uri, *args, **kwargs):
+            started.set()
+            release.wait(5)
+            apiclient.connection_error = True
+
+        with patch.object(ApiClient, 'get_artwork', side_effect=get_artwork):
+            first = threading.Thread(target=cache.update_inner, args=(apiclient, 'http://server/one.jpg'))
+            first.start()
+            self.assertTrue(started.wait(5))
+            result = []
+            second = threading.Thread(target=lambda: result.append(cache.update_inner(other_client,
+                                                                                      'http://server/one.jpg')))
+            self.wait_for_second_fetch(cache, 'http://server/one.jpg', second)
+            release.set()
+            first.join(5)
+            second.join(5)
+        self.assertEqual(result, [None])
+        self.assertTrue(other_client.connection_error)
+
+
+class TestSizedDownload(unittest.TestCase):
+    def test_fit_within(self):
+        self.assertEqual(fit_within(3000, 3000, 300), (300, 300))
+        self.assertEqual(fit_within(3000, 1500, 300), (300, 150))
+        self.assertEqual(fit_within(1000, 2000, 300), (150, 300))
+
+    @patch.object(ApiClient, 'get_artwork', return_value=b'small')
+    @patch.object(ApiClient, 'get_artwork_info',
+                  return_value=ArtworkInfo(width=3000, height=2000, imageuri='/artwork/123'))
+    def test_large_artwork_is_requested_at_target_size(self, mock_get_artwork_info, mock_get_artwork):
+        apiclient = ApiClient('http://address/')
+        cache = ArtworkCache(target_size=300)
+        cache.update(apiclient, '/artwork_info/123')
+        mock_get_artwork.assert_called_once_with('/artwork/123', (300, 200))
+        self.assertEqual(cache.current_image, b'small')
+        self.assertEqual(cache.sized_requests, 1)
+        self.assertEqual(cache.sized_downloads, 1)
+        self.assertFalse(cache.sizes_ignored)
+        self.assertEqual(cache.bytes_downloaded, 5)
+
+    def test_large_originals_are_skipped_if_the_server_does_not_scale(self):
+        apiclient = ApiClient('http://address/')
+        cache = ArtworkCache(target_size=300)
+        infos = {'/artwork_info/1': ArtworkInfo(width=3000, height=2000, imageuri='/artwork/1'),
+                 '/artwork_info/2': ArtworkInfo(width=3000, height=2000, imageuri='/artwork/2'),
+                 '/artwork_info/3': ArtworkInfo(width=1200, height=1200, imageuri='/artwork/3')}
+        original = bytes(300 * 200 * 4 + 64 * 1024 + 1)  # too big to be 300x200
+        with patch.object(ApiClient, 'get_artwork_info', side_effect=infos.get), \
+                patch.object(ApiClient, 'get_artwork', return_value=original) as mock_get_artwork:
+            self.assertEqual(cache.update_inner(apiclient, '/artwork_info/1'), original)
+            self.assertTrue(cache.sizes_ignored)
+            self.assertEqual((cache.sized_requests, cache.sized_downloads), (1, 0))
+            # now known not to be scaled, so not downloaded
+            self.assertIsNone(cache.update_inner(apiclient, '/artwork_info/2'))
+            self.assertEqual(cache.originals_skipped, 1)
+            # smaller originals still are
+            self.assertEqual(cache.update_inner(apiclient, '/artwork_info/3'), original)
+            self.assertEqual([args[0][0] for args in mock_get_artwork.call_args_list], ['/artwork/1', '/artwork/3'])
+
+    @patch.object(ApiClient, 'get_artwork', return_value=b'small')
+    @patch.object(ApiClient, 'get_artwork_info',
+                  return_value=ArtworkInfo(width=300, height=200, imageuri='/artwork/123'))
+    def test_small_artwork_is_requested_as_is(self, mock_get_artwork_info, mock_get_artwork):
+        apiclient = ApiClient('http://address/')
+        cache = ArtworkCache(target_size=300)
+        cache.update(apiclient, '/artwork_info/123')
+        mock_get_artwork.assert_called_once_with('/artwork/123', None)
+        self.assertEqual(cache.sized_requests, 0)
+
+    @patch.object(ApiClient, 'get_artwork', return_value=b'logo')
+    @patch.object(ApiClient, 'get_artwork_info')
+    def test_non_piju_artwork_has_no_info(self, mock_get_artwork_info, mock_get_artwork):
+        apiclient = ApiClient('http://address/')
+        cache = ArtworkCache(target_size=300)
+        cache.update(apiclient, 'http://radio/logo.svg')
+        mock_get_artwork_info.assert_not_called()
+        mock_get_artwork.assert_called_once_with('http://radio/logo.svg', None)
+
+
+class FakeDecoder:
+    def __init__(self, image_uri, result=('decoded', 100)):
+        self.image_uri = image_uri
+        self.result = result
+        self.chunks = []
+        self.finished = False
+        self.aborted = False
+
+    def feed(self, chunk):
+        self.chunks.append(chunk)
+        return True
+
+    def finish(self):
+        self.finished = True
+        return self.result
+
+    def abort(self):
+        self.aborted = True
+
+
+class TestIncrementalDecode(unittest.TestCase):
+    def setUp(self):
+        self.decoders = []
+        self.cache = ArtworkCache()
+        self.cache.make_decoder = self.make_decoder
+
+    def make_decoder(self, image_uri):
+        self.decoders.append(FakeDecoder(image_uri))
+        return self.decoders[-1]
+
+    @patch.object(ApiClient, 'get_artwork')
+    def test_artwork_is_decoded_as_it_downloads(self, mock_get_artwork):
+        def get_artwork(uri, size, on_chunk):
+            on_chunk(b'art')
+            on_chunk(b'work')
+            return bytearray(b'artwork')
+        mock_get_artwork.side_effect = get_artwork
+        apiclient = ApiClient('http://address/')
+        self.assertEqual(self.cache.update_inner(apiclient, 'http://radio/logo.png'), b'artwork')
+        self.assertEqual(self.decoders[0].image_uri, 'http://radio/logo.png')
+        self.assertEqual(self.decoders[0].chunks, [b'art', b'work'])
+        self.assertEqual(self.cache.get_decoded('http://radio/logo.png'), 'decoded')
+        self.assertEqual(self.cache.total_bytes, len(b'artwork') + 100)
+
+    @patch.object(ApiClient, 'get_artwork', return_value=bytearray(b'artwork'))
+    @patch.object(ApiClient, 'get_artwork_info',
+                  return_value=ArtworkInfo(width=300, height=200, imageuri='/artwork/123'))
+    def test_decoded_under_the_status_uri(self, mock_get_artwork_info, mock_get_artwork):
+        apiclient = ApiClient('http://address/')
+        self.cache.update_inner(apiclient, '/artwork_info/123')
+        mock_get_artwork.assert_called_once_with('/artwork/123', None, on_chunk=self.decoders[0].feed)
+        self.assertEqual(self.cache.get_decoded('/artwork_info/123'), 'decoded')
+
+    @patch.object(ApiClient, 'get_artwork', return_value=None)
+    def test_failed_download_aborts_decoder(self, mock_get_artwork):
+        apiclient = ApiClient('http://address/')
+        self.assertIsNone(self.cache.update_inner(apiclient, 'http://radio/logo.png'))
+        self.assertTrue(self.decoders[0].aborted)
+        self.assertFalse(self.decoders[0].finished)
+
+    @patch.object(ApiClient, 'get_artwork', return_value=bytearray(b'<svg/>'))
+    def test_undecoded_artwork_is_left_for_later(self, mock_get_artwork):
+        self.cache.make_decoder = lambda image_uri: FakeDecoder(image_uri, result=None)
+        apiclient = ApiClient('http://address/')
+        self.assertEqual(self.cache.update_inner(apiclient, 'http://radio/logo.svg'), b'<svg/>')
+        self.assertIsNone(self.cache.get_decoded('http://radio/logo.svg'))
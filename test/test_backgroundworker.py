@@ -0,0 +1,72 @@
+import threading
+import unittest
+
+from backgroundworker import LatestJobWorker
+
+
+class TestLatestJobWorker(unittest.TestCase):
+    def test_result_is_delivered(self):
+        worker = LatestJobWorker('test')
+        done = threading.Event()
+        results = []
+
+        def on_done(job, result):
+            results.append(result)
+            done.set()
+
+        worker.submit(on_done, lambda job, value: value * 2, 21)
+        self.assertTrue(done.wait(5))
+        self.assertEqual(results, [42])
+
+    def test_superseded_jobs_are_dropped(self):
+        worker = LatestJobWorker('test')
+        release = threading.Event()
+        started = threading.Event()
+        done = threading.Event()
+        results = []
+
+        def blocking_job(job, value):
+            started.set()
+            release.wait(5)
+            return value
+
+        def on_done(job, result):
+            results.append(result)
+            done.set()
+
+        first = worker.submit(on_done, blocking_job, 'first')
+        self.assertTrue(started.wait(5))
+        worker.submit(on_done, lambda job, value: value, 'second')
+        worker.submit(on_done, lambda job, value: value, 'third')
+        self.assertTrue(first.cancelled)
+        release.set()
+        self.assertTrue(done.wait(5))
+        self.assertEqual(results, ['third'])
+
+    def test_cancel(self):
+        worker = LatestJobWorker('test')
+        release = threading.Event()
+        started = threading.Event()
+        results = []
+
+        def blocking_job(job):
+            started.set()
+            release.wait(5)
+            return 'result'
+
+        job = worker.submit(lambda job, result: results.append(result), blocking_job)
+        self.assertTrue(started.wait(5))
+        worker.cancel()
+        self.assertTrue(job.cancelled)
+        release.set()
+        flushed = threading.Event()
+        worker.submit(lambda job, result: flushed.set(), lambda job: None)
+        self.assertTrue(flushed.wait(5))
+        self.assertEqual(results, [])
+
+    def test_failed_job_does_not_stop_worker(self):
+        worker = LatestJobWorker('test')
+        done = threading.Event()
+        worker.submit(lambda job, result: done.set(), lambda job: 1 / 0)
+        worker.submit(lambda job, result: done.set(), lambda job: None)
+        self.assertTrue(done.wait(5))
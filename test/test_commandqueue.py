@@ -0,0 +1,105 @@
+import threading
+import unittest
+
+from commandqueue import CommandDispatcher, LatencyStats
+from engine import Engine
+
+
+class TestCommandDispatcher(unittest.TestCase):
+    def setUp(self):
+        self.engine = Engine()
+        self.engine.start()
+
+    def tearDown(self):
+        self.engine.stop()
+
+    def test_commands_run_in_order(self):
+        dispatcher = CommandDispatcher(self.engine)
+        done = threading.Event()
+        ran = []
+        results = []
+        for name in ('first', 'second', 'third'):
+            dispatcher.submit(name, lambda name=name: ran.append(name) or True, results.append)
+        dispatcher.submit('last', lambda: True, lambda success: done.set())
+        self.assertTrue(done.wait(5))
+        self.assertEqual(ran, ['first', 'second', 'third'])
+        self.assertEqual(results, [True, True, True])
+        self.assertEqual(dispatcher.in_flight, 0)
+
+    def test_commands_submitted_before_the_engine_starts(self):
+        engine = Engine('engine-late')
+        try:
+            dispatcher = CommandDispatcher(engine)
+            done = threading.Event()
+            results = []
+            dispatcher.submit('early', lambda: True, lambda success: (results.append(success), done.set()))
+            engine.start()
+            self.assertTrue(done.wait(5))
+            self.assertEqual(results, [True])
+        finally:
+            engine.stop()
+
+    def test_submit_does_not_wait_for_the_command(self):
+        dispatcher = CommandDispatcher(self.engine)
+        release = threading.Event()
+        done = threading.Event()
+        dispatcher.submit('slow', lambda: release.wait(5), lambda success: done.set())
+        # submit has returned while the command is still blocked
+        self.assertEqual(dispatcher.in_flight, 1)
+        release.set()
+        self.assertTrue(done.wait(5))
+        self.assertEqual(dispatcher.in_flight, 0)
+
+    def test_failures_are_reported(self):
+        dispatcher = CommandDispatcher(self.engine)
+        done = threading.Event()
+        results = []
+
+        def raises():
+            raise RuntimeError("test")
+
+        dispatcher.submit('fail', lambda: False, results.append)
+        dispatcher.submit('raise', raises, results.append)
+        dispatcher.submit('succeed', lambda: True, lambda success: (results.append(success), done.set()))
+        self.assertTrue(done.wait(5))
+        self.assertEqual(results, [False, False, True])
+
+    def test_commands_time_out(self):
+        dispatcher = CommandDispatcher(self.engine, timeout=0.05)
+        release = threading.Event()
+        done = threading.Event()
+        results = []
+        dispatcher.submit('hang', lambda: release.wait(5), results.append)
+        dispatcher.submit('succeed', lambda: True, lambda success: (results.append(success), done.set()))
+        self.assertTrue(done.wait(5))
+        release.set()
+        self.assertEqual(results, [False, True])
+
+    def test_callbacks_are_posted(self):
+        posted = []
+        done = threading.Event()
+
+        def post(fn, *args):
+            posted.append(fn)
+            fn(*args)
+
+        completed = []
+        dispatcher = CommandDispatcher(self.engine, post=post, on_complete=lambda: completed.append(True))
+        dispatcher.submit('command', lambda: True, lambda success: done.set())
+        self.assertTrue(done.wait(5))
+        self.assertEqual(posted, [dispatcher._done])  # pylint: disable=protected-access
+        self.assertEqual(completed, [True])
+        self.assertEqual(dispatcher.latency.summary()['command'][0], 1)
+
+
+class TestLatencyStats(unittest.TestCase):
+    def test_summary(self):
+        stats = LatencyStats()
+        stats.record('tap', 0.01)
+        stats.record('tap', 0.03)
+        stats.record('other', 0.5)
+        count, mean, maximum = stats.summary()['tap']
+        self.assertEqual(count, 2)
+        self.assertAlmostEqual(mean, 0.02)
+        self.assertAlmostEqual(maximum, 0.03)
+        self.assertEqual(stats.summary()['other'][0], 1)
@@ -0,0 +1,88 @@
+import os
+import tempfile
+import unittest
+from unittest.mock import patch
+
+from apiclient import ApiClient
+from artworkcache import ArtworkCache
+from diskcache import DiskArtworkCache
+
+
+class TestDiskArtworkCache(unittest.TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.directory = self.tmpdir.name
+
+    def tearDown(self):
+        self.tmpdir.cleanup()
+
+    def test_get_missing(self):
+        cache = DiskArtworkCache(self.directory)
+        self.assertIsNone(cache.get('http://server/artwork/1'))
+
+    def test_put_then_get_after_restart(self):
+        cache = DiskArtworkCache(self.directory)
+        cache.put('http://server/artwork/1', b'artwork one')
+        cache = DiskArtworkCache(self.directory)
+        self.assertEqual(cache.get('http://server/artwork/1')[:], b'artwork one')
+        self.assertEqual(cache.total_bytes, len(b'artwork one'))
+
+    def test_identical_artwork_is_stored_once(self):
+        cache = DiskArtworkCache(self.directory)
+        cache.put('http://server/artwork/1', b'album artwork')
+        cache.put('http://server/artwork/2', b'album artwork')
+        self.assertEqual(len(os.listdir(cache.objects_dir)), 1)
+        self.assertEqual(len(os.listdir(cache.refs_dir)), 2)
+        self.assertEqual(cache.get('http://server/artwork/2')[:], b'album artwork')
+
+    def test_oldest_written_is_evicted(self):
+        cache = DiskArtworkCache(self.directory, max_bytes=10)
+        cache.put('a', b'aaaa')
+        cache.objects[next(iter(cache.objects))] = (0, 4)  # make sure it's the oldest
+        cache.put('b', b'bbbb')
+        cache.put('c', b'cccc')
+        self.assertIsNone(cache.get('a'))
+        self.assertEqual(cache.get('b')[:], b'bbbb')
+        self.assertEqual(cache.get('c')[:], b'cccc')
+        self.assertEqual(len(os.listdir(cache.objects_dir)), 2)
+        # the stale ref was removed on lookup
+        self.assertEqual(len(os.listdir(cache.refs_dir)), 2)
+
+    def test_temporary_files_are_removed_on_startup(self):
+        DiskArtworkCache(self.directory)
+        with open(os.path.join(self.directory, 'objects', '.partial'), 'wb') as handle:
+            handle.write(b'part')
+        cache = DiskArtworkCache(self.directory)
+        self.assertEqual(os.listdir(cache.objects_dir), [])
+        self.assertEqual(cache.total_bytes, 0)
+
+    def test_no_files_written_on_read(self):
+        cache = DiskArtworkCache(self.directory)
+        cache.put('a', b'aaaa')
+        before = {name: os.stat(os.path.join(root, name)).st_mtime_ns
+                  for root, _, names in os.walk(self.directory) for name in names}
+        cache.get('a')
+        after = {name: os.stat(os.path.join(root, name)).st_mtime_ns
+                 for root, _, names in os.walk(self.directory) for name in names}
+        self.assertEqual(before, after)
+
+
+class TestArtworkCacheWithDisk(unittest.TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+
+    def tearDown(self):
+        self.tmpdir.cleanup()
+
+    @patch.object(ApiClient, 'get_artwork', return_value=b'artwork')
+    def test_artwork_survives_restart(self, mock_get_artwork):
+        apiclient = ApiClient('http://address/')
+        cache = ArtworkCache(disk_cache=DiskArtworkCache(self.tmpdir.name))
+        cache.update(apiclient, 'http://server/one.jpg')
+        mock_get_artwork.assert_called_once()
+
+        cache = ArtworkCache(disk_cache=DiskArtworkCache(self.tmpdir.name))
+        cache.update(apiclient, 'http://server/one.jpg')
+        mock_get_artwork.assert_called_once()
+        self.assertEqual(cache.current_image[:], b'artwork')
+        self.assertEqual(cache.disk_hits, 1)
@@ -0,0 +1,69 @@
+import asyncio
+import threading
+import unittest
+
+from engine import Engine, run_blocking
+
+
+class TestEngine(unittest.TestCase):
+    def setUp(self):
+        self.engine = Engine()
+        self.engine.start()
+
+    def tearDown(self):
+        self.engine.stop()
+
+    def test_run_returns_result(self):
+        async def add(a, b):
+            await asyncio.sleep(0)
+            return a + b
+
+        self.assertEqual(self.engine.run(add(1, 2)).result(5), 3)
+
+    def test_call_soon_runs_on_engine_thread(self):
+        threads = []
+        done = threading.Event()
+        self.engine.call_soon(lambda: (threads.append(threading.current_thread()), done.set()))
+        self.assertTrue(done.wait(5))
+        self.assertEqual(threads, [self.engine.thread])
+
+    def test_blocking_calls_overlap(self):
+        # two calls that each wait for the other can only complete if they run concurrently
+        first = threading.Event()
+        second = threading.Event()
+
+        def wait_for(mine, theirs):
+            mine.set()
+            return theirs.wait(5)
+
+        async def both():
+            return await asyncio.gather(run_blocking(wait_for, first, second),
+                                        run_blocking(wait_for, second, first))
+
+        self.assertEqual(self.engine.run(both()).result(5), [True, True])
+
+    def test_run_blocking_times_out(self):
+        release = threading.Event()
+
+        async def hang():
+            try:
+                await run_blocking(release.wait, 5, timeout=0.05)
+            except asyncio.TimeoutError:
+                return 'timed out'
+            return 'completed'
+
+        self.assertEqual(self.engine.run(hang()).result(5), 'timed out')
+        release.set()
+
+    def test_stop_cancels_tasks(self):
+        started = threading.Event()
+
+        async def forever():
+            started.set()
+            await asyncio.sleep(3600)
+
+        future = self.engine.run(forever())
+        self.assertTrue(started.wait(5))
+        self.engine.stop()
+        self.assertFalse(self.engine.thread.is_alive())
+        self.assertTrue(future.cancelled())
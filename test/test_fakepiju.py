@@ -0,0 +1,82 @@
+import logging
+import unittest
+
+from apiclient import CURRENT_STATUS_ERROR, ApiClient
+from fakepiju import SCENARIOS, FakePijuServer, FakePijuState, ScenarioRunner, load_scenario
+
+logging.disable(logging.CRITICAL)
+
+
+class TestScenarioSteps(unittest.TestCase):
+    def setUp(self):
+        self.state = FakePijuState()
+        self.messages = []
+
+    def run_steps(self, steps):
+        ScenarioRunner(self.state, steps, log=self.messages.append).run()
+
+    def test_player_and_repeat(self):
+        self.run_steps([{'player': 'pause'}, {'repeat': 3, 'steps': [{'player': 'next'}]}])
+        self.assertEqual(self.state.player_status, 'paused')
+        self.assertEqual(self.state.track_index, 4)
+
+    def test_set_notifies(self):
+        version = self.state.version
+        self.run_steps([{'set': {'worker_status': 'Scanning'}}, {'log': 'done'}])
+        self.assertEqual(self.state.worker_status, 'Scanning')
+        self.assertEqual(self.state.version, version + 1)
+        self.assertEqual(self.messages, ['done'])
+
+    def test_set_rejects_unknown_attribute(self):
+        with self.assertRaises(ValueError):
+            self.run_steps([{'set': {'version': 10}}])
+
+    def test_unknown_step(self):
+        with self.assertRaises(ValueError):
+            self.run_steps([{'jump': 1}])
+
+    def test_builtin_scenarios_are_valid(self):
+        for name in SCENARIOS:
+            for step in load_scenario(name):
+                self.assertEqual(len(step), 2 if 'repeat' in step else 1, (name, step))
+                if 'set' in step:
+                    self.assertLessEqual(set(step['set']), FakePijuState.SCRIPTABLE, (name, step))
+
+    def test_stop_interrupts_sleep(self):
+        runner = ScenarioRunner(self.state, [{'sleep': 60}, {'player': 'next'}]).start()
+        runner.stop()
+        runner.thread.join(1)
+        self.assertFalse(runner.thread.is_alive())
+        self.assertEqual(self.state.track_index, 1)
+
+
+class TestScriptedFailures(unittest.TestCase):
+    def setUp(self):
+        self.server = FakePijuServer().start()
+        self.apiclient = ApiClient(self.server.base_uri)
+
+    def tearDown(self):
+        self.apiclient.close()
+        self.server.stop()
+
+    def test_error_burst(self):
+        self.server.state.update(fail_requests=2, fail_status=503)
+        self.assertIs(self.apiclient.get_current_state(), CURRENT_STATUS_ERROR)
+        self.assertIs(self.apiclient.get_current_state(), CURRENT_STATUS_ERROR)
+        self.assertEqual(self.apiclient.get_current_state().status, 'playing')
+
+    def test_outage(self):
+        self.server.state.update(outage=True)
+        self.assertIs(self.apiclient.get_current_state(), CURRENT_STATUS_ERROR)
+        self.server.state.update(outage=False)
+        self.assertEqual(self.apiclient.get_current_state().status, 'playing')
+
+    def test_stream(self):
+        self.server.state.update(stream_name='Fake Radio')
+        status = self.apiclient.get_current_state()
+        self.assertEqual(status.current_stream, 'Fake Radio')
+        self.assertIsNotNone(self.apiclient.get_artwork(status.current_artwork))
+
+    def test_missing_artwork(self):
+        self.server.state.update(artwork_mode='missing')
+        self.assertIsNone(self.apiclient.get_artwork('/artwork/1'))
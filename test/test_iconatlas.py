@@ -0,0 +1,82 @@
+import json
+import os
+import os.path
+import tempfile
+import unittest
+
+from iconatlas import ATLAS_IMAGE, ATLAS_INDEX, ICON_DIR, ICON_VARIANTS, icon_leafname, pack, read_index, write_index
+
+
+class TestIconLeafname(unittest.TestCase):
+    def test_leafnames(self):
+        self.assertEqual(icon_leafname('play', True, 100), 'play-dark_100.png')
+        self.assertEqual(icon_leafname('play', False, 200), 'play-light_200.png')
+        self.assertEqual(icon_leafname('circle', None, 16), 'circle_16.png')
+        self.assertEqual(icon_leafname('window-close', None, 0), 'window-close.png')
+
+    def test_every_variant_exists(self):
+        for variant in ICON_VARIANTS:
+            self.assertTrue(os.path.exists(os.path.join(ICON_DIR, icon_leafname(*variant))), variant)
+
+
+class TestPack(unittest.TestCase):
+    def test_no_overlaps(self):
+        sizes = {f'big{i}': (200, 200) for i in range(8)}
+        sizes.update({f'small{i}': (100, 100) for i in range(8)})
+        sizes.update({'tiny': (16, 16), 'close': (24, 24)})
+        (width, height), positions = pack(sizes)
+        self.assertEqual(set(positions), set(sizes))
+        cells = set()
+        for name, (x, y, icon_width, icon_height) in positions.items():
+            self.assertEqual((icon_width, icon_height), sizes[name])
+            self.assertLessEqual(x + icon_width, width)
+            self.assertLessEqual(y + icon_height, height)
+            pixels = {(px, py) for px in range(x, x + icon_width, 4) for py in range(y, y + icon_height, 4)}
+            self.assertFalse(cells & pixels, name)
+            cells |= pixels
+        # not much wasted space
+        area = sum(w * h for w, h in sizes.values())
+        self.assertLess(width * height, area * 1.5)
+
+    def test_empty(self):
+        self.assertEqual(pack({}), ((0, 0), {}))
+
+
+class TestIndex(unittest.TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()  # pylint: disable=consider-using-with
+        self.icon_dir = self.tmpdir.name
+        for leafname in ('a.png', 'b.png'):
+            self.touch(leafname, 1000)
+
+    def tearDown(self):
+        self.tmpdir.cleanup()
+
+    def touch(self, leafname, mtime):
+        path = os.path.join(self.icon_dir, leafname)
+        with open(path, 'wb'):
+            pass
+        os.utime(path, (mtime, mtime))
+
+    def write_atlas(self, mtime):
+        self.touch(ATLAS_IMAGE, mtime)
+        write_index({'a.png': (0, 0, 10, 10), 'b.png': (10, 0, 5, 5)}, self.icon_dir)
+        os.utime(os.path.join(self.icon_dir, ATLAS_INDEX), (mtime, mtime))
+
+    def test_no_atlas(self):
+        self.assertIsNone(read_index(self.icon_dir))
+
+    def test_read(self):
+        self.write_atlas(2000)
+        self.assertEqual(read_index(self.icon_dir), {'a.png': (0, 0, 10, 10), 'b.png': (10, 0, 5, 5)})
+
+    def test_out_of_date(self):
+        self.write_atlas(2000)
+        self.touch('b.png', 3000)
+        self.assertIsNone(read_index(self.icon_dir))
+
+    def test_corrupt(self):
+        self.write_atlas(2000)
+        with open(os.path.join(self.icon_dir, ATLAS_INDEX), 'w', encoding='utf-8') as handle:
+            json.dump({'image': ATLAS_IMAGE}, handle)
+        self.assertIsNone(read_index(self.icon_dir))
@@ -0,0 +1,129 @@
+import threading
+import unittest
+from unittest.mock import patch
+
+from loopwatchdog import MainLoopWatchdog
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+class FakeMainLoop:
+    """
+    Collects the timers and posted callbacks, to be run by the test
+    """
+    def __init__(self):
+        self.timers = []  # (delay, callback)
+        self.posted = []  # (fn, args)
+
+    def timer_add(self, delay, callback):
+        self.timers.append((delay, callback))
+
+    def post(self, fn, *args):
+        self.posted.append((fn, args))
+
+    def run_timer(self):
+        _, callback = self.timers.pop(0)
+        return callback()
+
+    def run_posted(self):
+        fn, args = self.posted.pop(0)
+        return fn(*args)
+
+
+class TestMainLoopWatchdog(unittest.TestCase):
+    def setUp(self):
+        self.clock = FakeClock()
+        self.loop = FakeMainLoop()
+        self.watchdog = MainLoopWatchdog(self.loop.post, self.loop.timer_add, threshold=0.25, interval=0.5,
+                                         clock=self.clock)
+        self.watchdog._schedule_beat()  # as start() does, without the thread
+
+    def test_heartbeat_on_time(self):
+        self.clock.now += 0.5
+        self.assertFalse(self.loop.run_timer())
+        self.assertEqual(self.watchdog.stalls, 0)
+        self.assertEqual(self.loop.timers[0][0], 0.5)
+
+    @patch.object(MainLoopWatchdog, 'capture_stack', return_value='stack')
+    def test_late_heartbeat_is_a_stall(self, mock_capture_stack):
+        self.clock.now += 0.6
+        self.watchdog.check()
+        mock_capture_stack.assert_not_called()
+        self.clock.now += 0.4
+        self.watchdog.check()
+        self.watchdog.check()
+        mock_capture_stack.assert_called_once()
+        self.loop.run_timer()
+        self.assertEqual(self.watchdog.stalls, 1)
+        self.assertAlmostEqual(self.watchdog.longest_stall, 0.5)
+        # the next stall is reported too
+        self.clock.now += 2
+        self.watchdog.check()
+        self.loop.run_timer()
+        self.assertEqual(mock_capture_stack.call_count, 2)
+        self.assertEqual(self.watchdog.stalls, 2)
+        self.assertAlmostEqual(self.watchdog.total_stall, 2)
+
+    def test_one_probe_at_a_time(self):
+        self.watchdog.check()
+        self.watchdog.check()
+        self.assertEqual(len(self.loop.posted), 1)
+        self.clock.now += 0.1
+        self.assertFalse(self.loop.run_posted())
+        self.watchdog.check()
+        self.assertEqual(len(self.loop.posted), 1)
+
+    @patch.object(MainLoopWatchdog, 'capture_stack', return_value='stack')
+    def test_heartbeat_runs_while_stall_is_reported(self, mock_capture_stack):
+        self.clock.now += 1
+
+        def beat_then_capture():
+            # the heartbeat gets in between the check and the logging
+            self.loop.run_timer()
+            return 'stack'
+
+        mock_capture_stack.side_effect = beat_then_capture
+        self.watchdog.check()
+        mock_capture_stack.assert_called_once()
+        self.assertEqual(self.watchdog.stalls, 1)
+
+    @patch.object(MainLoopWatchdog, 'capture_stack', return_value='stack')
+    def test_paused(self, mock_capture_stack):
+        self.watchdog.pause()
+        self.assertFalse(self.watchdog.awake.is_set())
+        self.clock.now += 10
+        # the heartbeat from before the pause runs, but is not rescheduled, and nothing counts as a stall
+        self.loop.run_timer()
+        self.assertEqual(self.loop.timers, [])
+        self.watchdog.check()
+        self.assertEqual(self.loop.posted, [])
+        mock_capture_stack.assert_not_called()
+        self.assertEqual(self.watchdog.stalls, 0)
+        self.watchdog.resume()
+        self.assertTrue(self.watchdog.awake.is_set())
+        self.assertEqual(len(self.loop.timers), 1)
+        self.clock.now += 0.5
+        self.loop.run_timer()
+        self.assertEqual(self.watchdog.stalls, 0)
+
+    def test_resumed_before_the_heartbeat_runs(self):
+        self.watchdog.pause()
+        self.watchdog.resume()
+        # the pending heartbeat carries on, rather than a second being added
+        self.assertEqual(len(self.loop.timers), 1)
+        self.clock.now += 0.5
+        self.loop.run_timer()
+        self.assertEqual(self.watchdog.stalls, 0)
+        self.assertEqual(len(self.loop.timers), 1)
+
+    def test_capture_stack(self):
+        self.watchdog.main_thread_id = threading.get_ident()
+        self.assertIn('test_capture_stack', self.watchdog.capture_stack())
+        self.watchdog.main_thread_id = -1
+        self.assertEqual(self.watchdog.capture_stack(), '')
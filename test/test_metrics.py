@@ -0,0 +1,89 @@
+import unittest
+
+import requests
+
+from metrics import BUCKETS, Histogram, Metrics
+from metricsserver import MetricsServer
+
+
+class TestHistogram(unittest.TestCase):
+    def test_buckets(self):
+        histogram = Histogram()
+        for seconds in (0.0005, 0.001, 0.003, 20):
+            histogram.observe(seconds)
+        self.assertEqual(histogram.counts[0], 2)  # bucket bounds are inclusive
+        self.assertEqual(histogram.counts[BUCKETS.index(0.005)], 1)
+        self.assertEqual(histogram.counts[-1], 1)
+        self.assertEqual(histogram.count, 4)
+        self.assertAlmostEqual(histogram.total, 20.0045)
+        self.assertEqual(histogram.maximum, 20)
+
+    def test_quantile(self):
+        histogram = Histogram()
+        for _ in range(95):
+            histogram.observe(0.002)
+        for _ in range(5):
+            histogram.observe(0.3)
+        self.assertEqual(histogram.quantile(0.5), 0.0025)
+        self.assertEqual(histogram.quantile(0.95), 0.0025)
+        self.assertEqual(histogram.quantile(0.99), 0.3)  # not the bucket's bound of 0.5
+
+
+class TestMetrics(unittest.TestCase):
+    def setUp(self):
+        self.metrics = Metrics()
+
+    def test_timer(self):
+        with self.metrics.time('stage'):
+            pass
+        histograms, _ = self.metrics.snapshot()
+        self.assertEqual(histograms['stage'].count, 1)
+
+    def test_snapshot_is_a_copy(self):
+        self.metrics.observe('stage', 0.1)
+        self.metrics.increment('event')
+        histograms, counters = self.metrics.snapshot()
+        self.metrics.observe('stage', 0.1)
+        self.metrics.increment('event', 2)
+        self.assertEqual(histograms['stage'].count, 1)
+        self.assertEqual(counters, {'event': 1})
+
+    def test_prometheus_text(self):
+        self.metrics.observe('status request', 0.003)
+        self.metrics.observe('status request', 0.2)
+        self.metrics.increment('connection error', 3)
+        lines = self.metrics.prometheus_text().splitlines()
+        self.assertIn('piju_touchscreen_stage_seconds_bucket{stage="status request",le="0.0025"} 0', lines)
+        self.assertIn('piju_touchscreen_stage_seconds_bucket{stage="status request",le="0.005"} 1', lines)
+        self.assertIn('piju_touchscreen_stage_seconds_bucket{stage="status request",le="+Inf"} 2', lines)
+        self.assertIn('piju_touchscreen_stage_seconds_count{stage="status request"} 2', lines)
+        self.assertIn('piju_touchscreen_events_total{event="connection error"} 3', lines)
+
+    def test_summary(self):
+        self.metrics.observe('display', 0.002)
+        self.metrics.increment('update suppressed')
+        self.assertEqual(self.metrics.summary(),
+                         "Metrics: display n=1 mean=2.0ms p95<=2.0ms max=2.0ms; update suppressed=1")
+
+
+class TestMetricsServer(unittest.TestCase):
+    def test_serves_metrics(self):
+        metrics = Metrics()
+        metrics.increment('update dispatched')
+        server = MetricsServer.start(0, metrics_to_serve=metrics)
+        try:
+            base_uri = f'http://127.0.0.1:{server.server_address[1]}'
+            response = requests.get(base_uri + '/metrics', timeout=1)
+            self.assertEqual(response.status_code, 200)
+            self.assertTrue(response.headers['Content-Type'].startswith('text/plain; version=0.0.4'))
+            self.assertIn('piju_touchscreen_events_total{event="update dispatched"} 1', response.text)
+            self.assertEqual(requests.get(base_uri + '/', timeout=1).status_code, 404)
+        finally:
+            server.stop()
+
+    def test_port_in_use(self):
+        server = MetricsServer.start(0)
+        try:
+            self.assertIsNone(MetricsServer.start(server.server_address[1]))
+        finally:
+            server.stop()
@@ -0,0 +1,116 @@
+import asyncio
+import time
+import unittest
+
+from apiclient import CURRENT_STATUS_ERROR, CurrentStatus
+from pollscheduler import PollScheduler
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+def mk_status(state, track=None):
+    return CurrentStatus(status=state, current_track=track or {}, current_stream=None, current_artwork=None,
+                         volume=50, scanning=False, current_track_index=None, maximum_track_index=None)
+
+
+class TestNextInterval(unittest.TestCase):
+    def setUp(self):
+        self.clock = FakeClock()
+        self.scheduler = PollScheduler(interval=1, fast_interval=0.25, max_interval=30, backoff_after=60,
+                                       clock=self.clock)
+
+    def test_playing_uses_normal_interval(self):
+        self.scheduler.observe(mk_status('playing'), False)
+        self.clock.now += 600
+        self.assertEqual(self.scheduler.next_interval(), 1)
+
+    def test_expedite_polls_fast_then_reverts(self):
+        self.scheduler.observe(mk_status('playing'), False)
+        self.scheduler.expedite()
+        self.assertEqual(self.scheduler.next_interval(), 0.25)
+        self.assertTrue(self.scheduler.wake_event.is_set())
+        self.clock.now += PollScheduler.FAST_DURATION
+        self.assertEqual(self.scheduler.next_interval(), 1)
+
+    def test_stopped_backs_off_after_delay(self):
+        self.scheduler.observe(mk_status('stopped'), False)
+        self.clock.now += 59
+        self.assertEqual(self.scheduler.next_interval(), 1)
+        self.clock.now += 1
+        intervals = [self.scheduler.next_interval() for _ in range(7)]
+        self.assertEqual(intervals, [1, 2, 4, 8, 16, 30, 30])
+
+    def test_connection_error_backs_off(self):
+        self.scheduler.observe(CURRENT_STATUS_ERROR, True)
+        self.clock.now += 60
+        self.scheduler.next_interval()
+        self.assertEqual(self.scheduler.next_interval(), 2)
+
+    def test_state_change_resets_backoff(self):
+        self.scheduler.observe(mk_status('paused'), False)
+        self.clock.now += 100
+        for _ in range(5):
+            self.scheduler.next_interval()
+        self.scheduler.observe(mk_status('playing'), False)
+        self.assertEqual(self.scheduler.next_interval(), 1)
+        self.scheduler.observe(mk_status('paused'), False)
+        self.assertEqual(self.scheduler.next_interval(), 1)
+
+    def test_fast_near_end_of_track(self):
+        self.scheduler.observe(mk_status('playing', {'title': 'One', 'duration': 200}), False)
+        # the start of the first track was not seen, so its end cannot be predicted
+        self.clock.now += 199.5
+        self.assertEqual(self.scheduler.next_interval(), 1)
+        self.scheduler.observe(mk_status('playing', {'title': 'Two', 'duration': 100}), False)
+        self.clock.now += 50
+        self.assertEqual(self.scheduler.next_interval(), 1)
+        self.clock.now += 49.5
+        self.assertEqual(self.scheduler.next_interval(), 0.25)
+        self.clock.now += 1
+        self.assertEqual(self.scheduler.next_interval(), 0.25)
+        self.clock.now += 1
+        self.assertEqual(self.scheduler.next_interval(), 1)
+
+    def test_pause_forgets_track_start(self):
+        self.scheduler.observe(mk_status('playing', {'title': 'One'}), False)
+        self.scheduler.observe(mk_status('playing', {'title': 'Two', 'duration': 100}), False)
+        self.scheduler.observe(mk_status('paused', {'title': 'Two', 'duration': 100}), False)
+        self.scheduler.observe(mk_status('playing', {'title': 'Two', 'duration': 100}), False)
+        self.clock.now += 99.5
+        self.assertEqual(self.scheduler.next_interval(), 1)
+
+    def test_dormant_uses_dormant_interval(self):
+        self.scheduler.dormant_interval = 30
+        self.scheduler.observe(mk_status('paused'), False)
+        self.scheduler.set_dormant(True)
+        self.assertEqual(self.scheduler.next_interval(), 30)
+        self.scheduler.wake_event.clear()
+        self.scheduler.set_dormant(False)
+        self.assertTrue(self.scheduler.wake_event.is_set())
+        self.assertEqual(self.scheduler.next_interval(), 1)
+
+
+class TestWaitAsync(unittest.TestCase):
+    def test_expedite_wakes_the_wait(self):
+        scheduler = PollScheduler(interval=30)
+
+        async def wait_then_expedite():
+            loop = asyncio.get_running_loop()
+            # expedite from another thread, once the wait has started
+            loop.call_later(0.05, lambda: loop.run_in_executor(None, scheduler.expedite))
+            start = time.monotonic()
+            await scheduler.wait_async()
+            return time.monotonic() - start
+
+        self.assertLess(asyncio.run(wait_then_expedite()), 5)
+
+    def test_wait_times_out(self):
+        scheduler = PollScheduler(interval=0.01)
+        asyncio.run(scheduler.wait_async())
+        self.assertFalse(scheduler.async_wake_event.is_set())
@@ -0,0 +1,75 @@
+import threading
+import unittest
+from unittest.mock import patch, call
+
+from apiclient import ApiClient, CurrentStatus
+from artworkcache import ArtworkCache
+from prefetcher import ArtworkPrefetcher
+
+
+def mk_status(track_index, tracklist='/albums/1'):
+    return CurrentStatus(status='playing', current_track={}, current_stream=None, current_artwork=None,
+                         volume=50, scanning=False, current_track_index=track_index, maximum_track_index=3,
+                         current_tracklist=tracklist)
+
+
+ALBUM = {'tracks': [{'artwork': 'http://server/1.jpg'},
+                    '/tracks/2',
+                    {'artwork': 'http://server/3.jpg'}]}
+TRACK_2 = {'artwork': 'http://server/2.jpg'}
+
+
+class TestPrefetcher(unittest.TestCase):
+    def run_prefetch(self, prefetcher, status):
+        done = threading.Event()
+        prefetcher.worker.submit(lambda job, result: done.set(), lambda job: None)  # wait for any earlier job
+        self.assertTrue(done.wait(5))
+        done.clear()
+        original_on_done = prefetcher._on_done
+
+        def on_done(job, count):
+            original_on_done(job, count)
+            done.set()
+
+        with patch.object(prefetcher, '_on_done', side_effect=on_done):
+            prefetcher.on_status(status)
+            self.assertTrue(done.wait(5))
+
+    @patch.object(ApiClient, 'get_artwork', side_effect=lambda uri, size: uri.encode('utf-8'))
+    @patch.object(ApiClient, 'get_json', side_effect=lambda uri: {'/albums/1': ALBUM, '/tracks/2': TRACK_2}[uri])
+    def test_neighbours_are_fetched_and_decoded(self, mock_get_json, mock_get_artwork):
+        cache = ArtworkCache()
+        decoded = []
+        prefetcher = ArtworkPrefetcher(ApiClient('http://address/'), cache,
+                                       lambda job, uri, image: decoded.append(uri))
+        self.run_prefetch(prefetcher, mk_status(2))
+        mock_get_artwork.assert_has_calls([call('http://server/3.jpg', None), call('http://server/1.jpg', None)])
+        self.assertEqual(decoded, ['http://server/3.jpg', 'http://server/1.jpg'])
+        self.assertEqual(cache.get('http://server/3.jpg'), b'http://server/3.jpg')
+
+        # moving on a track fetches the track link, but not the album again, nor cached artwork
+        self.run_prefetch(prefetcher, mk_status(3))
+        mock_get_json.assert_has_calls([call('/albums/1'), call('/tracks/2')])
+        self.assertEqual(mock_get_json.call_count, 2)
+        self.assertEqual(mock_get_artwork.call_count, 3)
+        self.assertEqual(prefetcher.prefetched, 3)
+
+    @patch.object(ApiClient, 'get_json')
+    def test_same_track_is_not_prefetched_again(self, mock_get_json):
+        prefetcher = ArtworkPrefetcher(ApiClient('http://address/'), ArtworkCache())
+        prefetcher.last_request = ('/albums/1', 2)
+        prefetcher.on_status(mk_status(2))
+        prefetcher.on_status(mk_status(None))
+        prefetcher.on_status(mk_status(2, tracklist=None))
+        done = threading.Event()
+        prefetcher.worker.submit(lambda job, result: done.set(), lambda job: None)
+        self.assertTrue(done.wait(5))
+        mock_get_json.assert_not_called()
+
+    @patch.object(ApiClient, 'get_artwork')
+    @patch.object(ApiClient, 'get_json', return_value=None)
+    def test_unavailable_tracklist(self, mock_get_json, mock_get_artwork):
+        prefetcher = ArtworkPrefetcher(ApiClient('http://address/'), ArtworkCache())
+        self.run_prefetch(prefetcher, mk_status(2))
+        mock_get_artwork.assert_not_called()
+        self.assertIsNone(prefetcher.tracklist_uri)
@@ -0,0 +1,164 @@
+import threading
+import unittest
+from unittest.mock import Mock, patch, call
+
+from screenblankbackend import ScreenBlankExecutor, X11Backend, XsetBackend, coalesce, make_backend, \
+    SCREEN_SAVER_ACTIVE, SCREEN_SAVER_RESET
+from screenblankmgr import ScreenBlankMgr, ScreenBlankProfileOnWhenPlaying
+
+
+class TestXsetBackend(unittest.TestCase):
+    @patch('screenblankbackend.subprocess.run')
+    def test_commands(self, mock_run):
+        backend = XsetBackend()
+        backend.set_timeout(300)
+        backend.disable()
+        backend.reset()
+        backend.enable()
+        backend.activate()
+        self.assertEqual(mock_run.call_args_list, [call(['xset', 's', arg], check=False)
+                                                   for arg in ('300', 'off', 'reset', 'on', 'activate')])
+
+    @patch('screenblankbackend.subprocess.run')
+    def test_perform_runs_one_process(self, mock_run):
+        XsetBackend().perform([('disable', ()), ('reset', ())])
+        mock_run.assert_called_once_with(['xset', 's', 'off', 's', 'reset'], check=False)
+
+    @patch('screenblankbackend.subprocess.run', side_effect=FileNotFoundError('xset'))
+    def test_missing_xset_does_not_raise(self, mock_run):
+        XsetBackend().reset()
+        mock_run.assert_called_once()
+
+
+def mk_xlib(timeout=600, interval=30, prefer_blanking=1, allow_exposures=2):
+    xlib = Mock()
+
+    def get_screen_saver(display, *pointers):
+        for pointer, value in zip(pointers, (timeout, interval, prefer_blanking, allow_exposures)):
+            pointer._obj.value = value
+    xlib.XGetScreenSaver.side_effect = get_screen_saver
+    return xlib
+
+
+class TestX11Backend(unittest.TestCase):
+    def test_set_timeout_keeps_other_settings(self):
+        xlib = mk_xlib()
+        backend = X11Backend(xlib, None, 'display')
+        backend.set_timeout(300)
+        xlib.XSetScreenSaver.assert_called_once_with('display', 300, 30, 1, 2)
+        xlib.XFlush.assert_called_once_with('display')
+
+    def test_enable_and_disable(self):
+        xlib = mk_xlib()
+        backend = X11Backend(xlib, None, 'display')
+        backend.disable()
+        backend.enable()
+        self.assertEqual(xlib.XSetScreenSaver.call_args_list, [call('display', 0, 30, 1, 2),
+                                                               call('display', -1, 30, 1, 2)])
+
+    def test_reset_and_activate(self):
+        xlib = mk_xlib()
+        backend = X11Backend(xlib, None, 'display')
+        backend.reset()
+        backend.activate()
+        self.assertEqual(xlib.XForceScreenSaver.call_args_list, [call('display', SCREEN_SAVER_RESET),
+                                                                 call('display', SCREEN_SAVER_ACTIVE)])
+
+    def test_reset_wakes_dpms_only_if_enabled_and_off(self):
+        for enabled, level, expect_force in ((1, 3, True), (1, 0, False), (0, 3, False)):
+            xext = Mock()
+            xext.DPMSCapable.return_value = 1
+
+            def dpms_info(display, power_level, state, level=level, enabled=enabled):
+                power_level._obj.value = level
+                state._obj.value = enabled
+            xext.DPMSInfo.side_effect = dpms_info
+            backend = X11Backend(mk_xlib(), xext, 'display')
+            backend.reset()
+            self.assertEqual(xext.DPMSForceLevel.called, expect_force)
+
+    @patch('screenblankbackend.ctypes.util.find_library', return_value=None)
+    def test_open_without_libx11(self, _):
+        self.assertIsNone(X11Backend.open())
+
+
+class TestMakeBackend(unittest.TestCase):
+    @patch.object(X11Backend, 'open', return_value=None)
+    def test_falls_back_to_xset(self, _):
+        self.assertIsInstance(make_backend('x11'), XsetBackend)
+
+    def test_xset(self):
+        self.assertIsInstance(make_backend('xset'), XsetBackend)
+
+
+class TestCoalesce(unittest.TestCase):
+    def test_keeps_last_timeout_and_last_force(self):
+        self.assertEqual(coalesce([('enable', ()), ('set_timeout', (10,)), ('reset', ()), ('activate', ())]),
+                         [('set_timeout', (10,)), ('activate', ())])
+
+    def test_keeps_both_kinds(self):
+        self.assertEqual(coalesce([('disable', ()), ('reset', ())]), [('disable', ()), ('reset', ())])
+
+    def test_empty(self):
+        self.assertEqual(coalesce([]), [])
+
+
+class BlockingBackend:
+    def __init__(self):
+        self.release = threading.Event()
+        self.started = threading.Event()
+        self.performed = []
+        self.done = threading.Semaphore(0)
+
+    def perform(self, actions):
+        self.started.set()
+        self.release.wait(5)
+        self.performed.append(actions)
+        self.done.release()
+
+
+class TestScreenBlankExecutor(unittest.TestCase):
+    def test_flush_performs_in_background(self):
+        backend = BlockingBackend()
+        executor = ScreenBlankExecutor(backend)
+        executor.disable()
+        executor.reset()
+        executor.flush()  # returns even though the backend is blocked
+        backend.release.set()
+        self.assertTrue(backend.done.acquire(timeout=5))
+        self.assertEqual(backend.performed, [[('disable', ()), ('reset', ())]])
+
+    def test_nothing_is_performed_before_flush(self):
+        backend = BlockingBackend()
+        backend.release.set()
+        executor = ScreenBlankExecutor(backend)
+        executor.reset()
+        self.assertFalse(backend.done.acquire(timeout=0.05))
+        executor.flush()
+        self.assertTrue(backend.done.acquire(timeout=5))
+
+    def test_waiting_actions_are_merged(self):
+        backend = BlockingBackend()
+        executor = ScreenBlankExecutor(backend)
+        executor.reset()
+        executor.flush()
+        self.assertTrue(backend.started.wait(5))
+        # while the first is blocked, queue up more
+        for timeout in (10, 20, 30):
+            executor.set_timeout(timeout)
+            executor.reset()
+            executor.flush()
+        backend.release.set()
+        self.assertTrue(backend.done.acquire(timeout=5))
+        self.assertTrue(backend.done.acquire(timeout=5))
+        self.assertEqual(backend.performed[-1], [('set_timeout', (30,)), ('reset', ())])
+        self.assertEqual(executor.actions_requested, 7)
+
+    def test_manager_uses_backend(self):
+        backend = Mock()
+        performed = threading.Event()
+        backend.perform.side_effect = lambda actions: performed.set()
+        mgr = ScreenBlankMgr(ScreenBlankProfileOnWhenPlaying(), backend)
+        mgr.set_state('playing')
+        self.assertTrue(performed.wait(5))
+        backend.perform.assert_called_once_with([('set_timeout', (3600,))])
@@ -1,7 +1,49 @@
 import unittest
-from unittest.mock import patch, call
+from unittest.mock import Mock, patch, call
 
-from screenblankmgr import ScreenBlankMgr, ScreenBlankProfileNone, PlayingState
+from screenblankmgr import ScreenBlankMgr, ScreenBlankProfileBalanced, ScreenBlankProfileNone, PlayingState
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+class FakeTimers:
+    """
+    Stands in for GLib.timeout_add/source_remove, driven by a FakeClock
+    """
+    def __init__(self, clock):
+        self.clock = clock
+        self.timers = {}  # id -> (due, callback)
+        self.next_id = 1
+
+    def add(self, delay, callback):
+        timer_id = self.next_id
+        self.next_id += 1
+        self.timers[timer_id] = (self.clock.now + delay, callback)
+        return timer_id
+
+    def remove(self, timer_id):
+        del self.timers[timer_id]
+
+    def pending_delays(self):
+        return [due - self.clock.now for due, _ in self.timers.values()]
+
+    def advance(self, seconds):
+        end = self.clock.now + seconds
+        while self.timers:
+            timer_id, (due, callback) = min(self.timers.items(), key=lambda item: item[1][0])
+            if due > end:
+                break
+            self.clock.now = max(self.clock.now, due)
+            del self.timers[timer_id]
+            if callback():
+                self.timers[timer_id] = (self.clock.now, callback)
+        self.clock.now = end
 
 
 class TestSetState(unittest.TestCase):
@@ -33,38 +75,173 @@ class TestSetState(unittest.TestCase):
         mock_on_stop_playing.assert_called_once()
 
     @patch.object(ScreenBlankProfileNone, 'on_playing_tick')
-    def test_five_active_calls_tick(self, mock_on_playing_tick):
+    def test_playing_ticks_every_five_seconds(self, mock_on_playing_tick):
+        clock = FakeClock()
         profile = ScreenBlankProfileNone()
-        mgr = ScreenBlankMgr(profile=profile)
+        mgr = ScreenBlankMgr(profile=profile, clock=clock)
         mgr.set_state('playing')  # set the baseline for playing state active
-        mgr.set_state('playing')
-        mgr.set_state('playing')
-        mgr.set_state('playing')
+        clock.now += 4.9
         mgr.set_state('playing')
         mock_on_playing_tick.assert_not_called()
+        clock.now += 0.1
         mgr.set_state('playing')
         mock_on_playing_tick.assert_called_once()
 
-        mgr.set_state('playing')
-        mgr.set_state('playing')
-        mgr.set_state('playing')
+        clock.now += 4.9
         mgr.set_state('playing')
         mock_on_playing_tick.assert_called_once()
+        clock.now += 0.1
         mgr.set_state('playing')
         calls = [call(), call()]
         mock_on_playing_tick.assert_has_calls(calls)
 
+    @patch.object(ScreenBlankProfileNone, 'on_playing_tick')
+    def test_timing_does_not_depend_on_calls(self, mock_on_playing_tick):
+        clock = FakeClock()
+        profile = ScreenBlankProfileNone()
+        mgr = ScreenBlankMgr(profile=profile, clock=clock)
+        mgr.set_state('playing')
+        for _ in range(100):
+            clock.now += 0.01
+            mgr.set_state('playing')
+        mock_on_playing_tick.assert_not_called()
+        clock.now += 30
+        mgr.set_state('playing')
+        # only one tick, however late
+        mock_on_playing_tick.assert_called_once()
+
     @patch.object(ScreenBlankProfileNone, 'on_stopped_delayed')
-    def test_10_inactive_calls_turns_off_display(self, mock_on_stopped_delayed):
+    def test_10_inactive_seconds_turns_off_display(self, mock_on_stopped_delayed):
+        clock = FakeClock()
         profile = ScreenBlankProfileNone()
-        mgr = ScreenBlankMgr(profile=profile)
+        mgr = ScreenBlankMgr(profile=profile, clock=clock)
         mgr.set_state('paused')  # set the baseline for playing state inactive
         for i in range(9):
+            clock.now += 1
             mgr.set_state('paused')
         mock_on_stopped_delayed.assert_not_called()
+        clock.now += 1
         mgr.set_state('paused')
         mock_on_stopped_delayed.assert_called_once()
         # and check that it's not called again
         for i in range(30):
+            clock.now += 1
             mgr.set_state('paused')
         mock_on_stopped_delayed.assert_called_once()
+
+    @patch.object(ScreenBlankProfileNone, 'on_stopped_delayed')
+    def test_playing_again_cancels_stopped_delayed(self, mock_on_stopped_delayed):
+        clock = FakeClock()
+        mgr = ScreenBlankMgr(profile=ScreenBlankProfileNone(), clock=clock)
+        mgr.set_state('paused')
+        clock.now += 5
+        mgr.set_state('playing')
+        clock.now += 5
+        mgr.set_state('paused')
+        clock.now += 9
+        mgr.set_state('paused')
+        mock_on_stopped_delayed.assert_not_called()
+        clock.now += 1
+        mgr.set_state('paused')
+        mock_on_stopped_delayed.assert_called_once()
+
+
+class TestTimers(unittest.TestCase):
+    def setUp(self):
+        self.clock = FakeClock()
+        self.timers = FakeTimers(self.clock)
+        self.profile = ScreenBlankProfileNone()
+        self.mgr = ScreenBlankMgr(profile=self.profile, clock=self.clock,
+                                  timer_add=self.timers.add, timer_remove=self.timers.remove)
+
+    @patch.object(ScreenBlankProfileNone, 'on_playing_tick')
+    def test_timer_ticks_without_set_state(self, mock_on_playing_tick):
+        self.mgr.set_state('playing')
+        self.assertEqual(self.timers.pending_delays(), [5])
+        self.timers.advance(60)
+        self.assertEqual(mock_on_playing_tick.call_count, 12)
+        self.assertEqual(self.timers.pending_delays(), [5])
+
+    @patch.object(ScreenBlankProfileNone, 'on_stopped_delayed')
+    def test_timer_for_stopped_delayed(self, mock_on_stopped_delayed):
+        self.mgr.set_state('stopped')
+        self.assertEqual(self.timers.pending_delays(), [10])
+        self.timers.advance(60)
+        mock_on_stopped_delayed.assert_called_once()
+        self.assertEqual(self.timers.pending_delays(), [])
+
+    @patch.object(ScreenBlankProfileNone, 'on_stopped_delayed')
+    def test_state_change_replaces_timer(self, mock_on_stopped_delayed):
+        self.mgr.set_state('playing')
+        self.timers.advance(2)
+        self.mgr.set_state('paused')
+        self.assertEqual(self.timers.pending_delays(), [10])
+        self.timers.advance(9.5)
+        mock_on_stopped_delayed.assert_not_called()
+        self.timers.advance(0.5)
+        mock_on_stopped_delayed.assert_called_once()
+
+    def test_repeated_state_keeps_timer(self):
+        self.mgr.set_state('playing')
+        timers = dict(self.timers.timers)
+        self.clock.now += 1
+        self.mgr.set_state('playing')
+        self.assertEqual(self.timers.timers, timers)
+
+
+class TestDormant(unittest.TestCase):
+    def setUp(self):
+        self.clock = FakeClock()
+        self.changes = []
+        self.profile = ScreenBlankProfileBalanced()
+        self.profile.backend = Mock()
+        self.mgr = ScreenBlankMgr(profile=self.profile, clock=self.clock, on_dormant_change=self.changes.append)
+
+    def pause_until_blanked(self):
+        self.mgr.set_state('paused')
+        self.clock.now += ScreenBlankMgr.STOPPED_DELAY
+        self.mgr.set_state('paused')
+
+    def test_dormant_once_blanked(self):
+        self.mgr.set_state('paused')
+        self.clock.now += 9
+        self.mgr.set_state('paused')
+        self.assertEqual(self.changes, [])
+        self.clock.now += 1
+        self.mgr.set_state('paused')
+        self.assertEqual(self.changes, [True])
+        self.assertTrue(self.mgr.dormant)
+
+    def test_playing_wakes(self):
+        self.pause_until_blanked()
+        self.mgr.set_state('playing')
+        self.assertEqual(self.changes, [True, False])
+
+    def test_input_wakes_then_dormant_again(self):
+        self.pause_until_blanked()
+        self.mgr.wake()
+        self.assertEqual(self.changes, [True, False])
+        self.clock.now += ScreenBlankMgr.DORMANT_AFTER_INPUT - 1
+        self.mgr.wake()  # more input postpones dormancy
+        self.clock.now += ScreenBlankMgr.DORMANT_AFTER_INPUT - 1
+        self.mgr.set_state('paused')
+        self.assertEqual(self.changes, [True, False])
+        self.clock.now += 1
+        self.mgr.set_state('paused')
+        self.assertEqual(self.changes, [True, False, True])
+        # the profile isn't asked to blank the screen again
+        self.profile.backend.activate.assert_called_once()
+
+    def test_input_does_nothing_unless_blanked(self):
+        self.mgr.set_state('playing')
+        self.mgr.wake()
+        self.mgr.set_state('paused')
+        self.mgr.wake()
+        self.assertEqual(self.changes, [])
+
+    def test_profile_none_is_never_dormant(self):
+        mgr = ScreenBlankMgr(profile=ScreenBlankProfileNone(), clock=self.clock, on_dormant_change=self.changes.append)
+        mgr.set_state('paused')
+        self.clock.now += 60
+        mgr.set_state('paused')
+        self.assertEqual(self.changes, [])
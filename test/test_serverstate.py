@@ -0,0 +1,63 @@
+import asyncio
+import time
+import unittest
+from unittest.mock import patch
+
+from apiclient import ApiClient, CURRENT_STATUS_ERROR, CurrentStatus
+import serverstate
+from serverstate import follow_state_stream, get_state_async
+
+
+def mk_status(status):
+    return CurrentStatus(status=status, current_track={}, current_stream=None, current_artwork=None,
+                         volume=50, scanning=False, current_track_index=None, maximum_track_index=None)
+
+
+class FakeScheduler:
+    def __init__(self):
+        self.observed = []
+        self.waits = 0
+
+    def observe(self, status, connection_error):
+        self.observed.append((status.status, connection_error))
+
+    def wait(self):
+        self.waits += 1
+
+
+class TestFollowStateStream(unittest.TestCase):
+    def test_reconnects_are_scheduled(self):
+        apiclient = ApiClient('http://address/')
+        # (stream, connection_error) for each call of open_state_stream
+        streams = [(iter([mk_status('playing'), mk_status('paused')]), False),
+                   (iter([CURRENT_STATUS_ERROR]), True),
+                   (None, False)]
+
+        def open_state_stream():
+            stream, apiclient.connection_error = streams.pop(0)
+            return stream
+
+        handled = []
+        scheduler = FakeScheduler()
+        with patch.object(apiclient, 'open_state_stream', side_effect=open_state_stream):
+            follow_state_stream(apiclient, lambda status, connection_error: handled.append(status.status), scheduler)
+        self.assertEqual(handled, ['playing', 'paused', None])
+        self.assertEqual(scheduler.observed, [('playing', False), ('paused', False), (None, True)])
+        # waited before each reconnection
+        self.assertEqual(scheduler.waits, 2)
+
+
+class TestGetStateAsync(unittest.TestCase):
+    def test_timeout_is_a_connection_error(self):
+        apiclient = ApiClient('http://address/')
+        with patch.object(apiclient, 'get_current_state', side_effect=lambda: time.sleep(0.2)), \
+                patch.object(serverstate, 'STATE_TIMEOUT', 0.01):
+            result = asyncio.run(get_state_async(apiclient))
+        self.assertEqual(result, (CURRENT_STATUS_ERROR, True))
+
+    def test_state_and_connection_error(self):
+        apiclient = ApiClient('http://address/')
+        with patch.object(apiclient, 'get_current_state', return_value=mk_status('playing')):
+            status, connection_error = asyncio.run(get_state_async(apiclient))
+        self.assertEqual(status.status, 'playing')
+        self.assertFalse(connection_error)
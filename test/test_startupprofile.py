@@ -0,0 +1,55 @@
+import unittest
+from unittest.mock import patch
+
+from startupprofile import StartupProfile, process_age
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+class TestStartupProfile(unittest.TestCase):
+    def setUp(self):
+        self.clock = FakeClock()
+        self.profile = StartupProfile(('imports', 'window', 'track'), clock=self.clock, age=0.5)
+
+    def test_times_are_from_process_start(self):
+        self.profile.mark('imports')
+        self.clock.now += 0.25
+        self.profile.mark('window')
+        self.assertEqual(self.profile.times, {'imports': 0.5, 'window': 0.75})
+
+    def test_only_first_mark_counts(self):
+        self.profile.mark('imports')
+        self.clock.now += 1
+        self.profile.mark('imports')
+        self.assertEqual(self.profile.times, {'imports': 0.5})
+
+    @patch('startupprofile.logging.info')
+    def test_reports_once_all_steps_marked(self, mock_info):
+        self.profile.mark('imports')
+        self.clock.now += 1
+        self.profile.mark('track')
+        mock_info.assert_not_called()
+        self.clock.now += 0.1
+        self.profile.mark('window')
+        mock_info.assert_called_once_with("Startup: imports at 500ms, track at 1500ms, window at 1600ms")
+
+    @patch('startupprofile.process_age', return_value=None)
+    def test_no_process_start_time(self, _):
+        profile = StartupProfile(('imports',), clock=self.clock)
+        profile.mark('imports')
+        self.assertEqual(profile.times, {'imports': 0})
+
+
+class TestProcessAge(unittest.TestCase):
+    def test_process_age(self):
+        age = process_age()
+        if age is None:
+            self.skipTest("process start time not available")
+        self.assertGreaterEqual(age, 0)
+        self.assertLess(age, 24 * 60 * 60)
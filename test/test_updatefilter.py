@@ -0,0 +1,83 @@
+import unittest
+
+from nowplaying import NowPlaying, changed_fields, DISPLAYED_FIELDS
+from updatefilter import UpdateFilter
+
+
+class TestNowPlaying(unittest.TestCase):
+    def test_immutable(self):
+        now_playing = NowPlaying(track_name='One')
+        with self.assertRaises(AttributeError):
+            now_playing.track_name = 'Two'
+        with self.assertRaises(AttributeError):
+            now_playing.other = 'Two'
+
+    def test_replace_shares_artwork(self):
+        image = b'artwork'
+        now_playing = NowPlaying(track_number=1, image=image)._replace(track_number=2)
+        self.assertEqual(now_playing.track_number, 2)
+        self.assertIs(now_playing.image, image)
+
+    def test_str_omits_artwork(self):
+        self.assertNotIn('artwork', str(NowPlaying(track_name='One', image=b'artwork')))
+
+
+class TestChangedFields(unittest.TestCase):
+    def test_nothing_displayed(self):
+        self.assertEqual(changed_fields(None, NowPlaying()), set(DISPLAYED_FIELDS))
+
+    def test_no_change(self):
+        image = b'artwork'
+        self.assertEqual(changed_fields(NowPlaying(track_name='One', image=image),
+                                        NowPlaying(track_name='One', image=image)),
+                         set())
+
+    def test_undisplayed_fields_are_ignored(self):
+        self.assertEqual(changed_fields(NowPlaying(track_name='One', current_volume=50),
+                                        NowPlaying(track_name='One', current_volume=60)),
+                         set())
+
+    def test_changes(self):
+        self.assertEqual(changed_fields(NowPlaying(track_name='One', current_state='playing', image=b'1'),
+                                        NowPlaying(track_name='Two', current_state='playing', image=b'2')),
+                         {'track_name', 'image'})
+
+
+class TestUpdateFilter(unittest.TestCase):
+    def test_first_update_is_dispatched(self):
+        update_filter = UpdateFilter()
+        now_playing = NowPlaying(track_name='One')
+        snapshot = update_filter.filter(False, now_playing)
+        self.assertIs(snapshot, now_playing)
+        self.assertEqual(update_filter.dispatched, 1)
+
+    def test_unchanged_update_is_suppressed(self):
+        update_filter = UpdateFilter()
+        now_playing = NowPlaying(track_name='One')
+        update_filter.filter(False, now_playing)
+        self.assertIsNone(update_filter.filter(False, now_playing))
+        self.assertEqual(update_filter.suppressed, 1)
+
+    def test_equal_snapshot_is_suppressed(self):
+        update_filter = UpdateFilter()
+        image = b'artwork'
+        update_filter.filter(False, NowPlaying(track_name='One', image=image))
+        self.assertIsNone(update_filter.filter(False, NowPlaying(track_name='One', image=image)))
+        snapshot = NowPlaying(track_name='Two', image=image)
+        self.assertIs(update_filter.filter(False, snapshot), snapshot)
+
+    def test_connection_error_dispatched_once(self):
+        update_filter = UpdateFilter()
+        now_playing = NowPlaying(track_name='One')
+        update_filter.filter(False, now_playing)
+        self.assertIsNotNone(update_filter.filter(True, now_playing))
+        self.assertIsNone(update_filter.filter(True, now_playing))
+        self.assertIsNotNone(update_filter.filter(False, now_playing))
+        self.assertEqual((update_filter.dispatched, update_filter.suppressed), (3, 1))
+
+    def test_invalidate(self):
+        update_filter = UpdateFilter()
+        now_playing = NowPlaying(track_name='One')
+        update_filter.filter(False, now_playing)
+        update_filter.invalidate()
+        self.assertIsNotNone(update_filter.filter(False, now_playing))
@@ -0,0 +1,68 @@
+import threading
+import unittest
+
+from updatemailbox import UpdateMailbox
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+class TestUpdateMailbox(unittest.TestCase):
+    def setUp(self):
+        self.clock = FakeClock()
+        self.posted = []
+        self.delivered = []
+        self.mailbox = UpdateMailbox(self.posted.append, lambda *args: self.delivered.append(args), self.clock)
+
+    def run_posted(self):
+        return self.posted.pop(0)()
+
+    def test_delivers_each_update_when_main_loop_keeps_up(self):
+        for update in ('one', 'two'):
+            self.mailbox.put(False, update)
+            self.assertFalse(self.run_posted())
+        self.assertEqual(self.delivered, [(False, 'one'), (False, 'two')])
+        self.assertEqual((self.mailbox.delivered, self.mailbox.coalesced), (2, 0))
+
+    def test_latest_wins(self):
+        for update in ('one', 'two', 'three'):
+            self.mailbox.put(False, update)
+        self.assertEqual(len(self.posted), 1)
+        self.run_posted()
+        self.assertEqual(self.delivered, [(False, 'three')])
+        self.assertEqual((self.mailbox.delivered, self.mailbox.coalesced), (1, 2))
+        # and the next update is posted afresh
+        self.mailbox.put(True, 'four')
+        self.assertEqual(len(self.posted), 1)
+
+    def test_max_lag(self):
+        self.mailbox.put(False, 'one')
+        self.clock.now += 0.5
+        self.mailbox.put(False, 'two')
+        self.clock.now += 0.25
+        self.run_posted()
+        # from when the callback was posted, not from the latest update
+        self.assertEqual(self.mailbox.max_lag, 0.75)
+        self.mailbox.put(False, 'three')
+        self.clock.now += 0.1
+        self.run_posted()
+        self.assertEqual(self.mailbox.max_lag, 0.75)
+
+    def test_puts_from_many_threads(self):
+        def put_many(thread_index):
+            for index in range(1000):
+                self.mailbox.put(thread_index, index)
+        threads = [threading.Thread(target=put_many, args=(thread_index,)) for thread_index in range(4)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        while self.posted:
+            self.run_posted()
+        self.assertEqual(self.mailbox.delivered + self.mailbox.coalesced, 4000)
+        self.assertEqual(self.delivered[-1][1], 999)
@@ -0,0 +1,466 @@
+#! /usr/bin/env python3
+"""
+A local stand-in for the piju server, sufficient to exercise the touchscreen
+UI and ApiClient without a real server.
+
+Run it directly (python3 tools/fakepiju.py --port 5000) and point the UI at it
+with --host localhost:5000, or start it in-process with FakePijuServer.
+
+State changes are pushed to clients of /events (Server-Sent Events), unless the
+server is started with --no-events, in which case clients must poll.
+
+With --scenario, the server's state is changed by a script, to exercise the
+UI's handling of rapid changes, bad artwork, slow or failing responses and
+outages. A script is a JSON list of steps, each of which is one of:
+
+    {"sleep": SECONDS}
+    {"player": "next"}              (or "previous", "pause", "resume")
+    {"set": {ATTRIBUTE: VALUE}}     (see FakePijuState.SCRIPTABLE)
+    {"repeat": COUNT, "steps": [STEP, ...]}
+    {"log": MESSAGE}
+
+--scenario takes the name of a built-in script (see SCENARIOS) or the path of
+a JSON file.
+"""
+import argparse
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import json
+import os.path
+import threading
+import time
+from urllib.parse import parse_qs, urlparse
+
+EVENT_KEEPALIVE_INTERVAL = 10
+
+# Larger than ApiClient will download
+HUGE_ARTWORK_BYTES = 16 * 1024 * 1024
+
+
+class FakePijuState:
+    SCRIPTABLE = {
+        'player_status',  # 'playing', 'paused' or 'stopped'
+        'track_index',
+        'maximum_track_index',
+        'stream_name',  # if set, a radio stream is playing rather than a track
+        'worker_status',  # 'Idle', or eg 'Scanning'
+        'artwork_mode',  # 'normal', 'huge', 'corrupt' or 'missing'
+        'latency',  # seconds added to every response
+        'fail_requests',  # number of requests to answer with fail_status
+        'fail_status',
+        'outage',  # if true, every connection is dropped without a response
+    }
+
+    def __init__(self, artwork_size=1024, events=True, artwork_delay=0, artwork_dimensions=(300, 300),
+                 sized_artwork=True, latency=0, payload_size=0):
+        self.lock = threading.Lock()
+        self.changed = threading.Condition(self.lock)
+        self.version = 0
+        self.events = events
+        self.player_status = 'playing'
+        self.track_index = 1
+        self.maximum_track_index = 10
+        self.artwork = bytes(artwork_size)
+        self.artwork_delay = artwork_delay
+        self.artwork_dimensions = artwork_dimensions
+        self.sized_artwork = sized_artwork
+        self.latency = latency  # seconds added to every response
+        self.padding = 'x' * payload_size  # added to each track, to make the status a realistic size
+        self.stream_name = None
+        self.worker_status = 'Idle'
+        self.artwork_mode = 'normal'
+        self.fail_requests = 0
+        self.fail_status = 503
+        self.outage = False
+        self.base_uri = ''  # set by FakePijuServer, for the stream artwork
+
+    def current_status(self):
+        with self.lock:
+            return self._current_status()
+
+    def track(self, index):
+        track = {
+            'link': f'/tracks/{index}',
+            'artist': 'Fake Artist',
+            'title': f'Track {index}',
+            'album': '/albums/1',
+            'artwork': f'/artworkinfo/{index}',
+        }
+        if self.padding:
+            track['comment'] = self.padding
+        return track
+
+    def album(self):
+        return {
+            'link': '/albums/1',
+            'tracks': [self.track(index) for index in range(1, self.maximum_track_index + 1)],
+        }
+
+    def _current_status(self):
+        if self.stream_name:
+            return {
+                'PlayerStatus': self.player_status,
+                'CurrentStream': self.stream_name,
+                'CurrentArtwork': self.base_uri + '/artwork/stream',
+                'WorkerStatus': self.worker_status,
+            }
+        return {
+            'PlayerStatus': self.player_status,
+            'CurrentTrack': self.track(self.track_index),
+            'CurrentTracklistUri': '/albums/1',
+            'CurrentTrackIndex': self.track_index,
+            'MaximumTrackIndex': self.maximum_track_index,
+            'CurrentArtwork': f'/artworkinfo/{self.track_index}',
+            'WorkerStatus': self.worker_status,
+        }
+
+    def update(self, **changes):
+        """
+        Change any of the SCRIPTABLE attributes, notifying clients of /events
+        """
+        with self.lock:
+            for name, value in changes.items():
+                if name not in self.SCRIPTABLE:
+                    raise ValueError(f"Cannot set {name}")
+                setattr(self, name, value)
+            self.version += 1
+            self.changed.notify_all()
+
+    def take_failure(self):
+        """
+        Returns the status with which to fail the current request, or None
+        """
+        with self.lock:
+            if self.fail_requests <= 0:
+                return None
+            self.fail_requests -= 1
+            return self.fail_status
+
+    def wait_for_change(self, last_version, timeout):
+        """
+        Returns (version, status) once the state differs from last_version,
+        or (last_version, None) on timeout
+        """
+        with self.changed:
+            if not self.changed.wait_for(lambda: self.version != last_version, timeout):
+                return last_version, None
+            return self.version, self._current_status()
+
+    def player_operation(self, operation):
+        with self.lock:
+            if operation == 'pause':
+                self.player_status = 'paused'
+            elif operation == 'resume':
+                self.player_status = 'playing'
+            elif operation == 'next':
+                self.track_index = min(self.track_index + 1, self.maximum_track_index)
+            elif operation == 'previous':
+                self.track_index = max(self.track_index - 1, 1)
+            else:
+                return False
+            self.version += 1
+            self.changed.notify_all()
+        return True
+
+
+class FakePijuHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'  # keep-alive
+    disable_nagle_algorithm = True
+
+    @property
+    def state(self) -> FakePijuState:
+        return self.server.state
+
+    def log_message(self, format, *args):  # pylint: disable=redefined-builtin
+        "Silence the default per-request logging to stderr"
+
+    def send_body(self, body: bytes, content_type: str, status: int = 200):
+        self.send_response(status)
+        self.send_header('Content-Type', content_type)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def send_json(self, obj, status: int = 200):
+        self.send_body(json.dumps(obj).encode('utf-8'), 'application/json', status)
+
+    def reject(self):
+        """
+        Applies the scripted latency and failures, returning True if the
+        request has been dealt with
+        """
+        time.sleep(self.state.latency)
+        if self.state.outage:
+            self.close_connection = True
+            return True
+        if status := self.state.take_failure():
+            self.send_json({'error': 'scripted failure'}, status)
+            return True
+        return False
+
+    def do_GET(self):  # pylint: disable=invalid-name
+        if self.reject():
+            return
+        path = self.path.split('?', 1)[0]
+        if path == '/':
+            self.send_json(self.state.current_status())
+        elif path == '/events' and self.state.events:
+            self.send_events()
+        elif path.startswith('/artworkinfo/'):
+            track = path.rsplit('/', 1)[1]
+            width, height = self.state.artwork_dimensions
+            self.send_json({'width': width, 'height': height, 'image': f'/artwork/{track}'})
+        elif path.startswith('/artwork/'):
+            time.sleep(self.state.artwork_delay)
+            self.send_artwork()
+        elif path == '/albums/1':
+            self.send_json(self.state.album())
+        elif path.startswith('/tracks/') and path[8:].isdigit():
+            self.send_json(self.state.track(int(path[8:])))
+        else:
+            self.send_json({'error': 'not found'}, 404)
+
+    def send_artwork(self):
+        mode = self.state.artwork_mode
+        if mode == 'missing':
+            self.send_json({'error': 'not found'}, 404)
+        elif mode == 'huge':
+            self.send_body(bytes(HUGE_ARTWORK_BYTES), 'image/jpeg')
+        elif mode == 'corrupt':
+            self.send_body(b'\xff\xd8\xff\xe0' + bytes(range(256)) * 16, 'image/jpeg')
+        else:
+            self.send_body(self.sized_artwork(), 'image/jpeg')
+
+    def sized_artwork(self):
+        query = parse_qs(urlparse(self.path).query)
+        if not self.state.sized_artwork or 'width' not in query or 'height' not in query:
+            return self.state.artwork
+        # scale the number of bytes, as a stand-in for scaling the image
+        width, height = self.state.artwork_dimensions
+        scale = int(query['width'][0]) * int(query['height'][0]) / (width * height)
+        return self.state.artwork[:max(1, int(len(self.state.artwork) * scale))]
+
+    def send_events(self):
+        self.send_response(200)
+        self.send_header('Content-Type', 'text/event-stream')
+        self.send_header('Cache-Control', 'no-cache')
+        self.send_header('Connection', 'close')
+        self.end_headers()
+        self.close_connection = True
+        version, status = -1, None
+        try:
+            while True:
+                version, status = self.state.wait_for_change(version, EVENT_KEEPALIVE_INTERVAL)
+                if self.state.outage:
+                    break
+                if status is None:
+                    self.wfile.write(b': keep-alive\n\n')
+                else:
+                    self.wfile.write(b'data: ' + json.dumps(status).encode('utf-8') + b'\n\n')
+                self.wfile.flush()
+        except (BrokenPipeError, ConnectionResetError):
+            pass
+
+    def do_POST(self):  # pylint: disable=invalid-name
+        if self.reject():
+            return
+        if self.path.startswith('/player/') and self.state.player_operation(self.path.rsplit('/', 1)[1]):
+            self.send_body(b'', 'text/plain', 204)
+        else:
+            self.send_json({'error': 'not found'}, 404)
+
+
+class FakePijuServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, port=0, state: FakePijuState = None):
+        super().__init__(('127.0.0.1', port), FakePijuHandler)
+        self.state = state if state else FakePijuState()
+        self.state.base_uri = self.base_uri
+        self.thread = None
+
+    @property
+    def base_uri(self):
+        return f'http://127.0.0.1:{self.server_address[1]}'
+
+    def start(self):
+        self.thread = threading.Thread(target=self.serve_forever, daemon=True)
+        self.thread.start()
+        return self
+
+    def stop(self):
+        self.shutdown()
+        self.server_close()
+
+    def handle_error(self, request, client_address):
+        # eg the client closing the connection instead of downloading huge artwork
+        pass
+
+
+class ScenarioRunner:
+    """
+    Runs a script (see the module docstring) against the server's state, on a thread of its own
+    """
+    def __init__(self, state: FakePijuState, steps, loop=False, log=print):
+        self.state = state
+        self.steps = steps
+        self.loop = loop
+        self.log = log
+        self.stopped = threading.Event()
+        self.thread = None
+
+    def start(self):
+        self.thread = threading.Thread(target=self.run, daemon=True)
+        self.thread.start()
+        return self
+
+    def stop(self):
+        self.stopped.set()
+
+    def run(self):
+        while not self.stopped.is_set():
+            self.run_steps(self.steps)
+            if not self.loop:
+                break
+
+    def run_steps(self, steps):
+        for step in steps:
+            if self.stopped.is_set():
+                return
+            if 'sleep' in step:
+                self.stopped.wait(step['sleep'])
+            elif 'player' in step:
+                self.state.player_operation(step['player'])
+            elif 'set' in step:
+                self.state.update(**step['set'])
+            elif 'repeat' in step:
+                for _ in range(step['repeat']):
+                    self.run_steps(step['steps'])
+            elif 'log' in step:
+                self.log(step['log'])
+            else:
+                raise ValueError(f"Unknown scenario step: {step}")
+
+
+SCENARIOS = {
+    'rapid-skip': [
+        {'log': "Skipping through the album every 200ms"},
+        {'set': {'track_index': 1, 'player_status': 'playing'}},
+        {'repeat': 9, 'steps': [{'sleep': 0.2}, {'player': 'next'}]},
+        {'repeat': 9, 'steps': [{'sleep': 0.2}, {'player': 'previous'}]},
+    ],
+    'stream': [
+        {'log': "Switching between a radio stream and a track every 5s"},
+        {'set': {'stream_name': 'Fake Radio'}},
+        {'sleep': 5},
+        {'set': {'stream_name': None}},
+        {'sleep': 5},
+    ],
+    'bad-artwork': [
+        {'log': "Huge, corrupt and missing artwork"},
+        {'set': {'artwork_mode': 'huge'}},
+        {'player': 'next'},
+        {'sleep': 3},
+        {'set': {'artwork_mode': 'corrupt'}},
+        {'player': 'next'},
+        {'sleep': 3},
+        {'set': {'artwork_mode': 'missing'}},
+        {'player': 'next'},
+        {'sleep': 3},
+        {'set': {'artwork_mode': 'normal'}},
+        {'player': 'next'},
+        {'sleep': 3},
+    ],
+    'slow': [
+        {'log': "Responses slower than the client's timeout, then just slow"},
+        {'set': {'latency': 2}},
+        {'sleep': 10},
+        {'set': {'latency': 0.5}},
+        {'sleep': 10},
+        {'set': {'latency': 0}},
+        {'sleep': 5},
+    ],
+    'errors': [
+        {'log': "Bursts of 5xx responses"},
+        {'repeat': 5, 'steps': [{'set': {'fail_requests': 5, 'fail_status': 503}}, {'sleep': 5}]},
+        {'set': {'fail_requests': 3, 'fail_status': 500}},
+        {'sleep': 5},
+    ],
+    'scanning-flap': [
+        {'log': "Scanning starting and stopping every 500ms"},
+        {'repeat': 20, 'steps': [{'set': {'worker_status': 'Scanning'}}, {'sleep': 0.5},
+                                 {'set': {'worker_status': 'Idle'}}, {'sleep': 0.5}]},
+    ],
+    'outage': [
+        {'log': "Server unreachable for 30s"},
+        {'set': {'outage': True}},
+        {'sleep': 30},
+        {'set': {'outage': False}},
+        {'log': "Server back"},
+        {'sleep': 10},
+    ],
+    'pause-resume': [
+        {'log': "Pausing for 30s (for screen blanking), then playing for 30s"},
+        {'player': 'pause'},
+        {'sleep': 30},
+        {'player': 'resume'},
+        {'sleep': 30},
+    ],
+}
+SCENARIOS['soak'] = [step for name in ('rapid-skip', 'stream', 'bad-artwork', 'slow', 'errors', 'scanning-flap',
+                                       'outage', 'pause-resume')
+                     for step in SCENARIOS[name]]
+
+
+def load_scenario(name_or_path):
+    if name_or_path in SCENARIOS:
+        return SCENARIOS[name_or_path]
+    if os.path.exists(name_or_path):
+        with open(name_or_path, encoding='utf-8') as handle:
+            return json.load(handle)
+    raise ValueError(f"{name_or_path} is neither a built-in scenario ({', '.join(SCENARIOS)}) nor a file")
+
+
+def parse_args():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--port', action='store', type=int, default=5000,
+                        help="Port to listen on (default %(default)s)")
+    parser.add_argument('--no-events', action='store_false', dest='events',
+                        help="Do not support pushed updates, so that clients have to poll")
+    parser.add_argument('--artwork-size', action='store', type=int, default=1024,
+                        help="Size in bytes of the artwork served (default %(default)s)")
+    parser.add_argument('--artwork-dimensions', action='store', type=int, nargs=2, default=(300, 300),
+                        metavar=('WIDTH', 'HEIGHT'),
+                        help="Dimensions of the artwork reported by /artworkinfo (default %(default)s)")
+    parser.add_argument('--no-sized-artwork', action='store_false', dest='sized_artwork',
+                        help="Ignore requests for artwork at a particular size")
+    parser.add_argument('--artwork-delay', action='store', type=float, default=0,
+                        help="Seconds to wait before serving artwork (default %(default)s)")
+    parser.add_argument('--latency', action='store', type=float, default=0,
+                        help="Seconds to wait before every response (default %(default)s)")
+    parser.add_argument('--payload-size', action='store', type=int, default=0,
+                        help="Bytes of padding to add to each track in responses (default %(default)s)")
+    parser.add_argument('--scenario', action='store', metavar='NAME|FILE',
+                        help=f"Change the state according to a script: one of {', '.join(SCENARIOS)}, "
+                             "or a JSON file")
+    parser.add_argument('--loop', action='store_true',
+                        help="Repeat the scenario until interrupted")
+    return parser.parse_args()
+
+
+def main():
+    args = parse_args()
+    state = FakePijuState(artwork_size=args.artwork_size, events=args.events, artwork_delay=args.artwork_delay,
+                          artwork_dimensions=tuple(args.artwork_dimensions), sized_artwork=args.sized_artwork,
+                          latency=args.latency, payload_size=args.payload_size)
+    server = FakePijuServer(args.port, state)
+    print(f"Fake piju listening on {server.base_uri}")
+    if args.scenario:
+        ScenarioRunner(server.state, load_scenario(args.scenario), loop=args.loop).start()
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == '__main__':
+    main()
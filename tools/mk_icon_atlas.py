@@ -0,0 +1,66 @@
+#! /usr/bin/env python3
+"""
+Pack the icons in icons/ into a single image, icons/atlas.png, with an index,
+icons/atlas.json, so that the UI only has to read and decode one file for all
+of its icons. Run it again after changing any icon: until it is, the UI
+loads the icons individually. With --if-needed, as run.sh uses it, the atlas
+is only made if it is missing or out of date.
+
+Requires PyGObject with GdkPixbuf.
+"""
+import argparse
+import glob
+import os.path
+import sys
+
+import gi
+gi.require_version('GdkPixbuf', '2.0')
+# pylint: disable=wrong-import-position
+from gi.repository import GdkPixbuf  # noqa: E402 # need to call require_version before we can call this
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), os.path.pardir, 'src'))
+from iconatlas import ATLAS_IMAGE, ICON_DIR, pack, read_index, write_index  # noqa: E402
+# pylint: enable=wrong-import-position
+
+
+def parse_args():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--icon-dir', default=ICON_DIR,
+                        help="Directory containing the icons, to write the atlas to (default %(default)s)")
+    parser.add_argument('--if-needed', action='store_true',
+                        help="Only make the atlas if there isn't one, or it is older than any of the icons")
+    return parser.parse_args()
+
+
+def make_atlas(icon_dir: str):
+    pixbufs = {}
+    for path in sorted(glob.glob(os.path.join(icon_dir, '*.png'))):
+        leafname = os.path.basename(path)
+        if leafname == ATLAS_IMAGE:
+            continue
+        pixbuf = GdkPixbuf.Pixbuf.new_from_file(path)
+        if not pixbuf.get_has_alpha():
+            pixbuf = pixbuf.add_alpha(False, 0, 0, 0)
+        pixbufs[leafname] = pixbuf
+    (width, height), positions = pack({leafname: (pixbuf.get_width(), pixbuf.get_height())
+                                       for leafname, pixbuf in pixbufs.items()})
+    atlas = GdkPixbuf.Pixbuf.new(GdkPixbuf.Colorspace.RGB, True, 8, width, height)
+    atlas.fill(0)
+    for leafname, (x, y, icon_width, icon_height) in positions.items():
+        pixbufs[leafname].copy_area(0, 0, icon_width, icon_height, atlas, x, y)
+    # the image first, so that the index is never older than it
+    atlas.savev(os.path.join(icon_dir, ATLAS_IMAGE), 'png', [], [])
+    write_index(positions, icon_dir)
+    return (width, height), positions
+
+
+def main():
+    args = parse_args()
+    if args.if_needed and read_index(args.icon_dir) is not None:
+        return
+    (width, height), positions = make_atlas(args.icon_dir)
+    print(f"Packed {len(positions)} icons into {width}x{height}")
+
+
+if __name__ == '__main__':
+    main()